@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Compare two sets of benchmark results produced by run_benchmarks.py (e.g. before and after a change).
+
+For every benchmark present in both files, print the throughput (DOF/s) of each run and the speedup of the second run
+relative to the first. Benchmarks that got slower by more than the given threshold are flagged, and the script then
+exits with a non-zero status, so that it can be used in automated regression checks.
+"""
+
+import argparse
+import json
+import sys
+
+def load_results(file_name: str):
+   with open(file_name) as f:
+      content = json.load(f)
+   return content['metadata'], {r['name']: r for r in content['results']}
+
+def main(args):
+   base_meta, base = load_results(args.baseline)
+   new_meta, new   = load_results(args.new)
+
+   print(f'Baseline: {args.baseline} (commit {base_meta["commit"][:10]}, {base_meta["num_pe"]} PEs, {base_meta["date"]})')
+   print(f'New:      {args.new} (commit {new_meta["commit"][:10]}, {new_meta["num_pe"]} PEs, {new_meta["date"]})')
+   if base_meta['num_pe'] != new_meta['num_pe']:
+      print(f'WARNING: The two sets of results were obtained with a different number of PEs')
+   print()
+
+   print(f'{"Benchmark":<45s} {"Baseline DOF/s":>15s} {"New DOF/s":>15s} {"Speedup":>8s}')
+   regressions = []
+   for name, base_result in base.items():
+      if name not in new: continue
+      new_result = new[name]
+      speedup = new_result['dof_per_second'] / base_result['dof_per_second']
+      flag = ''
+      if speedup < 1.0 - args.threshold:
+         flag = '  <-- slower'
+         regressions.append(name)
+      elif speedup > 1.0 + args.threshold:
+         flag = '  faster'
+      print(f'{name:<45s} {base_result["dof_per_second"]:15.4e} {new_result["dof_per_second"]:15.4e} '
+            f'{speedup:8.3f}{flag}')
+
+   missing = [name for name in base if name not in new] + [name for name in new if name not in base]
+   if len(missing) > 0:
+      print(f'\nBenchmarks only present in one of the files: {", ".join(missing)}')
+
+   if len(regressions) > 0:
+      print(f'\n{len(regressions)} benchmark(s) slower by more than {args.threshold * 100:.0f}%')
+      sys.exit(1)
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Compare two sets of GEF benchmark results')
+   parser.add_argument('baseline', type=str, help='Reference results (JSON file from run_benchmarks.py)')
+   parser.add_argument('new', type=str, help='Results to compare with the reference')
+   parser.add_argument('--threshold', type=float, default=0.05,
+                       help='Relative slowdown (or speedup) above which a difference is reported')
+
+   main(parser.parse_args())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Time the main computational kernels of GEF on a set of problems of various sizes, and store the results in a JSON file.
+
+Each benchmark sets up a problem from one of the configurations in the config/ directory (with a modified
+discretization), then repeatedly times one kernel on the initial state: RHS evaluation, Jacobian-vector product
+(complex-step and finite-difference), one FGMRES solve, one KIOPS or PMEX evaluation of phi-functions, or one
+application of the multigrid preconditioner. Results are reported in degrees of freedom (global size of the state
+vector) processed per second.
+
+Cubed-sphere problems need a valid number of PEs (6, 24, ...) and 2D problems are only run with a single PE:
+   python3 benchmarks/run_benchmarks.py --suite small            # 2D (bubble) problems
+   mpirun -n 6 python3 benchmarks/run_benchmarks.py --suite small  # Shallow water and 3D Euler problems
+
+Results from two runs (e.g. two commits) can be compared with benchmarks/compare_benchmarks.py
+"""
+
+import argparse
+from configparser import ConfigParser
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+from mpi4py import MPI
+import numpy
+
+# We assume the script is in a subfolder of the main project
+main_gef_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.append(main_gef_dir)
+
+from common.program_options import Configuration
+from init.init_state_vars   import init_state_vars
+from rhs.rhs_selector       import RhsBundle
+from run                    import adjust_nb_elements, create_geometry, create_operators, create_preconditioner, \
+                                   setup_distributed_world
+from solvers                import fgmres, kiops, matvec_fun, MatvecOp, pmex
+
+all_kernels = ['rhs', 'matvec_complex', 'matvec_fd', 'fgmres', 'kiops', 'pmex', 'multigrid']
+
+# Problem definitions. Each entry is (base config, number of dimensions, [(nbsolpts, elements horizontal, vertical)])
+suites = {
+   'small': {
+      'bubble':        ('gaussian_bubble.ini', 2, [(3, 10, 10), (5, 10, 10)]),
+      'shallow_water': ('case6.ini',           2, [(3, 6, 1),   (5, 6, 1)]),
+      'euler':         ('dcmip31.ini',         3, [(3, 6, 4)]),
+   },
+   'large': {
+      'bubble':        ('gaussian_bubble.ini', 2, [(4, 40, 40), (6, 40, 40), (8, 20, 20)]),
+      'shallow_water': ('case6.ini',           2, [(4, 24, 1),  (6, 24, 1),  (8, 12, 1)]),
+      'euler':         ('dcmip31.ini',         3, [(3, 24, 8),  (5, 24, 8)]),
+   },
+}
+
+# Number of FGMRES iterations timed by the fgmres kernel
+fgmres_restart = 20
+
+# Kernels that can only be run for some problems
+kernel_problems = {
+   'multigrid': ['bubble', 'euler'],
+}
+
+def make_config(base_config: str, nbsolpts: int, nb_elem_h: int, nb_elem_v: int, kernel: str, work_dir: str) \
+      -> Configuration:
+   """Create a configuration from one of the standard config files, with the given discretization."""
+   parser = ConfigParser()
+   parser.read(os.path.join(main_gef_dir, 'config', base_config), encoding='utf-8')
+
+   parser['Spatial_discretization']['nbsolpts']               = str(nbsolpts)
+   parser['Spatial_discretization']['nb_elements_horizontal'] = str(nb_elem_h)
+   parser['Spatial_discretization']['nb_elements_vertical']   = str(nb_elem_v)
+   parser['Output_options']['output_dir']                     = work_dir
+
+   if kernel == 'multigrid':
+      parser['Time_integration']['time_integrator'] = 'ros2'
+      parser['Preconditioning']['preconditioner']   = 'p-mg'
+   else:
+      parser['Preconditioning']['preconditioner']   = 'none'
+
+   file_name = os.path.join(work_dir, f'bench_{MPI.COMM_WORLD.rank}.ini')
+   with open(file_name, 'w') as f:
+      parser.write(f)
+
+   return Configuration(file_name, verbose=False)
+
+def time_kernel(kernel: Callable[[], Any], num_repeats: int) -> Dict:
+   """Time several executions of the given kernel (after one warmup run). The time of an execution is the time taken
+   by the slowest PE. If the kernel returns a number (of iterations), it is recorded along with the time."""
+   comm = MPI.COMM_WORLD
+
+   kernel()
+
+   times = []
+   iterations = None
+   for _ in range(num_repeats):
+      comm.Barrier()
+      t0 = perf_counter()
+      result = kernel()
+      t1 = perf_counter()
+      if isinstance(result, int): iterations = result
+      times.append(comm.allreduce(t1 - t0, op=MPI.MAX))
+
+   return {'times': times, 'iterations': iterations}
+
+def make_kernel(kernel_name: str, param: Configuration, Q: numpy.ndarray, rhs: RhsBundle, preconditioner) \
+      -> Callable[[], Any]:
+   """Return a function that executes the given kernel once on state Q."""
+   dt      = param.dt
+   rhs_vec = rhs.full(Q)
+   rng     = numpy.random.default_rng(MPI.COMM_WORLD.rank)
+   vec     = rng.standard_normal(Q.size)
+
+   if kernel_name == 'rhs':
+      return lambda: rhs.full(Q)
+   if kernel_name == 'matvec_complex':
+      return lambda: matvec_fun(vec, dt, Q, rhs_vec, rhs.full, 'complex')
+   if kernel_name == 'matvec_fd':
+      return lambda: matvec_fun(vec, dt, Q, rhs_vec, rhs.full, 'fd')
+
+   if kernel_name == 'fgmres':
+      # Backward Euler system (I - dt*J) x = b, with a fixed number of iterations (one restart cycle)
+      A = MatvecOp(lambda v: v - matvec_fun(v, dt, Q, rhs_vec, rhs.full, param.jacobian_method), Q.dtype, Q.shape)
+      def run_fgmres():
+         _, _, _, num_iter, _, _ = fgmres(A, vec, tol=1e-20, restart=fgmres_restart, maxiter=1)
+         return num_iter
+      return run_fgmres
+
+   if kernel_name in ['kiops', 'pmex']:
+      # phi_1(dt*J) * rhs, as in the EPI2 method
+      matvec_handle = lambda v: matvec_fun(v, dt, Q, rhs_vec, rhs.full, param.jacobian_method)
+      u = numpy.zeros((2, Q.size))
+      u[1, :] = rhs_vec.flatten()
+      if kernel_name == 'kiops':
+         def run_kiops():
+            _, stats = kiops([1], matvec_handle, u, tol=param.tolerance, m_init=16, mmin=16, mmax=64, task1=False)
+            return int(stats[2])
+         return run_kiops
+      def run_pmex():
+         _, stats = pmex([1.], matvec_handle, u, tol=param.tolerance, mmax=64, task1=False)
+         return int(stats[2])
+      return run_pmex
+
+   if kernel_name == 'multigrid':
+      preconditioner.prepare(dt, Q)
+      return lambda: preconditioner.apply(vec)
+
+   raise ValueError(f'Unknown kernel {kernel_name}')
+
+def run_benchmark(problem: str, base_config: str, nbsolpts: int, nb_elem_h: int, nb_elem_v: int, kernel_name: str,
+                  num_repeats: int, work_dir: str) -> Dict:
+   param = make_config(base_config, nbsolpts, nb_elem_h, nb_elem_v, kernel_name, work_dir)
+   ptopo = setup_distributed_world(param)
+   adjust_nb_elements(param)
+   geom  = create_geometry(param, ptopo)
+   mtrx  = create_operators(geom, param)
+   Q, topo, metric = init_state_vars(geom, mtrx, param)
+   preconditioner  = create_preconditioner(param, ptopo, Q)
+   rhs   = RhsBundle(geom, mtrx, metric, topo, ptopo, param, Q.shape)
+
+   kernel = make_kernel(kernel_name, param, Q, rhs, preconditioner)
+   timing = time_kernel(kernel, num_repeats)
+
+   num_dof  = MPI.COMM_WORLD.allreduce(Q.size)
+   min_time = min(timing['times'])
+   return {
+      'name':           f'{problem}/{kernel_name}/p{nbsolpts}/e{nb_elem_h}x{nb_elem_v}',
+      'problem':        problem,
+      'kernel':         kernel_name,
+      'nbsolpts':       nbsolpts,
+      'elements':       [nb_elem_h, nb_elem_v],
+      'num_dof':        num_dof,
+      'times':          timing['times'],
+      'time_min':       min_time,
+      'time_median':    float(numpy.median(timing['times'])),
+      'dof_per_second': num_dof / min_time,
+      'iterations':     timing['iterations'],
+   }
+
+def get_metadata(args) -> Dict:
+   try:
+      commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=main_gef_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      commit = 'unknown'
+
+   return {
+      'date':        datetime.datetime.now().isoformat(timespec='seconds'),
+      'commit':      commit,
+      'num_pe':      MPI.COMM_WORLD.size,
+      'host':        platform.node(),
+      'python':      platform.python_version(),
+      'numpy':       numpy.__version__,
+      'suite':       args.suite,
+      'num_repeats': args.repeats,
+   }
+
+def main(args):
+   comm = MPI.COMM_WORLD
+   kernels = args.kernels if args.kernels else all_kernels
+
+   results: List[Dict] = []
+   with tempfile.TemporaryDirectory() as tmp_dir:
+      work_dir = comm.bcast(tmp_dir, root=0)
+      for problem, (base_config, _, sizes) in suites[args.suite].items():
+         if args.problems and problem not in args.problems: continue
+
+         is_cubed_sphere = problem != 'bubble'
+         if is_cubed_sphere == (comm.size == 1):
+            if comm.rank == 0:
+               print(f'Skipping "{problem}" problems with {comm.size} PE(s)')
+            continue
+
+         for nbsolpts, nb_elem_h, nb_elem_v in sizes:
+            for kernel_name in kernels:
+               if kernel_name in kernel_problems and problem not in kernel_problems[kernel_name]: continue
+
+               result = run_benchmark(problem, base_config, nbsolpts, nb_elem_h, nb_elem_v, kernel_name,
+                                      args.repeats, work_dir)
+               results.append(result)
+               if comm.rank == 0:
+                  print(f'{result["name"]:<45s} {result["num_dof"]:10d} DOF  {result["time_min"]:9.4f} s  '
+                        f'{result["dof_per_second"]:10.3e} DOF/s')
+                  sys.stdout.flush()
+
+   if comm.rank == 0:
+      with open(args.output, 'w') as f:
+         json.dump({'metadata': get_metadata(args), 'results': results}, f, indent=2)
+      print(f'Results written to {args.output}')
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Benchmark the main GEF kernels')
+   parser.add_argument('--suite', choices=list(suites.keys()), default='small', help='Set of problem sizes to run')
+   parser.add_argument('--problems', nargs='+', choices=list(suites['small'].keys()), help='Only run these problems')
+   parser.add_argument('--kernels', nargs='+', choices=all_kernels, help='Only run these kernels')
+   parser.add_argument('--repeats', type=int, default=5, help='Number of timed executions of each kernel')
+   parser.add_argument('--output', type=str, default='benchmark_results.json', help='Where to store the results')
+
+   main(parser.parse_args())
@@ -1,3 +1,5 @@
+import math
+
 import numpy
 
 from common.definitions import idx_u1, idx_u2
@@ -7,66 +9,39 @@ from main_gef           import get_array_module
 
 basis_point_sets = {}
 
-def eval_single_field_2d(field, elem_interp, xp, result=None):
-
-   new_num_points = elem_interp.shape[0]
-   old_num_points = elem_interp.shape[1]
-
-   nx = field.shape[0] // old_num_points
-   nz = field.shape[1] // old_num_points
-
-   # Interpolate (vertically) on entire rows of elements at once
-   interp_1 = xp.empty_like(field, shape=(nx * new_num_points, nz * old_num_points))
-   for i in range(nx):
-      interp_1[i * new_num_points:(i + 1) * new_num_points, :] = \
-         elem_interp @ field[i * old_num_points:(i + 1) * old_num_points, :]
-
-   # Interpolate (horizontally) on columns of interpolated elements
-   if result is None:
-      result = xp.empty_like(field, shape=(nx * new_num_points, nz * new_num_points))
-
-   for i in range(nz):
-      result[:, i * new_num_points:(i + 1) * new_num_points] = \
-         interp_1[:, i * old_num_points:(i + 1) * old_num_points] @ elem_interp.T
-
-   return result
+def interpolate_axis(fields, interp_ops, axis: int, xp, result=None):
+   """Interpolate a set of fields along one of their axes, element by element.
 
+   fields has shape (num_fields, ...), and interp_ops has shape (num_fields, new_num_points, old_num_points), one
+   element interpolation operator for each field. The elements of every field along the given axis (which must not be
+   the first one) are all interpolated at once with a single (batched) matrix product on a reshaped view of the fields.
+   When given, result must be C-contiguous.
+   """
+   num_fields = fields.shape[0]
+   new_num_points = interp_ops.shape[-2]
+   old_num_points = interp_ops.shape[-1]
 
-def eval_single_field_3d(field, elem_interp, xp, result=None):
-   new_num_points = elem_interp.shape[0]
-   old_num_points = elem_interp.shape[1]
-   num_elem_vert = int(field.shape[0] // old_num_points)
-   num_elem_horiz = int(field.shape[1] // old_num_points)
+   axis = axis % fields.ndim
+   num_elem  = fields.shape[axis] // old_num_points
+   num_outer = math.prod(fields.shape[1:axis])
+   num_inner = math.prod(fields.shape[axis + 1:])
 
-   interp_1 = xp.empty_like(field, shape=(num_elem_vert * old_num_points, num_elem_horiz * new_num_points, num_elem_horiz * old_num_points))
-   interp_2 = xp.empty_like(field, shape=(num_elem_vert * old_num_points, num_elem_horiz * new_num_points, num_elem_horiz * new_num_points))
    if result is None:
-      result = xp.empty_like(field, shape=(num_elem_vert * new_num_points, num_elem_horiz * new_num_points, num_elem_horiz * new_num_points))
-
-   # Interpolate along second dimension (should be the fastest) (horizontal)
-   for j in range(num_elem_horiz):
-      j_start_dst =  j    * new_num_points
-      j_end_dst   = (j+1) * new_num_points
-      j_start_src =  j    * old_num_points
-      j_end_src   = (j+1) * old_num_points
-      interp_1[:, j_start_dst:j_end_dst, :] = elem_interp @ field[:, j_start_src:j_end_src, :]
-
-   # Interpolate along 3rd dimension (horizontal)
-   for k in range(num_elem_horiz):
-      k_start_dst =  k    * new_num_points
-      k_end_dst   = (k+1) * new_num_points
-      k_start_src =  k    * old_num_points
-      k_end_src   = (k+1) * old_num_points
-      interp_2[:, :, k_start_dst:k_end_dst] = interp_1[:, :, k_start_src:k_end_src] @ elem_interp.T
-
-   # Interpolate along 1st dimension (possibly slowest? cause we need to go by hand along one of the other dimensions) (vertical)
-   for i in range(num_elem_vert):
-      for j in range(num_elem_horiz * new_num_points):
-         i_start_src =  i    * old_num_points
-         i_end_src   = (i+1) * old_num_points
-         i_start_dst =  i    * new_num_points
-         i_end_dst   = (i+1) * new_num_points
-         result[i_start_dst:i_end_dst, j, :] = elem_interp @ interp_2[i_start_src:i_end_src, j, :]
+      new_shape = fields.shape[:axis] + (num_elem * new_num_points,) + fields.shape[axis + 1:]
+      result = xp.empty_like(fields, shape=new_shape, dtype=xp.result_type(fields, interp_ops))
+   elif not result.flags.c_contiguous:
+      # The product is stored through a reshaped view of result, which would be a copy otherwise
+      raise ValueError('The result array of an interpolation must be C-contiguous')
+
+   if num_inner == 1:
+      # Interpolating along the last axis: (rows of elements) @ (transposed operator)
+      xp.matmul(fields.reshape(num_fields, -1, old_num_points),
+                interp_ops.swapaxes(-1, -2),
+                out=result.reshape(num_fields, -1, new_num_points))
+   else:
+      xp.matmul(interp_ops.reshape(num_fields, 1, 1, new_num_points, old_num_points),
+                fields.reshape(num_fields, num_outer, num_elem, old_num_points, num_inner),
+                out=result.reshape(num_fields, num_outer, num_elem, new_num_points, num_inner))
 
    return result
 
@@ -236,6 +211,10 @@ class Interpolator:
          else:
             self.velocity_reverse_interp = xp.linalg.pinv(self.velocity_interp)
 
+      # Per-field operators and intermediate buffers, created on first use
+      self.field_ops    = {}
+      self.work_buffers = {}
+
       # print(f'interpolator: origin type/order: {origin_type}/{origin_order}, dest type/order: {dest_type}/{dest_order}')
       if verbose:
          print(f'elem_interp:\n{self.elem_interp}')
@@ -243,36 +222,43 @@ class Interpolator:
          print(f'vel interp:\n{self.velocity_interp}')
          print(f'vel reverse interp:\n{self.velocity_reverse_interp}')
 
+   def field_operators(self, num_fields: int, reverse: bool = False):
+      """Element interpolation operator for each of num_fields fields, stacked in a single array"""
+      key = (num_fields, reverse)
+      if key not in self.field_ops:
+         base_interp = self.reverse_interp          if reverse else self.elem_interp
+         vel_interp  = self.velocity_reverse_interp if reverse else self.velocity_interp
+         self.field_ops[key] = self.xp.stack(
+            [vel_interp if i in self.velocity_ids else base_interp for i in range(num_fields)])
+      return self.field_ops[key]
+
    def __call__(self, fields: numpy.ndarray, reverse: bool = False):
 
       xp = self.xp
-      num_fields = fields.shape[0]
-
-      # Select interpolation operator for each of the fields in the list
-      base_interp = self.reverse_interp          if reverse else self.elem_interp
-      vel_interp  = self.velocity_reverse_interp if reverse else self.velocity_interp
-      interp_ops  = [vel_interp if i in self.velocity_ids else base_interp for i in range(num_fields)]
+      interp_ops = self.field_operators(fields.shape[0], reverse)
 
-      # Select interpolation method (based on problem dimension) and create result array
+      # Order in which the axes are interpolated. All fields are interpolated at once, one axis at a time.
       if self.ndim == 2:
-         eval_fct = eval_single_field_2d
-         new_size_i = fields.shape[1] * base_interp.shape[0] // base_interp.shape[1]
-         new_size_j = fields.shape[2] * base_interp.shape[0] // base_interp.shape[1]
-         result = xp.empty_like(fields, shape=(num_fields, new_size_i, new_size_j))
+         axes = [1, 2]
       elif self.ndim == 3:
-         eval_fct = eval_single_field_3d
-         new_size_vert  = fields.shape[1] * base_interp.shape[0] // base_interp.shape[1]
-         new_size_horiz = fields.shape[2] * base_interp.shape[0] // base_interp.shape[1]
-         result = xp.empty_like(fields, shape=(num_fields, new_size_vert, new_size_horiz, new_size_horiz))
+         axes = [2, 3, 1]
       else:
          raise ValueError(f'We cannot deal with ndim = {self.ndim}')
 
-      o_type = self.origin_type if not reverse else self.dest_type
-      d_type = self.dest_type   if not reverse else self.origin_type
-      # print(f'ndim: {self.ndim}, shape: {o_type} {fields.shape} -> {d_type} {result.shape} (interp shape: {base_interp.T.shape})')
-
-      # Perform the interpolation for each field
-      for i in range(num_fields):
-         eval_fct(fields[i], interp_ops[i], self.xp, result[i])
+      # Intermediate results go into buffers that are kept from one call to the next; the final result is a new array
+      new_num_points = interp_ops.shape[-2]
+      old_num_points = interp_ops.shape[-1]
+      dtype  = xp.result_type(fields, interp_ops)
+      result = fields
+      for i, axis in enumerate(axes):
+         out = None
+         if i < len(axes) - 1:
+            shape = list(result.shape)
+            shape[axis] = shape[axis] * new_num_points // old_num_points
+            key = (i, tuple(shape), dtype)
+            if key not in self.work_buffers:
+               self.work_buffers[key] = xp.empty_like(fields, shape=tuple(shape), dtype=dtype)
+            out = self.work_buffers[key]
+         result = interpolate_axis(result, interp_ops, axis, xp, out)
 
       return result
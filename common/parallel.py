@@ -1,4 +1,5 @@
 import math
+from typing import Dict, List, Optional, Tuple
 
 from mpi4py import MPI
 import numpy
@@ -6,9 +7,147 @@ import numpy
 from numpy.core.shape_base import block
 
 from common.definitions import *
+from common.profiler    import profiler
+
+# Communicator over which one copy of the model (its spatial domain) is distributed. This is the whole world, unless
+# the world has been split among several copies of the model (see split_world)
+_space_comm: MPI.Comm = MPI.COMM_WORLD
+
+def space_comm() -> MPI.Comm:
+   """Communicator of the PEs that share the spatial domain of the model. Global operations on the state vector
+   (norms, dot products, output) must be performed over this communicator."""
+   return _space_comm
+
+def split_world(num_copies: int) -> Tuple[MPI.Comm, MPI.Comm]:
+   """Split the world into num_copies groups of consecutive PEs, each of which runs a full copy of the model (a time
+   slice of a parallel-in-time run, or a member of an ensemble) over its own space communicator. The PEs that own the
+   same part of the domain in every copy form a second communicator, ordered like the copies.
+
+   The space communicator becomes the one returned by space_comm(). Returns the space communicator and the one across
+   copies."""
+   global _space_comm
+
+   world = MPI.COMM_WORLD
+   if num_copies < 1 or world.size % num_copies != 0:
+      raise ValueError(f'Cannot split {world.size} PEs into {num_copies} groups of the same size')
+
+   space_size  = world.size // num_copies
+   _space_comm = world.Split(color=world.rank // space_size, key=world.rank)
+   across_comm = world.Split(color=world.rank % space_size, key=world.rank)
+
+   return _space_comm, across_comm
+
+class SharedMemoryHalo:
+   """
+   Exchange of one block of data with each neighbour (the equivalent of Ineighbor_alltoall on the distributed graph),
+   where a neighbour that is on the same node writes its block directly into the memory of the receiving PE. Only the
+   neighbours on other nodes go through MPI messages.
+
+   Every PE has a mailbox in an MPI-3 shared memory window, with one slot per neighbour. An exchange
+   - synchronizes the PEs of the node, so that every receiver is done with the previous content of its mailbox (this
+     also lets them agree on the size of the mailboxes, which grow when needed);
+   - copies each block to the slot of the neighbour (if on the node), or sends it with MPI;
+   - on completion (Wait), synchronizes the PEs of the node again, then copies the mailbox to the receive buffer.
+   Several exchanges can be in progress at the same time, each with its own mailbox. Since the node synchronizations
+   are collective, all the PEs of a node must perform the same exchanges in the same order (like any collective).
+   """
+   def __init__(self, comm: MPI.Comm, neighbours: List[int]) -> None:
+      self.comm       = comm.Dup()
+      self.node_comm  = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+      self.neighbours = list(neighbours)
+
+      # Slot of this PE in the mailbox of each of its neighbours. A PE can be the neighbour of another in more than one
+      # direction, in which case the occurrences are matched in order (as for the neighbourhood collectives).
+      all_neighbours = comm.allgather(self.neighbours)
+      self.remote_slots = []
+      for d, n in enumerate(self.neighbours):
+         occurrence = self.neighbours[:d].count(n)
+         self.remote_slots.append([i for i, m in enumerate(all_neighbours[n]) if m == comm.rank][occurrence])
+
+      # Rank of each neighbour within the node (MPI.UNDEFINED when it is on another node)
+      self.node_ranks = comm.Get_group().Translate_ranks(self.neighbours, self.node_comm.Get_group())
+      self.is_local   = [r != MPI.UNDEFINED for r in self.node_ranks]
+
+      # One mailbox per exchange in progress: window, slots of the PEs we access (by node rank), size of one slot
+      self.mailboxes: List[Tuple[MPI.Win, Dict[int, numpy.ndarray], int]] = []
+      self.in_use: List[bool] = []
+
+   def _allocate(self, index: int, slot_bytes: int) -> None:
+      """(Re)allocate the given mailbox with slots of slot_bytes. Collective over the node."""
+      if index < len(self.mailboxes):
+         window = self.mailboxes[index][0]
+         window.Unlock_all()
+         window.Free()
+
+      window = MPI.Win.Allocate_shared(len(self.neighbours) * slot_bytes, 1, comm=self.node_comm)
+      window.Lock_all(MPI.MODE_NOCHECK)
+      slots = {}
+      for r in set(r for r in self.node_ranks if r != MPI.UNDEFINED) | {self.node_comm.rank}:
+         memory, _ = window.Shared_query(r)
+         slots[r] = numpy.ndarray((len(self.neighbours), slot_bytes), dtype=numpy.uint8, buffer=memory)
+
+      if index < len(self.mailboxes):
+         self.mailboxes[index] = (window, slots, slot_bytes)
+      else:
+         self.mailboxes.append((window, slots, slot_bytes))
+         self.in_use.append(False)
+
+   def start(self, send_buffer: numpy.ndarray, receive_buffer: numpy.ndarray) -> 'SharedMemoryHaloRequest':
+      """Start sending block d of send_buffer to neighbour d, and receiving the block of neighbour d in
+      receive_buffer[d]."""
+      block_bytes = send_buffer[0].nbytes
+      index = self.in_use.index(False) if False in self.in_use else len(self.in_use)
+
+      # Wait for the PEs of the node to be ready (and agree on the mailbox size)
+      slot_bytes = self.node_comm.allreduce(block_bytes, op=MPI.MAX)
+      if index == len(self.mailboxes) or self.mailboxes[index][2] < slot_bytes:
+         self._allocate(index, slot_bytes)
+      self.in_use[index] = True
+      window, slots, _ = self.mailboxes[index]
+
+      requests = []
+      for d, (n, local) in enumerate(zip(self.neighbours, self.is_local)):
+         if local:
+            slots[self.node_ranks[d]][self.remote_slots[d], :block_bytes] = \
+               numpy.ascontiguousarray(send_buffer[d]).reshape(-1).view(numpy.uint8)
+         else:
+            requests.append(self.comm.Irecv(receive_buffer[d], source=n, tag=len(self.neighbours) * index + d))
+            requests.append(self.comm.Isend(send_buffer[d], dest=n,
+                                            tag=len(self.neighbours) * index + self.remote_slots[d]))
+      window.Sync()
+
+      return SharedMemoryHaloRequest(self, index, requests, receive_buffer, block_bytes)
+
+   def finish(self, index: int, receive_buffer: numpy.ndarray, block_bytes: int) -> None:
+      """Wait for the neighbours on the node to have written into the given mailbox, then copy its content"""
+      window, slots, _ = self.mailboxes[index]
+      self.node_comm.Barrier()
+      window.Sync()
+      mailbox = slots[self.node_comm.rank]
+      for d, local in enumerate(self.is_local):
+         if local:
+            receive_buffer[d].reshape(-1).view(numpy.uint8)[:] = mailbox[d, :block_bytes]
+      self.in_use[index] = False
+
+class SharedMemoryHaloRequest:
+   """Exchange started by SharedMemoryHalo, completed by Wait (like an MPI request)"""
+   def __init__(self, halo: SharedMemoryHalo, index: int, requests: List[MPI.Request], receive_buffer: numpy.ndarray,
+                block_bytes: int) -> None:
+      self.halo           = halo
+      self.index          = index
+      self.requests       = requests
+      self.receive_buffer = receive_buffer
+      self.block_bytes    = block_bytes
+      self.is_complete    = False
+
+   def Wait(self) -> None:
+      if not self.is_complete:
+         MPI.Request.Waitall(self.requests)
+         self.halo.finish(self.index, self.receive_buffer, self.block_bytes)
+         self.is_complete = True
 
 class DistributedWorld:
-   def __init__(self):
+   def __init__(self, comm: Optional[MPI.Comm] = None, shared_halo: bool = False):
 
       # The numbering of the PEs starts at the bottom right. Pannel ranks increase towards the east in the x1 direction and increases towards the north in the x2 direction:
       #
@@ -33,8 +172,10 @@ class DistributedWorld:
       #      | 0 | 1 | 2 | 3 |
       #      +---+---+---+---+
 
-      self.size = MPI.COMM_WORLD.Get_size()
-      self.rank = MPI.COMM_WORLD.Get_rank()
+      # The PEs that share the spatial domain (the whole world, unless it was split among several copies of the model)
+      self.comm = comm if comm is not None else space_comm()
+      self.size = self.comm.Get_size()
+      self.rank = self.comm.Get_rank()
 
       self.nb_pe_per_panel = int(self.size / 6)
       self.nb_lines_per_panel = int(math.sqrt(self.nb_pe_per_panel))
@@ -196,12 +337,23 @@ class DistributedWorld:
       self.sources = [my_north, my_south, my_west, my_east]
       self.destinations = self.sources
 
-      self.comm_dist_graph = MPI.COMM_WORLD.Create_dist_graph_adjacent(self.sources, self.destinations)
+      self.comm_dist_graph = self.comm.Create_dist_graph_adjacent(self.sources, self.destinations)
+
+      # With shared_halo, the neighbours on the same node exchange their data through shared memory
+      self.shared_halo = SharedMemoryHalo(self.comm, self.sources) if shared_halo else None
 
       self.get_rows_3d = lambda array, index1, index2: array[:, index1, index2, :] if array is not None else None
-      self.get_rows_2d = lambda array, index1, index2: array[index1, index2, :] if array is not None else None
+      self.get_rows_2d = lambda array, index1, index2: array[..., index1, index2, :] if array is not None else None
+
 
+   def start_exchange(self, send_buffer: numpy.ndarray, receive_buffer: numpy.ndarray):
+      """Start sending send_buffer[d] to neighbour d (north, south, west, east), and receiving the data of that
+      neighbour in receive_buffer[d]. Returns the request to wait for."""
+      if self.shared_halo is not None:
+         return self.shared_halo.start(send_buffer, receive_buffer)
+      return self.comm_dist_graph.Ineighbor_alltoall(send_buffer, receive_buffer)
 
+   @profiler.profile()
    def send_recv_neighbors(self, north_send, south_send, west_send, east_send, flip_dim, sync=True):
 
       send_buffer = numpy.empty(((4,) + north_send.shape), dtype=north_send.dtype)
@@ -212,9 +364,11 @@ class DistributedWorld:
 
       # receive_buffer = self.comm_dist_graph.neighbor_alltoall(send_buffer)
       receive_buffer = numpy.empty_like(send_buffer)
-      request = self.comm_dist_graph.Ineighbor_alltoall(send_buffer, receive_buffer)
+      request = self.start_exchange(send_buffer, receive_buffer)
+      profiler.add_bytes(send_buffer.nbytes)
       if sync:
-         request.Wait()
+         with profiler.section('xchange_wait'):
+            request.Wait()
       return request, receive_buffer[0], receive_buffer[1], receive_buffer[2], receive_buffer[3]
 
 
@@ -310,11 +464,14 @@ class DistributedWorld:
       return request, f_x1_ext, f_x2_ext
 
 
+   @profiler.profile()
    def xchange_sw_interfaces(self, geom, h_i, h_j, u1_i, u2_i, u1_j, u2_j, blocking=True):
+      """Exchange the shallow water variables at the PE boundaries. The interface arrays may have leading (batch)
+      dimensions, which are all sent in the same message."""
       get_rows = self.get_rows_2d
       X = geom.X[0, :]
       Y = geom.Y[:, 0]
-      flip_dim = 0
+      flip_dim = -1
 
       # Get the right origin vectors
       h_n, u1_n, u2_n = (get_rows(h_j, -2, 1), get_rows(u1_j, -2, 1), get_rows(u2_j, -2, 1))
@@ -332,13 +489,14 @@ class DistributedWorld:
             [X, X, Y, Y],
             [h_n, h_s, h_w, h_e], [(u1_n, u2_n), (u1_s, u2_s), (u1_w, u2_w), (u1_e, u2_e)],
             [send_buffer[0], send_buffer[1], send_buffer[2], send_buffer[3]]):
-         buffer[0, :] = numpy.flip(h) if do_flip else h
+         buffer[0, :] = numpy.flip(h, flip_dim) if do_flip else h
          tmp1, tmp2 = convert(u1, u2, positions)
          buffer[1, :] = numpy.flip(tmp1, flip_dim) if do_flip else tmp1
          buffer[2, :] = numpy.flip(tmp2, flip_dim) if do_flip else tmp2
 
       # Initiate data transfer
-      mpi_request = self.comm_dist_graph.Ineighbor_alltoall(send_buffer, receive_buffer)
+      mpi_request = self.start_exchange(send_buffer, receive_buffer)
+      profiler.add_bytes(send_buffer.nbytes)
 
       # Destination vectors
       h_n_dest, u1_n_dest, u2_n_dest = (get_rows(h_j, -1, 0), get_rows(u1_j, -1, 0), get_rows(u2_j, -1, 0))
@@ -356,21 +514,24 @@ class DistributedWorld:
 
       return request
 
+   @profiler.profile()
    def xchange_Euler_interfaces(self, geom, variables_itf_i, variables_itf_j, blocking=True):
 
       X = geom.X[0, :]
       Y = geom.Y[:, 0]
-      flip_dim = 1
+      flip_dim = -1
       id_first_tracer = 5
 
+      # The interface arrays are indexed as (var, [member,] k, element, side, point), with a member dimension when
+      # they hold a batch of states
       init_shape = variables_itf_i.shape
-      send_buffer = numpy.empty((4, init_shape[0], init_shape[1], init_shape[4]), dtype=variables_itf_i.dtype)
+      send_buffer = numpy.empty((4,) + init_shape[:-3] + init_shape[-1:], dtype=variables_itf_i.dtype)
       recv_buffer = numpy.empty_like(send_buffer)
 
-      var_n = variables_itf_j[:, :, -2, 1, :]
-      var_s = variables_itf_j[:, :, 1, 0, :]
-      var_w = variables_itf_i[:, :, 1, 0, :]
-      var_e = variables_itf_i[:, :, -2, 1, :]
+      var_n = variables_itf_j[..., -2, 1, :]
+      var_s = variables_itf_j[..., 1, 0, :]
+      var_w = variables_itf_i[..., 1, 0, :]
+      var_e = variables_itf_i[..., -2, 1, :]
 
       # Fill the send buffer, flipping when necessary and converting vector values
       for do_flip, convert, positions, var, buffer in zip(
@@ -387,16 +548,17 @@ class DistributedWorld:
          buffer[idx_rho_u1] = numpy.flip(tmp1, flip_dim) if do_flip else tmp1
          buffer[idx_rho_u2] = numpy.flip(tmp2, flip_dim) if do_flip else tmp2
 
-         buffer[id_first_tracer:] = numpy.flip(var[id_first_tracer:], flip_dim + 1) if do_flip else var[id_first_tracer:]
+         buffer[id_first_tracer:] = numpy.flip(var[id_first_tracer:], flip_dim) if do_flip else var[id_first_tracer:]
 
       # Initiate MPI transfer
-      mpi_request = self.comm_dist_graph.Ineighbor_alltoall(send_buffer, recv_buffer)
+      mpi_request = self.start_exchange(send_buffer, recv_buffer)
+      profiler.add_bytes(send_buffer.nbytes)
 
       # Setup request to that data ends up in the right arrays when the wait() function is called
-      var_n_dest = variables_itf_j[:, :, -1, 0, :]
-      var_s_dest = variables_itf_j[:, :, 0, 1, :]
-      var_w_dest = variables_itf_i[:, :, 0, 1, :]
-      var_e_dest = variables_itf_i[:, :, -1, 0, :]
+      var_n_dest = variables_itf_j[..., -1, 0, :]
+      var_s_dest = variables_itf_j[..., 0, 1, :]
+      var_w_dest = variables_itf_i[..., 0, 1, :]
+      var_e_dest = variables_itf_i[..., -1, 0, :]
 
       request = EulerExchangeRequest(recv_buffer, (var_n_dest, var_s_dest, var_w_dest, var_e_dest), mpi_request)
 
@@ -405,6 +567,7 @@ class DistributedWorld:
 
       return request
 
+   @profiler.profile()
    def xchange_vectors(self, geom, u1_itf_i, u2_itf_i, u1_itf_j, u2_itf_j, u3_itf_i=None, u3_itf_j=None, blocking=True):
 
       # --- 2D/3D setup
@@ -874,7 +1037,8 @@ class ScalarNonBlockingExchangeRequest():
 
    def wait(self):
       if not self.is_complete:
-         self.request.Wait()
+         with profiler.section('xchange_wait'):
+            self.request.Wait()
          self.outputs[0][:] = self.recv_buffers[0]
          self.outputs[1][:] = self.recv_buffers[1]
          self.outputs[2][:] = self.recv_buffers[2]
@@ -892,7 +1056,8 @@ class VectorNonBlockingExchangeRequest():
 
    def wait(self):
       if not self.is_complete:
-         self.request.Wait()
+         with profiler.section('xchange_wait'):
+            self.request.Wait()
          self.outputs[0][0][:] = self.recv_buffers[0][0]
          self.outputs[1][0][:] = self.recv_buffers[1][0]
          self.outputs[2][0][:] = self.recv_buffers[2][0]
@@ -920,7 +1085,8 @@ class ShallowWaterExchangeRequest():
 
    def wait(self):
       if not self.is_complete:
-         self.request.Wait()
+         with profiler.section('xchange_wait'):
+            self.request.Wait()
          for i in range(4):
             for j in range(3):
                self.outputs[i][j][:] = self.recv_buffers[i, j]
@@ -935,7 +1101,8 @@ class EulerExchangeRequest():
 
    def wait(self):
       if not self.is_complete:
-         self.mpi_request.Wait()
+         with profiler.section('xchange_wait'):
+            self.mpi_request.Wait()
          for i in range(self.recv_buffers.shape[0]):
             for j in range(self.recv_buffers.shape[1]):
                self.outputs[i][j][:] = self.recv_buffers[i, j]
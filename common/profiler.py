@@ -0,0 +1,181 @@
+"""
+Lightweight instrumentation of the main phases of a simulation (RHS evaluations, halo exchanges, solvers, output...)
+
+Code sections are delimited with the global `profiler` object, either with a context manager or a decorator:
+
+   with profiler.section('my_phase'):
+      ...
+
+   @profiler.profile('my_function')
+   def my_function(...):
+      ...
+
+Sections can be nested; each one is identified by its path in the hierarchy (e.g. 'step/rhs_sw/xchange_wait'), on each
+thread. For every section, we record the number of calls, the total wall time and the number of bytes sent to other
+PEs (see add_bytes). When the profiler is not enabled, all of this reduces to a function call that does nothing.
+
+At the end of the run, statistics are reduced across PEs (min/mean/max) and written to a report, to help find load
+imbalance and communication hotspots. The profiler can also produce a trace of every call, in the Chrome trace format
+(which can be viewed with chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import contextlib
+import functools
+import json
+import threading
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from mpi4py import MPI
+
+__all__ = ['Profiler', 'profiler']
+
+class SectionStats:
+   """Accumulated measurements for one section of code."""
+   __slots__ = ['count', 'time', 'nbytes']
+   def __init__(self) -> None:
+      self.count  = 0
+      self.time   = 0.0
+      self.nbytes = 0
+
+class _Section:
+   """Context manager that times one execution of a code section."""
+   __slots__ = ['profiler', 'name', 'path', 'start']
+   def __init__(self, profiler: 'Profiler', name: str) -> None:
+      self.profiler = profiler
+      self.name     = name
+
+   def __enter__(self) -> '_Section':
+      stack = self.profiler._stack()
+      self.path  = f'{stack[-1]}/{self.name}' if len(stack) > 0 else self.name
+      stack.append(self.path)
+      self.start = perf_counter()
+      return self
+
+   def __exit__(self, *args) -> None:
+      elapsed = perf_counter() - self.start
+      self.profiler._stack().pop()
+      self.profiler._record(self.name, self.path, self.start, elapsed)
+
+class Profiler:
+   """Collects timing and communication statistics about named code sections. See module documentation."""
+   def __init__(self) -> None:
+      self.enabled       = False
+      self.trace_enabled = False
+      self.stats: Dict[str, SectionStats] = {}
+      self.trace_events: List[dict] = []
+      self.origin = perf_counter()
+      self.lock   = threading.Lock() # Sections can be measured from multiple threads (e.g. the output writer)
+      self.local  = threading.local()
+
+   def enable(self, trace: bool = False) -> None:
+      """Start collecting statistics (and individual events, if trace is True)."""
+      self.enabled       = True
+      self.trace_enabled = trace
+      self.origin        = perf_counter()
+
+   def section(self, name: str):
+      """Context manager that measures the enclosed code as the section with the given name."""
+      if not self.enabled: return contextlib.nullcontext()
+      return _Section(self, name)
+
+   def profile(self, name: Optional[str] = None) -> Callable[[Callable], Callable]:
+      """Decorator that measures every call to the decorated function as a section. The name of the section is
+      the name of the function, unless specified."""
+      def decorator(function: Callable) -> Callable:
+         section_name = name if name is not None else function.__name__
+         @functools.wraps(function)
+         def wrapper(*args, **kwargs):
+            if not self.enabled: return function(*args, **kwargs)
+            with _Section(self, section_name):
+               return function(*args, **kwargs)
+         return wrapper
+      return decorator
+
+   def add_bytes(self, nbytes: int) -> None:
+      """Record that the current section sent the given number of bytes to other PEs."""
+      if not self.enabled: return
+      stack = self._stack()
+      path = stack[-1] if len(stack) > 0 else '(none)'
+      with self.lock:
+         self.stats.setdefault(path, SectionStats()).nbytes += nbytes
+
+   def report(self, comm: MPI.Comm = MPI.COMM_WORLD) -> Optional[str]:
+      """Reduce the statistics of every PE and return a text report (on the root PE only, None on the others)."""
+      with self.lock:
+         local_stats = {path: (s.count, s.time, s.nbytes) for path, s in self.stats.items()}
+      all_stats = comm.gather(local_stats, root=0)
+      if comm.rank != 0: return None
+
+      paths = sorted(set(path for stats in all_stats for path in stats), key=lambda p: p.split('/'))
+
+      lines = [f'Profiling report ({comm.size} PEs; times in seconds, over the PEs that executed each section)',
+               f'{"Section":<48s} {"PEs":>4s} {"Calls":>9s} {"Min":>10s} {"Mean":>10s} {"Max":>10s} '
+               f'{"Max/mean":>8s} {"MB sent":>10s}']
+      for path in paths:
+         values = [stats[path] for stats in all_stats if path in stats]
+         counts = [v[0] for v in values]
+         times  = [v[1] for v in values]
+         nbytes = [v[2] for v in values]
+
+         mean_time = sum(times) / len(times)
+         imbalance = max(times) / mean_time if mean_time > 0.0 else 1.0
+         depth     = path.count('/')
+         label     = '  ' * depth + path.split('/')[-1]
+         lines.append(f'{label:<48s} {len(values):4d} {sum(counts) / len(counts):9.0f} {min(times):10.4f} '
+                      f'{mean_time:10.4f} {max(times):10.4f} {imbalance:8.2f} '
+                      f'{sum(nbytes) / len(nbytes) / 1e6:10.2f}')
+
+      return '\n'.join(lines)
+
+   def write_trace(self, file_name: str, comm: MPI.Comm = MPI.COMM_WORLD) -> None:
+      """Gather the events of every PE and write them in a single file, in Chrome trace format. Each PE appears as a
+      separate process."""
+      with self.lock:
+         events = list(self.trace_events)
+      all_events = comm.gather(events, root=0)
+      if comm.rank != 0: return
+
+      trace = [{'name': 'process_name', 'ph': 'M', 'pid': rank, 'args': {'name': f'PE {rank}'}}
+               for rank in range(comm.size)]
+      for pe_events in all_events:
+         trace.extend(pe_events)
+
+      with open(file_name, 'w') as f:
+         json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+   def finalize(self, output_dir: str, comm: MPI.Comm = MPI.COMM_WORLD) -> None:
+      """Write the report (and the trace, if enabled) in the given directory. Collective."""
+      if not self.enabled: return
+
+      report = self.report(comm)
+      if report is not None:
+         print(f'\n{report}')
+         with open(f'{output_dir}/profiling_report.txt', 'w') as f:
+            f.write(report + '\n')
+
+      if self.trace_enabled:
+         self.write_trace(f'{output_dir}/profiling_trace.json', comm)
+
+   def _stack(self) -> List[str]:
+      stack = getattr(self.local, 'stack', None)
+      if stack is None:
+         stack = []
+         self.local.stack = stack
+      return stack
+
+   def _record(self, name: str, path: str, start: float, elapsed: float) -> None:
+      with self.lock:
+         stats = self.stats.get(path)
+         if stats is None:
+            stats = SectionStats()
+            self.stats[path] = stats
+         stats.count += 1
+         stats.time  += elapsed
+
+         if self.trace_enabled:
+            self.trace_events.append({'name': name, 'cat': path, 'ph': 'X', 'pid': MPI.COMM_WORLD.rank,
+                                      'tid': threading.get_native_id(), 'ts': (start - self.origin) * 1e6,
+                                      'dur': elapsed * 1e6})
+
+profiler = Profiler()
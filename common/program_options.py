@@ -1,5 +1,6 @@
 from configparser import ConfigParser, NoSectionError, NoOptionError
 import json
+import math
 import re
 import copy
 import sys
@@ -48,6 +49,21 @@ class Configuration:
                      f'so we will revert to CPU')
             self.device = 'cpu'
 
+      # Implementation of the interface (Riemann) flux kernels on CPU: whole-array NumPy operations, or loops compiled
+      # with Numba (if available)
+      self.flux_kernels = self._get_option('System', 'flux_kernels', str, 'numpy', ['numpy', 'numba'])
+      if self.flux_kernels == 'numba':
+         from rhs.flux_kernels import numba_available
+         if not numba_available:
+            if verbose:
+               print(f'WARNING: Config is asking for Numba flux kernels, but we\'re unable to import numba, '
+                     f'so we will revert to NumPy')
+            self.flux_kernels = 'numpy'
+
+      # Exchange of the element interfaces between neighbouring PEs: MPI neighbourhood collectives only ('mpi'), or
+      # shared memory for the neighbours on the same node and MPI messages for the others ('shared')
+      self.halo_exchange = self._get_option('System', 'halo_exchange', str, 'mpi', ['mpi', 'shared'])
+
       ################################
       # Test case
       self.case_number = self._get_option('Test_case', 'case_number', int, -1)
@@ -59,6 +75,13 @@ class Configuration:
       self.bubble_theta = self._get_option('Test_case', 'bubble_theta', float, 0.0)
       self.bubble_rad   = self._get_option('Test_case', 'bubble_rad', float, 0.0)
 
+      # Ensemble of ensemble_members copies of the case, run together (each by its own group of PEs, sharing the
+      # geometry on every node). The initial state of each member (except the first one) is perturbed by relative
+      # random noise of amplitude ensemble_perturbation, drawn from ensemble_seed
+      self.ensemble_members      = self._get_option('Test_case', 'ensemble_members', int, 1, min_value=1)
+      self.ensemble_perturbation = self._get_option('Test_case', 'ensemble_perturbation', float, 0.0, min_value=0.0)
+      self.ensemble_seed         = self._get_option('Test_case', 'ensemble_seed', int, 0, min_value=0)
+
       ################################
       # Time integration
       self.dt              = self._get_option('Time_integration', 'dt', float, None)
@@ -68,9 +91,26 @@ class Configuration:
 
       self.starting_step = self._get_option('Time_integration', 'starting_step', int, 0)
 
+      # Free parameter of the OS22 splitting methods (os22_<scheme 1>_<scheme 2>), which cannot be 1
+      self.os22_param = self._get_option('Time_integration', 'os22_param', float, 1.0 - math.sqrt(2.0) / 2.0)
+
+      # Whether the implicit part of the RHS can be considered linear by the IMEX Runge-Kutta methods (imex_ars222,
+      # imex_ark3, imex_ark4), which then solve each implicit stage with a single linear solve rather than with Newton
+      self.imex_linear_implicit = self._get_option('Time_integration', 'imex_linear_implicit', bool, False)
+
+      # Adapt the step size to the local error estimate of the time integrator (dt is then the size of the first step).
+      # Only for integrators that provide such an estimate: tvdrk3, ros2, epi* and epi_stiff*
+      self.adaptive_dt   = self._get_option('Time_integration', 'adaptive_dt', bool, False)
+      self.adaptive_rtol = self._get_option('Time_integration', 'adaptive_rtol', float, 1e-4, min_value=0.0)
+      self.adaptive_atol = self._get_option('Time_integration', 'adaptive_atol', float, 1e-6, min_value=0.0)
+      self.dt_min        = self._get_option('Time_integration', 'dt_min', float, self.dt / 1000.0, min_value=0.0)
+      self.dt_max        = self._get_option('Time_integration', 'dt_max', float, self.dt * 10.0, min_value=self.dt_min)
+
       self.exponential_solver = self._get_option('Time_integration', 'exponential_solver', str, 'pmex',
                                                  ['pmex', 'kiops'])
       self.krylov_size        = self._get_option('Time_integration', 'krylov_size', int, 1)
+      # Choose the maximum Krylov size and the substepping of the exponential solver by timing the first steps
+      self.exp_autotune       = self._get_option('Time_integration', 'exp_autotune', bool, False)
       self.jacobian_method    = self._get_option('Time_integration', 'jacobian_method', str, 'complex',
                                                  ['complex', 'fd'])
 
@@ -78,6 +118,48 @@ class Configuration:
       self.verbose_solver = self._get_option('Time_integration', 'verbose_solver', int, 0)
       self.gmres_restart  = self._get_option('Time_integration', 'gmres_restart', int, 20)
 
+      # Newton-Krylov solver of the implicit integrators (backward_euler, bdf2, crank_nicolson, imex2): number of Newton
+      # iterations done with the same linearization (1 for Newton, more for Shamanskii/chord), number of time steps
+      # over which a linearization (and the preconditioner) can be kept, how the tolerance of the linear solves is
+      # chosen, and whether to start from the previous step's increment
+      self.newton_jacobian_reuse   = self._get_option('Time_integration', 'newton_jacobian_reuse', int, 1, min_value=1)
+      self.newton_jacobian_max_age = self._get_option('Time_integration', 'newton_jacobian_max_age', int, 0,
+                                                      min_value=0)
+      self.newton_forcing          = self._get_option('Time_integration', 'newton_forcing', str, 'eisenstat_walker',
+                                                      valid_values=['eisenstat_walker', 'constant'])
+      self.newton_warm_start       = self._get_option('Time_integration', 'newton_warm_start', bool, False)
+
+      # Initial guess of the implicit solvers (ros2, backward_euler, bdf2, crank_nicolson): extrapolation of the states
+      # of the previous steps with a polynomial of degree up to predictor_order (0: the current state). With
+      # predictor_projection = k > 0, the initial guess of FGMRES (ros2 only) is instead the one that minimizes the
+      # residual over the space spanned by the k latest states (which contains the extrapolation), for k matvecs
+      self.predictor_order      = self._get_option('Time_integration', 'predictor_order', int, 0, min_value=0)
+      self.predictor_projection = self._get_option('Time_integration', 'predictor_projection', int, 0, min_value=0)
+
+      # Parallel-in-time (Parareal) runs: number of time slices that are advanced concurrently, each by its own group
+      # of PEs (1: sequential run). Each slice is made of parareal_fine_steps steps of the time integrator, and is also
+      # crossed by a cheaper coarse integrator in parareal_coarse_steps steps. The coarse integrator must either be a
+      # different method or take fewer steps, otherwise it costs as much as the fine one. At most parareal_max_iter
+      # Parareal iterations are performed per window (0: as many as there are slices, which gives the sequential
+      # solution), stopping when the slice boundaries change by less than parareal_tol
+      self.parareal_slices            = self._get_option('Time_integration', 'parareal_slices', int, 1, min_value=1)
+      self.parareal_fine_steps        = self._get_option('Time_integration', 'parareal_fine_steps', int, 1,
+                                                         min_value=1)
+      self.parareal_coarse_integrator = self._get_option('Time_integration', 'parareal_coarse_integrator', str,
+                                                         self.time_integrator)
+      self.parareal_coarse_steps      = self._get_option('Time_integration', 'parareal_coarse_steps', int, 1,
+                                                         min_value=1)
+      self.parareal_max_iter          = self._get_option('Time_integration', 'parareal_max_iter', int, 0, min_value=0)
+      self.parareal_tol               = self._get_option('Time_integration', 'parareal_tol', float, 1e-7,
+                                                         min_value=0.0)
+
+      if self.parareal_slices > 1 and self.parareal_coarse_integrator == self.time_integrator \
+            and self.parareal_coarse_steps >= self.parareal_fine_steps:
+         raise ValueError(f'The Parareal coarse propagator ({self.parareal_coarse_steps} step(s) of '
+                          f'{self.parareal_coarse_integrator}) is not cheaper than the fine one '
+                          f'({self.parareal_fine_steps} step(s) of {self.time_integrator}). Choose another '
+                          f'parareal_coarse_integrator, or fewer parareal_coarse_steps than parareal_fine_steps')
+
       ################################
       # Spatial discretization
       self.nbsolpts               = self._get_option('Spatial_discretization', 'nbsolpts', int, None)
@@ -103,6 +185,11 @@ class Configuration:
       self.apply_sponge = self._get_option('Spatial_discretization', 'apply_sponge', bool, False)
       self.sponge_tscale = self._get_option('Spatial_discretization', 'sponge_tscale', float, 1.0)
       self.sponge_zscale = self._get_option('Spatial_discretization', 'sponge_zscale', float, 0.0)
+
+      # Memory layout of the state vector inside the time integrators: 'natural' (nb_var, n_1, ..., n_d) or
+      # 'element' (nb_elements, nb_var, nbsolpts^d), where all variables of an element are contiguous
+      self.state_layout = self._get_option('Spatial_discretization', 'state_layout', str, 'natural',
+                                           valid_values=['natural', 'element'])
       
       ###############################
       # Grid
@@ -176,8 +263,14 @@ class Configuration:
       self.output_freq = self._get_option('Output_options', 'output_freq', int, 0)
       # Frequency in timesteps at which to save the state vector
       self.save_state_freq = self._get_option('Output_options', 'save_state_freq', int, 0)
+      # Format of saved states. 'checkpoint' is a single file for all PEs that can be used to restart with a different
+      # number of PEs, 'numpy' is one .npy file per PE
+      self.state_format = self._get_option('Output_options', 'state_format', str, 'numpy',
+                                           valid_values=['checkpoint', 'numpy'])
       # Whether to store solver stats (at every timestep)
       self.store_solver_stats = self._get_option('Output_options', 'store_solver_stats', bool, False)
+      # Whether to perform output operations on a separate thread, while the time loop continues
+      self.async_output = self._get_option('Output_options', 'async_output', bool, False)
 
       # Directory where to store all the output
       self.output_dir = self._get_option('Output_options', 'output_dir', str, 'results')
@@ -186,6 +279,19 @@ class Configuration:
       self.output_file = f'{self.output_dir}/{self.base_output_file}.nc'
 
       self.solver_stats_file = self._get_option('Output_options', 'solver_stats_file', str, 'solver_stats.db')
+      # Number of timesteps for which solver stats are kept in memory before being written to the database
+      self.solver_stats_flush_freq = self._get_option('Output_options', 'solver_stats_flush_freq', int, 100,
+                                                      min_value=1)
+      # Whether to write solver stats to the database from a separate thread (the database then uses WAL journaling)
+      self.solver_stats_async = self._get_option('Output_options', 'solver_stats_async', bool, False)
+      # Name of a .npz file where to also export solver stats in columnar format, at the end of the run. Empty to disable
+      self.solver_stats_export = self._get_option('Output_options', 'solver_stats_export', str, '')
+
+      # Whether to measure time spent (and bytes exchanged) in the main parts of the model, and write a report about it
+      # at the end of the run
+      self.profiling_report = self._get_option('Output_options', 'profiling_report', bool, False)
+      # Whether to also record every profiled call and write them to a file in the Chrome trace format
+      self.profiling_trace = self._get_option('Output_options', 'profiling_trace', bool, False)
 
       if verbose:
          print(f'{self}')
@@ -0,0 +1,90 @@
+import io
+import pickle
+import types
+from typing import Any, Callable, Dict, List
+
+from mpi4py import MPI
+import numpy
+
+# Shared memory windows that hold the arrays of shared objects. They must stay allocated for the whole run.
+_windows: List[MPI.Win] = []
+
+class _SharingPickler(pickle.Pickler):
+   """Pickler that leaves out the (large) arrays, which are transferred through shared memory instead, as well as the
+   objects that each PE must provide itself (modules, communicators, etc.)."""
+   def __init__(self, file, local_objects: Dict[str, Any], min_bytes: int) -> None:
+      super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+      self.local_ids = {id(obj): name for name, obj in local_objects.items() if obj is not None}
+      self.min_bytes = min_bytes
+      self.arrays: List[numpy.ndarray] = []
+      self.array_ids: Dict[int, int] = {}
+
+   def persistent_id(self, obj):
+      if id(obj) in self.local_ids:
+         return ('local', self.local_ids[id(obj)])
+      if isinstance(obj, types.ModuleType):
+         return ('module', obj.__name__)
+      if type(obj) is numpy.ndarray and obj.dtype != object and obj.nbytes >= self.min_bytes:
+         if id(obj) not in self.array_ids:
+            self.array_ids[id(obj)] = len(self.arrays)
+            self.arrays.append(obj)
+         return ('array', self.array_ids[id(obj)])
+      return None
+
+class _SharingUnpickler(pickle.Unpickler):
+   def __init__(self, file, local_objects: Dict[str, Any], arrays: List[numpy.ndarray]) -> None:
+      super().__init__(file)
+      self.local_objects = local_objects
+      self.arrays = arrays
+
+   def persistent_load(self, pid):
+      kind, key = pid
+      if kind == 'local':  return self.local_objects[key]
+      if kind == 'module': return __import__(key, fromlist=['_'])
+      if kind == 'array':  return self.arrays[key]
+      raise pickle.UnpicklingError(f'Unknown persistent object {pid}')
+
+def build_shared(build: Callable[[], Any], comm: MPI.Comm, local_objects: Dict[str, Any], min_bytes: int = 1024) \
+      -> Any:
+   """
+   Build an object (any picklable structure) on the first PE of the given communicator only, and give every PE of
+   that communicator an identical copy of it, whose numpy arrays of at least min_bytes are in memory shared among
+   these PEs (an MPI-3 shared window per array). The PEs of comm must therefore be on the same node, and have the
+   same view of the object (typically, they own the same part of the domain in different copies of the model).
+
+   The shared arrays are read-only. Objects that cannot (or should not) be copied from one PE to another, like the
+   communicators, must be given in local_objects (by name): every PE substitutes its own object of that name.
+   """
+   if comm.size == 1:
+      return build()
+
+   # Build and serialize the object (without its large arrays)
+   arrays: List[numpy.ndarray] = []
+   data, specs = None, None
+   if comm.rank == 0:
+      buffer = io.BytesIO()
+      pickler = _SharingPickler(buffer, local_objects, min_bytes)
+      pickler.dump(build())
+      data   = buffer.getvalue()
+      arrays = pickler.arrays
+      specs  = [(array.shape, array.dtype.str) for array in arrays]
+   data, specs = comm.bcast((data, specs), root=0)
+
+   # Allocate the arrays in shared memory (on the first PE) and fill them
+   shared = []
+   for i, (shape, dtype) in enumerate(specs):
+      itemsize = numpy.dtype(dtype).itemsize
+      num_bytes = int(numpy.prod(shape)) * itemsize if comm.rank == 0 else 0
+      window = MPI.Win.Allocate_shared(num_bytes, itemsize, comm=comm)
+      _windows.append(window)
+      memory, _ = window.Shared_query(0)
+      array = numpy.ndarray(shape, dtype=dtype, buffer=memory)
+      if comm.rank == 0:
+         array[...] = arrays[i]
+      shared.append(array)
+   comm.Barrier()
+
+   for array in shared:
+      array.flags.writeable = False
+
+   return _SharingUnpickler(io.BytesIO(data), local_objects, shared).load()
@@ -5,7 +5,9 @@ from .geometry          import Geometry
 from .operators         import DFROperators, lagrange_eval, remesh_operator
 from .metric            import Metric, Metric3DTopo
 from .quadrature        import gauss_legendre
+from .state_layout      import StateLayout
 from .winds             import contra2wind_2d, contra2wind_3d, wind2contra_2d, wind2contra_3d
 
 __all__ = ['Cartesian2D', 'contra2wind_2d', 'contra2wind_3d', 'CubedSphere', 'DFROperators', 'gauss_legendre',
-           'Geometry', 'lagrange_eval', 'Metric', 'Metric3DTopo', 'remesh_operator', 'wind2contra_2d', 'wind2contra_3d']
+           'Geometry', 'lagrange_eval', 'Metric', 'Metric3DTopo', 'remesh_operator', 'StateLayout', 'wind2contra_2d',
+           'wind2contra_3d']
@@ -692,6 +692,23 @@ class Metric3DTopo:
       self.sqrtG_itf_k = sqrtG_itf_k
       self.inv_sqrtG = 1/sqrtG
 
+      # Products of √g with the contravariant metric, which multiply the pressure in the momentum fluxes. Since they
+      # only depend on the geometry, they are computed once here rather than at every RHS evaluation.
+      # sqrtG_H_contra[i] contains √g H^i1, √g H^i2 and √g H^i3 (in the order of the momentum equations)
+      self.sqrtG_H_contra = xp.ascontiguousarray(sqrtG * H_contra)
+
+      # Metric terms used by the Riemann solver at the interfaces along direction d, packed as
+      #    [√g, H^dd, √g H^d1, √g H^d2, √g H^d3]
+      # and stored contiguously in the layout of the interface fluxes of the RHS: (nk, interface, nj) along i,
+      # (nk, interface, ni) along j and (nj, interface, ni) along k
+      def riemann_metric(rootG, Hcontra, d, axes):
+         packed = xp.concatenate((rootG[numpy.newaxis], Hcontra[d, d][numpy.newaxis], rootG * Hcontra[d]))
+         return xp.ascontiguousarray(packed.transpose(axes))
+
+      self.riemann_metric_itf_i = riemann_metric(sqrtG_itf_i, H_contra_itf_i, 0, (0, 1, 3, 2))
+      self.riemann_metric_itf_j = riemann_metric(sqrtG_itf_j, H_contra_itf_j, 1, (0, 1, 2, 3))
+      self.riemann_metric_itf_k = riemann_metric(sqrtG_itf_k, H_contra_itf_k, 2, (0, 2, 1, 3))
+
       self.coriolis_f = 2 * geom.rotation_speed / geom.delta * ( math.sin(geom.lat_p) - geom.X * math.cos(geom.lat_p) * math.sin(geom.angle_p) + geom.Y * math.cos(geom.lat_p) * math.cos(geom.angle_p))
 
       self.inv_dzdeta = 1/dRdeta_int * 2/Δeta
@@ -22,7 +22,8 @@ class DFROperators:
 
    The relevant internal matrices are:
       * The extrapolation matrices, `extrap_west`, `extrap_east`, `extrap_south`, `extrap_north`, `extrap_down`, and
-        `extrap_up`. They are used to compute values at the boundaries of an element.
+        `extrap_up`. They are used to compute values at the boundaries of an element. `extrap_faces` (and its
+        transpose `extrap_faces_tr`) stacks the two sides, to extrapolate to both boundaries with a single product.
       * Differentiation matrices: `diff`, `diff_ext`, `diff_tr`, `diff_solpt`, `diff_solpt_tr`
       * Correction matrices: `correction`, `correction_tr`.
    '''
@@ -68,6 +69,10 @@ class DFROperators:
       self.extrap_down = extrap_neg
       self.extrap_up = extrap_pos
 
+      # Both sides at once, (2, nbsolpts), with the negative side first
+      self.extrap_faces = numpy.vstack((extrap_neg, extrap_pos))
+      self.extrap_faces_tr = self.extrap_faces.T.copy()
+
 
       # self.extrap_west = lagrangeEval(grd.solutionPoints_sym, -1)
       # self.extrap_east = lagrangeEval(grd.solutionPoints_sym,  1)
@@ -328,9 +333,8 @@ class DFROperators:
       field_interior_view = field_interior.view()
       field_interior_view.shape = (-1,grid.nbsolpts)
 
-      # Perform the extrapolations via matrix multiplication
-      border[:,0] = field_interior_view @ self.extrap_west
-      border[:,1] = field_interior_view @ self.extrap_east
+      # Perform the extrapolations (west and east) via a single matrix multiplication
+      border[:] = field_interior_view @ self.extrap_faces_tr
 
       border.shape = tuple(field_interior.shape[0:-1]) + border_shape
       return border
@@ -387,8 +391,9 @@ class DFROperators:
       border_j_view.shape = (nbvars*grid.nb_elements_x2,2,grid.ni)
       output.shape = field_view.shape
 
-      # Perform the matrix transposition
-      output[:] = self.diff_solpt @ field_view + self.correction @ border_j_view
+      # Perform the matrix multiplications, directly into the output array
+      numpy.matmul(self.diff_solpt, field_view, out=output)
+      output += self.correction @ border_j_view
 
       # Reshape the output array back to its canonical extents
       output.shape = field_interior.shape
@@ -438,10 +443,8 @@ class DFROperators:
       field_interior_view = field_interior.view()
       field_interior_view.shape = (-1,grid.nbsolpts,grid.ni)
 
-      # Perform the extrapolations via matrix multiplication
-      # print(border[:,0,:].shape, field_interior_view.shape, self.extrap_south.T.shape)
-      border[:,0,:] = (self.extrap_south @ field_interior_view)
-      border[:,1,:] = (self.extrap_north @ field_interior_view)
+      # Perform the extrapolations (south and north) via a single matrix multiplication
+      border[:] = self.extrap_faces @ field_interior_view
 
       # field_interior.shape[0:-2] is (nbvars,nk) for many 3D fields, (nbvars,) for many 2D fields,
       # (nk) for a single 3D field, and () for a single 2D field.
@@ -500,8 +503,9 @@ class DFROperators:
       border_k_view.shape = (nbvars*grid.nb_elements_x3,2,grid.ni*grid.nj)
       output.shape = field_view.shape
 
-      # Perform the matrix transposition
-      output[:] = self.diff_solpt @ field_view + self.correction @ border_k_view
+      # Perform the matrix multiplications, directly into the output array
+      numpy.matmul(self.diff_solpt, field_view, out=output)
+      output += self.correction @ border_k_view
 
       # Reshape the output array back to its canonical extents
       output.shape = field_interior.shape
@@ -598,14 +602,12 @@ class DFROperators:
       field_interior_view = field_interior.view()
       field_interior_view.shape = (-1,grid.nbsolpts,grid.ni*grid.nj)
 
-      # Perform the extrapolations via matrix multiplication
-      border[:,0,:] = (self.extrap_down @ field_interior_view)
-      border[:,1,:] = (self.extrap_up @ field_interior_view)
+      # Perform the extrapolations (down and up) via a single matrix multiplication
+      border[:] = self.extrap_faces @ field_interior_view
 
-      if nbvars > 1:
-         border.shape = (nbvars,) + border_shape
-      else:
-         border.shape = border_shape
+      # field_interior.shape[0:-3] is (nbvars,) for many 3D fields (possibly with more leading dimensions), and ()
+      # for a single 3D field.
+      border.shape = tuple(field_interior.shape[0:-3]) + border_shape
       return border
 
    # Take the gradient of one or more variables, with output shape [3,nvars,ni,nj,nk]
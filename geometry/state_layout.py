@@ -0,0 +1,72 @@
+import math
+from typing import Tuple
+
+import numpy
+
+class StateLayout:
+   """
+   Memory layout of the state vector, as seen by the time integrators and their solvers.
+
+   The natural layout, (nb_var, n_1, ..., n_d), is the one used by the RHS functions, the filters and the output.
+   In it, the points of a given element are scattered over nbsolpts^(d-1) separate rows of every variable. The
+   element-blocked layout, (nb_elements, nb_var, nbsolpts^d), stores all variables of an element in one contiguous
+   block instead, so that element-wise work (and the blocks of an assembled Jacobian) touches contiguous memory.
+
+   The conversion happens at the boundary between the model and the integrators: the integrators (and everything
+   they call: RHS, preconditioners) work with the internal layout, while the rest of the model keeps the natural one.
+   With the natural layout, conversions are only reshapes.
+   """
+   layouts = ['natural', 'element']
+
+   def __init__(self, layout: str, natural_shape: Tuple[int, ...], nbsolpts: int) -> None:
+      if layout not in self.layouts:
+         raise ValueError(f'Unknown state layout "{layout}". Should be one of {self.layouts}')
+
+      self.layout        = layout
+      self.natural_shape = tuple(natural_shape)
+
+      nb_var, grid_shape = natural_shape[0], natural_shape[1:]
+      ndim = len(grid_shape)
+      if any(n % nbsolpts != 0 for n in grid_shape):
+         raise ValueError(f'State shape {natural_shape} is not made of elements with {nbsolpts} points per side')
+
+      nb_elements = [n // nbsolpts for n in grid_shape]
+
+      # (nb_var, E_1, p, E_2, p, ...) <-> (E_1, E_2, ..., nb_var, p, p, ...)
+      self.split_shape = (nb_var,) + tuple(x for e in nb_elements for x in (e, nbsolpts))
+      self.to_blocks   = tuple(range(1, 2 * ndim, 2)) + (0,) + tuple(range(2, 2 * ndim + 1, 2))
+      self.from_blocks = tuple(numpy.argsort(self.to_blocks))
+
+      if layout == 'natural':
+         self.internal_shape = self.natural_shape
+      else:
+         self.internal_shape = (math.prod(nb_elements), nb_var, nbsolpts ** ndim)
+
+   @property
+   def is_natural(self) -> bool:
+      return self.layout == 'natural'
+
+   @property
+   def size(self) -> int:
+      """Number of entries of a single state"""
+      return math.prod(self.natural_shape)
+
+   def batch_shape(self, vec: numpy.ndarray) -> Tuple[int, ...]:
+      """Leading (batch) dimension of the given vector: () for a single state, (nb_members,) for a batch of states,
+      in which case the first axis of vec is the member index."""
+      return () if vec.size == self.size else (vec.shape[0],)
+
+   def to_internal(self, vec: numpy.ndarray) -> numpy.ndarray:
+      """Convert a state (or a flattened state), or a batch of them, from the natural layout to the internal one."""
+      batch = self.batch_shape(vec)
+      if self.is_natural: return vec.reshape(batch + self.natural_shape)
+      axes = tuple(range(len(batch))) + tuple(i + len(batch) for i in self.to_blocks)
+      return vec.reshape(batch + self.split_shape).transpose(axes).reshape(batch + self.internal_shape)
+
+   def to_natural(self, vec: numpy.ndarray) -> numpy.ndarray:
+      """Convert a state (or a flattened state), or a batch of them, from the internal layout to the natural one."""
+      batch = self.batch_shape(vec)
+      if self.is_natural: return vec.reshape(batch + self.natural_shape)
+      blocks_shape = tuple(self.split_shape[i] for i in self.to_blocks)
+      axes = tuple(range(len(batch))) + tuple(i + len(batch) for i in self.from_blocks)
+      return vec.reshape(batch + blocks_shape).transpose(axes).reshape(batch + self.natural_shape)
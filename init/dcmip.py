@@ -637,7 +637,7 @@ def dcmip_schar_damping(forcing : numpy.ndarray, rho : numpy.ndarray,
    # Build the damping mask (eqn 79), weighted by ρ and τ0^(-1)
    damping_weight = rho/tau0*numpy.sin(numpy.pi/2*(z_3d - Zh)/(geom.ztop - Zh))**2 # z > zh, defined everywhere at first
    # Reset to 0 below the threshold height
-   damping_weight[z_3d <= Zh] = 0.0 
+   damping_weight[..., z_3d <= Zh] = 0.0 
 
    ## Temperature in 3D
    if (Ueq != 0):
@@ -5,13 +5,16 @@ from .epi            import Epi
 from .epi_stiff      import EpiStiff
 from .euler1         import Euler1
 from .imex2          import Imex2
+from .imex_ark       import ImexArk
 from .integrator     import Integrator
+from .parareal       import Parareal
 from .partrosexp2    import PartRosExp2
 from .ros2           import Ros2
 from .rosexp2        import RosExp2
-from .splitting      import StrangSplitting
+from .splitting      import LieSplitting, OperatorSplitting, OS22Splitting, StrangSplitting
 from .srerk          import Srerk
+from .step_controller import StepController
 from .tvdrk3         import Tvdrk3
 
-__all__ = ['Epi', 'EpiStiff', 'Euler1', 'Imex2', 'Integrator', 'PartRosExp2', 'Ros2', 'RosExp2', 'StrangSplitting',
-           'Srerk', 'Tvdrk3', 'BackwardEuler', 'CrankNicolson', 'Bdf2']
+__all__ = ['Epi', 'EpiStiff', 'Euler1', 'Imex2', 'ImexArk', 'Integrator', 'LieSplitting', 'OperatorSplitting', 'OS22Splitting',
+           'Parareal', 'PartRosExp2', 'Ros2', 'RosExp2', 'StrangSplitting', 'Srerk', 'StepController', 'Tvdrk3', 'BackwardEuler', 'CrankNicolson', 'Bdf2']
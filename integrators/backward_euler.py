@@ -7,8 +7,8 @@ from typing import Callable
 from mpi4py import MPI
 
 from common.program_options import Configuration
-from .integrator            import Integrator
-from solvers                import fgmres, matvec_rat, SolverInfo, newton_krylov
+from .integrator            import Integrator, SolutionPredictor
+from solvers                import fgmres, matvec_rat, SolverInfo, NewtonKrylov
 
 
 class BackwardEuler(Integrator):
@@ -16,6 +16,17 @@ class BackwardEuler(Integrator):
       super().__init__(param, preconditioner)
       self.rhs = rhs_handle
       self.tol = param.tolerance
+      self.newton = NewtonKrylov(param, fgmres_restart=30)
+      self.predictor = SolutionPredictor(param.predictor_order)
+
+   def checkpoint_data(self):
+      return self.predictor.checkpoint_data()
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.predictor.restore_checkpoint_data(arrays, scalars)
+
+   def reuses_linearization(self, dt):
+      return self.newton.reuses_linearization(dt)
 
    def BE_system(self, Q_plus, Q, dt, rhs):
       return (Q_plus - Q) / dt - rhs(Q_plus)
@@ -25,13 +36,13 @@ class BackwardEuler(Integrator):
 
       maxiter = None
       if self.preconditioner is not None:
-         self.preconditioner.prepare(dt, Q)
          maxiter = 800
 
       # Update solution
       t0 = time()
-      newQ, nb_iter, residuals = newton_krylov(BE_fun, Q, f_tol=self.tol, fgmres_restart=30,
-         fgmres_precond=self.preconditioner, verbose=False, maxiter=maxiter)
+      x0 = self.predictor.predict(Q, self.sim_time, dt)
+      newQ, nb_iter, residuals = self.newton.solve(BE_fun, x0, f_tol=self.tol, fgmres_precond=self.preconditioner,
+                                                   verbose=False, maxiter=maxiter, jacobian_key=dt)
       t1 = time()
 
       self.solver_info = SolverInfo(0, t1 - t0, nb_iter, residuals)
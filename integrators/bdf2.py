@@ -1,8 +1,9 @@
 import numpy
 from time import time
 
-from solvers      import newton_krylov
-from .integrator  import Integrator, SolverInfo
+from precondition.multigrid import Multigrid
+from solvers                import NewtonKrylov
+from .integrator            import Integrator, SolutionPredictor, SolverInfo
 
 class Bdf2(Integrator):
    def __init__(self, param, rhs, preconditioner=None, init_substeps=1):
@@ -10,8 +11,32 @@ class Bdf2(Integrator):
       self.rhs = rhs
       self.tol = param.tolerance
       self.init_substeps = init_substeps
+      self.newton = NewtonKrylov(param)
+      self.predictor = SolutionPredictor(param.predictor_order)
       self.Qprev = None
 
+   def checkpoint_data(self):
+      arrays, scalars = self.predictor.checkpoint_data()
+      if self.Qprev is not None:
+         arrays['Qprev'] = self.Qprev
+      return arrays, scalars
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.Qprev = arrays.get('Qprev')
+      self.predictor.restore_checkpoint_data(arrays, scalars)
+
+   def reuses_linearization(self, dt):
+      return self.newton.reuses_linearization(dt)
+
+   def prepare_preconditioner(self, Q_natural, dt):
+      # The initial (backward Euler) steps are not preconditioned, the other ones also need the previous state
+      if self.Qprev is None: return
+      if isinstance(self.preconditioner, Multigrid):
+         Qprev_natural = self.Qprev if self.state_layout is None else self.state_layout.to_natural(self.Qprev)
+         self.preconditioner.prepare(dt, Q_natural, Qprev_natural)
+      else:
+         super().prepare_preconditioner(Q_natural, dt)
+
    def __step__(self, Q, dt):
       t0 = time()
       if self.Qprev is None:
@@ -21,14 +46,16 @@ class Bdf2(Integrator):
             init_dt = dt / self.init_substeps
             nonlin_fun = lambda Q_plus: (Q_plus - newQ) / init_dt - 0.5 * self.rhs(Q_plus)
 
-            newQ, nb_iter, residuals = newton_krylov(nonlin_fun, newQ, f_tol=self.tol)
+            newQ, nb_iter, residuals = self.newton.solve(nonlin_fun, newQ, f_tol=self.tol,
+                                                         jacobian_key=('init', init_dt))
       else:
          maxiter = None
          def nonlin_fun(Q_plus): return (Q_plus - 4./3. * Q + 1./3. * self.Qprev) / dt - 2./3. * self.rhs(Q_plus)
          if self.preconditioner is not None:
-            self.preconditioner.prepare(dt, Q, self.Qprev)
             maxiter = 800
-         newQ, nb_iter, residuals = newton_krylov(nonlin_fun, Q, f_tol=self.tol, fgmres_precond=self.preconditioner, verbose=False, maxiter=maxiter)
+         x0 = self.predictor.predict(Q, self.sim_time, dt)
+         newQ, nb_iter, residuals = self.newton.solve(nonlin_fun, x0, f_tol=self.tol, fgmres_precond=self.preconditioner,
+                                                      verbose=False, maxiter=maxiter, jacobian_key=dt)
       t1 = time()
 
       self.solver_info = SolverInfo(0, t1 - t0, nb_iter, residuals)
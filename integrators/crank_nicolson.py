@@ -1,14 +1,25 @@
 import numpy
 from time import time
 
-from .integrator         import Integrator, SolverInfo
-from solvers             import newton_krylov
+from .integrator         import Integrator, SolutionPredictor, SolverInfo
+from solvers             import NewtonKrylov
 
 class CrankNicolson(Integrator):
    def __init__(self, param, rhs, preconditioner=None):
       super().__init__(param, preconditioner)
       self.rhs = rhs
       self.tol = param.tolerance
+      self.newton = NewtonKrylov(param, fgmres_restart=30)
+      self.predictor = SolutionPredictor(param.predictor_order)
+
+   def checkpoint_data(self):
+      return self.predictor.checkpoint_data()
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.predictor.restore_checkpoint_data(arrays, scalars)
+
+   def reuses_linearization(self, dt):
+      return self.newton.reuses_linearization(dt)
 
    def CN_system(self, Q_plus, Q, dt, rhs):
       return (Q_plus - Q) / dt - 0.5 * ( rhs(Q_plus) + rhs(Q) )
@@ -18,13 +29,13 @@ class CrankNicolson(Integrator):
 
       maxiter = None
       if self.preconditioner is not None:
-         self.preconditioner.prepare(dt, Q)
          maxiter = 800
 
       # Update solution
       t0 = time()
-      newQ, nb_iter, residuals = newton_krylov(CN_fun, Q, f_tol=self.tol, fgmres_restart=30,
-         fgmres_precond=self.preconditioner, verbose=False, maxiter=maxiter)
+      x0 = self.predictor.predict(Q, self.sim_time, dt)
+      newQ, nb_iter, residuals = self.newton.solve(CN_fun, x0, f_tol=self.tol, fgmres_precond=self.preconditioner,
+                                                   verbose=False, maxiter=maxiter, jacobian_key=dt)
       t1 = time()
 
       self.solver_info = SolverInfo(0, t1 - t0, nb_iter, residuals)
@@ -1,23 +1,23 @@
 from collections import deque
-import math
 from typing      import Callable
 
 from mpi4py      import MPI
 import numpy
 
 from common.program_options import Configuration
-from .integrator            import Integrator, SolverInfo
-from solvers                import kiops, matvec_fun, pmex
+from .integrator            import Integrator, SolverInfo, remainder_error_estimate, resample_history
+from solvers                import ExponentialSolver, matvec_block, matvec_fun
 
 class Epi(Integrator):
+   # Error estimate from the nonlinear remainder of the RHS
+   error_order = 3
+
    def __init__(self, param: Configuration, order: int, rhs: Callable, init_method=None, init_substeps: int = 1):
       super().__init__(param, preconditioner=None)
       self.rhs = rhs
       self.tol = param.tolerance
-      self.krylov_size = 1
       self.jacobian_method = param.jacobian_method
-      self.exponential_solver = param.exponential_solver
-      self.device = param.device
+      self.exp_solver = ExponentialSolver(param, mmin=16, mmax=64)
 
       if order == 2:
          self.A = numpy.array([[]])
@@ -58,13 +58,30 @@ class Epi(Integrator):
 
       self.init_substeps = init_substeps
 
+   def checkpoint_data(self):
+      arrays = {}
+      for i, (prev_Q, prev_rhs) in enumerate(zip(self.previous_Q, self.previous_rhs)):
+         arrays[f'previous_Q_{i}']   = prev_Q
+         arrays[f'previous_rhs_{i}'] = prev_rhs
+      scalars = {'dt': self.dt, 'num_previous': len(self.previous_Q),
+                 'exp_solver': self.exp_solver.state.checkpoint_data()}
+      return arrays, scalars
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.dt = scalars['dt']
+      if 'exp_solver' in scalars:
+         self.exp_solver.state.restore_checkpoint_data(scalars['exp_solver'])
+      self.previous_Q   = deque(arrays[f'previous_Q_{i}'] for i in range(scalars['num_previous']))
+      self.previous_rhs = deque(arrays[f'previous_rhs_{i}'] for i in range(scalars['num_previous']))
+
    def __step__(self, Q: numpy.ndarray, dt: float):
+      self.exp_solver.start_step()
 
-      # If dt changes, discard saved value and redo initialization
+      # If dt changes, interpolate the saved values at the new step size
       mpirank = MPI.COMM_WORLD.Get_rank()
       if self.dt and abs(self.dt - dt) > 1e-10:
-         self.previous_Q = deque()
-         self.previous_rhs = deque()
+         self.previous_Q   = deque(resample_history(Q, self.previous_Q, self.dt, dt))
+         self.previous_rhs = deque(self.rhs(prev_Q) for prev_Q in self.previous_Q)
       self.dt = dt
 
       # Initialize saved values using init_step method
@@ -84,35 +101,24 @@ class Epi(Integrator):
 
       vec = numpy.zeros((self.max_phi+1, rhs.size), like=rhs)
       vec[1,:] = rhs.flatten()
-      for i in range(self.n_prev):
-         J_deltaQ = matvec_fun(self.previous_Q[i] - Q, 1., Q, rhs, self.rhs, self.jacobian_method)
+      # J (y_{n-i} - y_n) for all previous steps at once, with a single (batched) RHS evaluation
+      if self.n_prev > 0:
+         J_deltaQ = matvec_block(numpy.stack([self.previous_Q[i] - Q for i in range(self.n_prev)]), 1., Q, rhs,
+                                 self.rhs, self.jacobian_method)
 
+      for i in range(self.n_prev):
          # R(y_{n-i})
-         r = (self.previous_rhs[i] - rhs) - numpy.reshape(J_deltaQ, Q.shape)
+         r = (self.previous_rhs[i] - rhs) - numpy.reshape(J_deltaQ[i], Q.shape)
 
          for k, alpha in enumerate(self.A[:,i],start=2):
             # v_k = Sum_{i=1}^{n_prev} A_{k,i} R(y_{n-i})
             vec[k,:] += alpha * r.flatten()
 
-      if self.exponential_solver == 'pmex':
-         phiv, stats = pmex([1.], matvec_handle, vec, tol=self.tol, mmax=64, task1=False)
+      phiv, stats = self.exp_solver([1.], matvec_handle, vec, tol=self.tol)
 
-         if mpirank == 0:
-            print(f'PMEX converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
-                  f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
-
-      else:
-         if self.device == "cuda":
-            from gef_cuda import kiops_cuda as f
-         else:
-            f = kiops
-         phiv, stats = f([1], matvec_handle, vec, tol=self.tol, m_init=self.krylov_size, mmin=16, mmax=64, task1=False)
-
-         self.krylov_size = math.floor(0.7 * stats[5] + 0.3 * self.krylov_size)
-
-         if mpirank == 0:
-            print(f'KIOPS converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
-                  f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
+      if mpirank == 0:
+         print(f'{self.exp_solver.name} converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
+               f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
 
       self.solver_info = SolverInfo(total_num_it = stats[2])
 
@@ -124,4 +130,9 @@ class Epi(Integrator):
          self.previous_rhs.appendleft(rhs)
 
       # Update solution
-      return Q + numpy.reshape(phiv, Q.shape) * dt
+      Q_new = Q + numpy.reshape(phiv, Q.shape) * dt
+
+      if self.step_controller is not None:
+         self.error_estimate = remainder_error_estimate(self.rhs, Q, rhs, Q_new, dt, self.jacobian_method)
+
+      return Q_new
@@ -1,22 +1,23 @@
 from collections  import deque
-import math
 
 import numpy
 from mpi4py       import MPI
 
 from common.program_options import Configuration
 from .epi            import Epi
-from .integrator     import Integrator, alpha_coeff
-from solvers         import kiops, matvec_fun, pmex
+from .integrator     import Integrator, alpha_coeff, remainder_error_estimate, resample_history
+from solvers         import ExponentialSolver, matvec_fun
 
 class EpiStiff(Integrator):
+   # Error estimate from the nonlinear remainder of the RHS
+   error_order = 3
+
    def __init__(self, param: Configuration, order: int, rhs, init_method=None, init_substeps: int = 1):
       super().__init__(param, preconditioner=None)
       self.rhs = rhs
       self.tol = param.tolerance
-      self.krylov_size = 1
       self.jacobian_method = param.jacobian_method
-      self.exponential_solver = param.exponential_solver
+      self.exp_solver = ExponentialSolver(param, mmin=16, mmax=64)
 
       if order < 2:
          raise ValueError('Unsupported order for EPI method')
@@ -37,13 +38,30 @@ class EpiStiff(Integrator):
 
       self.init_substeps = init_substeps
 
+   def checkpoint_data(self):
+      arrays = {}
+      for i, (prev_Q, prev_rhs) in enumerate(zip(self.previous_Q, self.previous_rhs)):
+         arrays[f'previous_Q_{i}']   = prev_Q
+         arrays[f'previous_rhs_{i}'] = prev_rhs
+      scalars = {'dt': self.dt, 'num_previous': len(self.previous_Q),
+                 'exp_solver': self.exp_solver.state.checkpoint_data()}
+      return arrays, scalars
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.dt = scalars['dt']
+      if 'exp_solver' in scalars:
+         self.exp_solver.state.restore_checkpoint_data(scalars['exp_solver'])
+      self.previous_Q   = deque(arrays[f'previous_Q_{i}'] for i in range(scalars['num_previous']))
+      self.previous_rhs = deque(arrays[f'previous_rhs_{i}'] for i in range(scalars['num_previous']))
+
    def __step__(self, Q: numpy.ndarray, dt: float):
+      self.exp_solver.start_step()
       mpirank = MPI.COMM_WORLD.Get_rank()
 
-      # If dt changes, discard saved value and redo initialization
+      # If dt changes, interpolate the saved values at the new step size
       if self.dt and abs(self.dt - dt) > 1e-10:
-         self.previous_Q = deque()
-         self.previous_rhs = deque()
+         self.previous_Q   = deque(resample_history(Q, self.previous_Q, self.dt, dt))
+         self.previous_rhs = deque(self.rhs(prev_Q) for prev_Q in self.previous_Q)
       self.dt = dt
 
       # Initialize saved values using init_step method
@@ -73,23 +91,11 @@ class EpiStiff(Integrator):
             # v_k = Sum_{i=1}^{n_prev} A_{k,i} R(y_{n-i})
             vec[k+3,:] += alpha * r.flatten()
 
-      if self.exponential_solver == 'pmex':
-
-         phiv, stats = pmex([1.], matvec_handle, vec, tol=self.tol, mmax=64, task1=False)
+      phiv, stats = self.exp_solver([1.], matvec_handle, vec, tol=self.tol)
 
-         if mpirank == 0:
-            print(f'PMEX converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
-                  f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
-
-      else:
-         phiv, stats = kiops([1], matvec_handle, vec, tol=self.tol, m_init=self.krylov_size, mmin=16, mmax=64,
-                             task1=False)
-
-         self.krylov_size = math.floor(0.7 * stats[5] + 0.3 * self.krylov_size)
-
-         if mpirank == 0:
-            print(f'KIOPS converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
-                  f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
+      if mpirank == 0:
+         print(f'{self.exp_solver.name} converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
+               f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
 
       # Save values for the next timestep
       if self.n_prev > 0:
@@ -99,4 +105,9 @@ class EpiStiff(Integrator):
          self.previous_rhs.appendleft(rhs)
 
       # Update solution
-      return Q + numpy.reshape(phiv, Q.shape) * dt
+      Q_new = Q + numpy.reshape(phiv, Q.shape) * dt
+
+      if self.step_controller is not None:
+         self.error_estimate = remainder_error_estimate(self.rhs, Q, rhs, Q_new, dt, self.jacobian_method)
+
+      return Q_new
@@ -4,7 +4,7 @@ from mpi4py import MPI
 
 from common.program_options import Configuration
 from .integrator     import Integrator
-from solvers         import newton_krylov
+from solvers         import NewtonKrylov
 
 class Imex2(Integrator):
    def __init__(self, param: Configuration, rhs_exp: Callable, rhs_imp: Callable):
@@ -13,11 +13,12 @@ class Imex2(Integrator):
       self.rhs_exp = rhs_exp
       self.rhs_imp = rhs_imp
       self.tol = param.tolerance
+      self.newton = NewtonKrylov(param)
 
    def __step__(self, Q, dt):
       rhs = Q + dt/2 * self.rhs_exp(Q)
       def g(v): return v - dt/2 * self.rhs_imp(v) - rhs
-      Y1, _, _ = newton_krylov(g, Q)
+      Y1, _, _ = self.newton.solve(g, Q, jacobian_key=dt)
 
       # Update solution
       return Q + dt * (self.rhs_imp(Y1) + self.rhs_exp(Y1))
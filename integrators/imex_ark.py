@@ -0,0 +1,167 @@
+import math
+from time   import time
+from typing import Callable, Dict, Tuple
+
+from mpi4py import MPI
+import numpy
+
+from common.program_options import Configuration
+from precondition.multigrid import Multigrid
+from .integrator            import Integrator, SolverInfo
+from solvers                import FgmresSolver, global_norm, matvec_fun
+
+# Butcher tables of the additive (IMEX) Runge-Kutta methods: (explicit A, explicit b, implicit A, implicit b). All
+# implicit tables are (E)SDIRK, with the same diagonal coefficient for every implicit stage.
+_ars_gamma = 1.0 - 1.0 / math.sqrt(2.0)
+_ars_delta = 1.0 - 1.0 / (2.0 * _ars_gamma)
+_ark3_gamma = 1767732205903 / 4055673282236
+_ark3_b = [1471266399579 / 7840856788654, -4482444167858 / 7529755066697, 11266239266428 / 11593286722821,
+           _ark3_gamma]
+_ark4_b = [82889 / 524892, 0.0, 15625 / 83664, 69875 / 102672, -2260 / 8211, 1 / 4]
+
+imex_tables: Dict[str, Tuple[list, list, list, list]] = {
+   # Ascher, Ruuth and Spiteri (1997), 2nd order, L-stable, stiffly accurate
+   'ars222': ([[0.0, 0.0, 0.0],
+               [_ars_gamma, 0.0, 0.0],
+               [_ars_delta, 1.0 - _ars_delta, 0.0]],
+              [_ars_delta, 1.0 - _ars_delta, 0.0],
+              [[0.0, 0.0, 0.0],
+               [0.0, _ars_gamma, 0.0],
+               [0.0, 1.0 - _ars_gamma, _ars_gamma]],
+              [0.0, 1.0 - _ars_gamma, _ars_gamma]),
+
+   # Kennedy and Carpenter (2003), ARK3(2)4L[2]SA
+   'ark3': ([[0.0, 0.0, 0.0, 0.0],
+             [1767732205903 / 2027836641118, 0.0, 0.0, 0.0],
+             [5535828885825 / 10492691773637, 788022342437 / 10882634858940, 0.0, 0.0],
+             [6485989280629 / 16251701735622, -4246266847089 / 9704473918619, 10755448449292 / 10357097424841, 0.0]],
+            _ark3_b,
+            [[0.0, 0.0, 0.0, 0.0],
+             [_ark3_gamma, _ark3_gamma, 0.0, 0.0],
+             [2746238789719 / 10658868560708, -640167445237 / 6845629431997, _ark3_gamma, 0.0],
+             _ark3_b],
+            _ark3_b),
+
+   # Kennedy and Carpenter (2003), ARK4(3)6L[2]SA
+   'ark4': ([[0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+             [1 / 2, 0.0, 0.0, 0.0, 0.0, 0.0],
+             [13861 / 62500, 6889 / 62500, 0.0, 0.0, 0.0, 0.0],
+             [-116923316275 / 2393684061468, -2731218467317 / 15368042101831, 9408046702089 / 11113171139209,
+              0.0, 0.0, 0.0],
+             [-451086348788 / 2902428689909, -2682348792572 / 7519795681897, 12662868775082 / 11960479115383,
+              3355817975965 / 11060851509271, 0.0, 0.0],
+             [647845179188 / 3216320057751, 73281519250 / 8382639484533, 552539513391 / 3454668386233,
+              3354512671639 / 8306763924573, 4040 / 17871, 0.0]],
+            _ark4_b,
+            [[0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+             [1 / 4, 1 / 4, 0.0, 0.0, 0.0, 0.0],
+             [8611 / 62500, -1743 / 31250, 1 / 4, 0.0, 0.0, 0.0],
+             [5012029 / 34652500, -654441 / 2922500, 174375 / 388108, 1 / 4, 0.0, 0.0],
+             [15267082809 / 155376265600, -71443401 / 120774400, 730878875 / 902184768, 2285395 / 8070912, 1 / 4,
+              0.0],
+             _ark4_b],
+            _ark4_b),
+}
+
+class ImexArk(Integrator):
+   """
+   Additive (IMEX) Runge-Kutta methods, described by a pair of Butcher tables: the explicit part of the RHS is
+   treated with an explicit method, and the implicit part with a (E)SDIRK method.
+
+   Every implicit stage solves Y - gamma dt f_imp(Y) = rhs_i. They all use the same linearization of the implicit
+   part (at the start of the step) and the same preconditioner, prepared once per step for I - gamma dt J_imp.
+   When the implicit part is linear (imex_linear_implicit), each stage needs a single linear solve; otherwise the
+   stage is solved with simplified Newton iterations (with that same linearization).
+   """
+   def __init__(self, param: Configuration, method: str, rhs_exp: Callable, rhs_imp: Callable,
+                preconditioner=None) -> None:
+      super().__init__(param, preconditioner)
+
+      if method not in imex_tables:
+         raise ValueError(f'Unknown IMEX method "{method}". Should be one of {list(imex_tables.keys())}')
+
+      A_exp, b_exp, A_imp, b_imp = imex_tables[method]
+      self.A_exp = numpy.array(A_exp)
+      self.b_exp = numpy.array(b_exp)
+      self.A_imp = numpy.array(A_imp)
+      self.b_imp = numpy.array(b_imp)
+      self.num_stages = len(self.b_exp)
+      self.gamma = self.A_imp[-1, -1]
+
+      self.rhs_exp = rhs_exp
+      self.rhs_imp = rhs_imp
+      self.tol     = param.tolerance
+      self.gmres_restart   = param.gmres_restart
+      self.jacobian_method = param.jacobian_method
+      self.linear_implicit = param.imex_linear_implicit
+      self.max_newton_iter = 20
+      self.fgmres = FgmresSolver()
+
+   def prepare_preconditioner(self, Q_natural: numpy.ndarray, dt: float) -> None:
+      # The multigrid preconditioner approximates the system of the implicit stages, I - gamma dt J_imp. Its levels
+      # solve I - dt/2 J_imp (like for ros2), hence the factor 2.
+      if isinstance(self.preconditioner, Multigrid):
+         self.preconditioner.prepare(2.0 * self.gamma * dt, Q_natural)
+      else:
+         super().prepare_preconditioner(Q_natural, dt)
+
+   def __step__(self, Q: numpy.ndarray, dt: float):
+      t0 = time()
+      flag, total_num_it, iterations = 0, 0, []
+
+      maxiter = 20000 // self.gmres_restart
+      if self.preconditioner is not None:
+         maxiter = 400 // self.gmres_restart
+
+      # Linearization of the implicit part at Q, shared by all the implicit stages
+      rhs_imp_Q = self.rhs_imp(Q)
+      gamma_dt = self.gamma * dt
+      def A(v): return v - matvec_fun(v, gamma_dt, Q, rhs_imp_Q, self.rhs_imp, self.jacobian_method)
+
+      f_exp = []
+      f_imp = []
+      Y = Q
+      for i in range(self.num_stages):
+         rhs_i = Q + dt * sum(self.A_exp[i, j] * f_exp[j] + self.A_imp[i, j] * f_imp[j] for j in range(i))
+
+         if self.A_imp[i, i] == 0.0:
+            Y = rhs_i
+         else:
+            # Solve Y - gamma dt f_imp(Y) = rhs_i. With a linear implicit part, a single solve from Q is exact.
+            if self.linear_implicit:
+               Y, G = Q, Q - gamma_dt * rhs_imp_Q - rhs_i
+            else:
+               G = Y - gamma_dt * self.rhs_imp(Y) - rhs_i
+
+            # The tolerance is relative to the stage value (like for the other implicit integrators), rather than to
+            # the (much smaller) residual G
+            norm_rhs = global_norm(numpy.ravel(rhs_i))
+            norm_G   = global_norm(numpy.ravel(G))
+            for _ in range(self.max_newton_iter):
+               linsol_tol = min(0.5, self.tol * norm_rhs / norm_G) if norm_G > 0.0 else self.tol
+               delta, norm_r, norm_b, num_iter, linsol_flag, residuals = self.fgmres(
+                  A, -numpy.ravel(G), tol=linsol_tol, restart=self.gmres_restart, maxiter=maxiter,
+                  preconditioner=self.preconditioner, verbose=self.verbose_solver)
+               flag = min(flag, linsol_flag)
+               total_num_it += num_iter
+               iterations += residuals
+
+               Y = Y + numpy.reshape(delta, Q.shape)
+               if self.linear_implicit: break
+
+               G = Y - gamma_dt * self.rhs_imp(Y) - rhs_i
+               norm_G = global_norm(numpy.ravel(G))
+               if norm_G <= self.tol * norm_rhs: break
+            else:
+               flag = -1 # The Newton iterations did not converge
+
+         f_exp.append(self.rhs_exp(Y))
+         f_imp.append(rhs_imp_Q if i == 0 and self.A_imp[0, 0] == 0.0 else self.rhs_imp(Y))
+
+      t1 = time()
+      self.solver_info = SolverInfo(flag, t1 - t0, total_num_it, iterations)
+      if MPI.COMM_WORLD.rank == 0:
+         result_type = 'convergence' if flag == 0 else 'stagnation/interruption'
+         print(f'IMEX step: {result_type} after {total_num_it} FGMRES iterations in {t1 - t0:4.3f} s')
+
+      return Q + dt * sum(self.b_exp[i] * f_exp[i] + self.b_imp[i] * f_imp[i] for i in range(self.num_stages))
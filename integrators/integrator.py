@@ -2,16 +2,21 @@ from abc       import ABC, abstractmethod
 from itertools import combinations
 import math
 from time      import time
-from typing    import Optional
+from typing    import Any, Dict, List, Optional, Sequence, Tuple
 import sys
 
+from mpi4py import MPI
 import numpy
 
+from common.profiler        import profiler
 from common.program_options import Configuration
+from geometry               import StateLayout
 from precondition.factorization import Factorization
 from precondition.multigrid import Multigrid
 from output.output_manager  import OutputManager
+from solvers.matvec         import matvec_fun
 from solvers.solver_info    import SolverInfo
+from .step_controller       import StepController
 
 class Integrator(ABC):
    """Describes the time-stepping mechanism of the simulation.
@@ -27,21 +32,42 @@ class Integrator(ABC):
                         to self.solver_info
       preconditioner -- Optional object that can be used to precondition a problem. It must provide a "prepare"
                         and a "__call__" method.
+      state_layout   -- Optional StateLayout of the vectors seen by the integrator (and by the RHS functions it was
+                        given). When present, step() converts the state from the natural layout before stepping, and
+                        converts the result back. Like output_manager, it must be assigned after initialization.
+      step_controller -- Optional StepController that adapts the step size. When present (assigned after
+                        initialization), step() may take a shorter step than requested, retrying until the local error
+                        estimate is small enough. The step actually taken is latest_dt, and the suggested size of the
+                        next one is step_controller.dt_next.
+      error_estimate -- Local error estimate of the latest step (same shape as the state), for integrators that
+                        provide one, with err ~ dt^error_order. It is only needed when a step controller is present.
 
    """
    latest_time: float
+   latest_dt: float
+   error_order: Optional[int] = None
    output_manager: Optional[OutputManager]
    preconditioner: Optional[Multigrid]
    solver_info: Optional[SolverInfo]
+   state_layout: Optional[StateLayout]
+   step_controller: Optional[StepController]
+   error_estimate: Optional[numpy.ndarray]
    def __init__(self, param: Configuration, preconditioner: Optional[Multigrid]) -> None:
       self.output_manager = None
       self.preconditioner = preconditioner
       self.verbose_solver = param.verbose_solver
       self.solver_info    = None
+      self.state_layout   = None
+      self.step_controller = None
+      self.error_estimate  = None
       self.sim_time       = -1.0
       self.failure_flag   = 0
       self.num_completed_steps = 0
 
+      # Number of steps for which the current preconditioner was kept, and at most how many in a row
+      self.preconditioner_age     = 0
+      self.preconditioner_max_age = param.newton_jacobian_max_age
+
    @abstractmethod
    def __step__(self, Q: numpy.ndarray, dt: float) -> numpy.ndarray:
       pass
@@ -49,34 +75,48 @@ class Integrator(ABC):
    def __prestep__(self, Q: numpy.ndarray, dt: float) -> None:
       pass
 
+   def checkpoint_data(self) -> Tuple[Dict[str, numpy.ndarray], Dict[str, Any]]:
+      """Internal data (other than the state vector) needed to restart this integrator exactly from a checkpoint.
+
+      Returns a set of named arrays, which must all have the same shape as the state vector (in the internal layout),
+      and a set of named (JSON-serializable) scalars. Integrators that keep no history between steps don't need to override this."""
+      return {}, {}
+
+   def restore_checkpoint_data(self, arrays: Dict[str, numpy.ndarray], scalars: Dict[str, Any]) -> None:
+      """Restore the internal data that was saved with checkpoint_data."""
+      pass
+
+   @profiler.profile()
    def step(self, Q: numpy.ndarray, dt: float):
       """ Advance the system forward in time """
       t0 = time()
 
-      self.__prestep__(Q, dt)
-
-      if self.preconditioner is not None:
-         if isinstance(self.preconditioner, Multigrid):
-            self.preconditioner.prepare(dt, Q)
-         elif isinstance(self.preconditioner, Factorization):
-            if hasattr(self, 'A'):
-               self.preconditioner.prepare(self.A)
-            else:
-               print(f'Trying to use a factorization-based preconditioner, but you didn\'t provide a matrix'
-                     f'(must define it in the __prestep__ method of your integrator)')
+      Q_natural = Q
+      if self.state_layout is not None:
+         Q = self.state_layout.to_internal(Q)
 
       # The stepping itself
-      result = self.__step__(Q, dt)
+      num_rejected = 0
+      if self.step_controller is None:
+         result = self._try_step(Q_natural, Q, dt, prepare_preconditioner=self._must_prepare_preconditioner(dt))
+      else:
+         result, dt, num_rejected = self._adaptive_step(Q_natural, Q, dt)
+
+      if self.state_layout is not None:
+         result = self.state_layout.to_natural(result)
 
       t1 = time()
       self.latest_time = t1 - t0
+      self.latest_dt   = dt
 
       # Output info from completed step (if possible)
       if self.output_manager is not None:
          if self.solver_info is not None:
-            self.output_manager.store_solver_stats(t1 - t0, self.sim_time, dt, self.solver_info, self.preconditioner)
+            self.output_manager.store_solver_stats(t1 - t0, self.sim_time, dt, self.solver_info, self.preconditioner,
+                                                   num_rejected)
          else:
-            self.output_manager.store_solver_stats(t1 - t0, self.sim_time, dt, SolverInfo(), self.preconditioner)
+            self.output_manager.store_solver_stats(t1 - t0, self.sim_time, dt, SolverInfo(), self.preconditioner,
+                                                   num_rejected)
       self.solver_info = None
 
       self.sim_time += dt
@@ -84,6 +124,73 @@ class Integrator(ABC):
 
       return result
 
+   def _try_step(self, Q_natural: numpy.ndarray, Q: numpy.ndarray, dt: float, prepare_preconditioner: bool = True) \
+         -> numpy.ndarray:
+      """Perform one step of size dt (including its preparation), in the integrator's layout. The preconditioner is
+      not prepared again if prepare_preconditioner is False (when the caller knows it is still valid)."""
+      self.__prestep__(Q, dt)
+
+      if self.preconditioner is not None and prepare_preconditioner:
+         self.prepare_preconditioner(Q_natural, dt)
+
+      return self.__step__(Q, dt)
+
+   def reuses_linearization(self, dt: float) -> bool:
+      """Whether a step of size dt will start with the linearization of the previous step. Only the integrators with a
+      persistent Newton solver can reuse their linearization."""
+      return False
+
+   def _must_prepare_preconditioner(self, dt: float) -> bool:
+      """Whether the preconditioner must be prepared for a step of size dt. When the step reuses the linearization of
+      the previous one, the preconditioner is kept as well, for at most newton_jacobian_max_age steps in a row (the
+      Newton solver itself may update its linearization during every step)."""
+      if self.reuses_linearization(dt) and self.preconditioner_age < self.preconditioner_max_age:
+         self.preconditioner_age += 1
+         return False
+
+      self.preconditioner_age = 0
+      return True
+
+   def prepare_preconditioner(self, Q_natural: numpy.ndarray, dt: float) -> None:
+      """Prepare the preconditioner for a step of size dt that starts from Q_natural. The state is given in the natural
+      layout, which is the one the preconditioners work with."""
+      if isinstance(self.preconditioner, Multigrid):
+         self.preconditioner.prepare(dt, Q_natural)
+      elif isinstance(self.preconditioner, Factorization):
+         if hasattr(self, 'A'):
+            self.preconditioner.prepare(self.A)
+         else:
+            print(f'Trying to use a factorization-based preconditioner, but you didn\'t provide a matrix'
+                  f'(must define it in the __prestep__ method of your integrator)')
+
+   def _adaptive_step(self, Q_natural: numpy.ndarray, Q: numpy.ndarray, dt: float) \
+         -> Tuple[numpy.ndarray, float, int]:
+      """Perform one step, starting with size dt and shortening it until its error estimate is accepted by the step
+      controller. The integrator history is restored (with the checkpoint mechanism) before each new attempt.
+      Returns the new state, the size of the step that was taken and the number of rejected attempts."""
+      history = self.checkpoint_data()
+      num_rejected = 0
+      while True:
+         self.error_estimate = None
+         result = self._try_step(Q_natural, Q, dt, prepare_preconditioner=self._must_prepare_preconditioner(dt))
+
+         # Some steps (e.g. initialization of multistep methods) don't provide any estimate
+         if self.error_estimate is None or self.error_order is None:
+            return result, dt, num_rejected
+
+         error = self.step_controller.error_norm(self.error_estimate, Q, result)
+         accepted, next_dt = self.step_controller.update(error, dt, self.error_order)
+         if accepted:
+            if MPI.COMM_WORLD.rank == 0:
+               print(f'Step accepted with dt = {dt:.4g} (error {error:.2e}), next dt = {next_dt:.4g}')
+            return result, dt, num_rejected
+
+         if MPI.COMM_WORLD.rank == 0:
+            print(f'Step rejected with dt = {dt:.4g} (error {error:.2e}), retrying with dt = {next_dt:.4g}')
+         self.restore_checkpoint_data(*history)
+         num_rejected += 1
+         dt = next_dt
+
 class scipy_counter: # TODO : tempo
    """Callback object for linear solvers (from Scipy and others)."""
    def __init__(self, disp=False):
@@ -112,3 +219,76 @@ def alpha_coeff(c):
          alpha[k, i] = (-1) ** (m - k + 1) * math.factorial(k + 2) * sp / denom
 
    return alpha
+
+def resample_history(Q: numpy.ndarray, history: Sequence[numpy.ndarray], dt_old: float, dt_new: float) \
+      -> List[numpy.ndarray]:
+   """Values at times t - i * dt_new (i = 1, ..., len(history)) of the polynomial that interpolates the current state
+   Q (at time t) and the previous states in history (at times t - i * dt_old). This keeps the history of a multistep
+   method valid when the step size changes."""
+   nodes  = [-j * dt_old for j in range(len(history) + 1)]
+   values = [Q] + list(history)
+
+   resampled = []
+   for i in range(1, len(history) + 1):
+      weights = lagrange_weights(nodes, -i * dt_new)
+      resampled.append(sum(w * v for w, v in zip(weights, values)))
+
+   return resampled
+
+def lagrange_weights(nodes: Sequence[float], s: float) -> List[float]:
+   """Weights of the values at the given nodes in the value at s of their interpolating polynomial."""
+   return [math.prod((s - nodes[m]) / (nodes[j] - nodes[m]) for m in range(len(nodes)) if m != j)
+           for j in range(len(nodes))]
+
+class SolutionPredictor:
+   """
+   Short history of the states at the start of the previous steps, used to predict the solution of the next step as
+   an initial guess for the linear or nonlinear solver of an implicit integrator.
+
+   The prediction is the value at t + dt of the polynomial (of degree up to `order`) that interpolates the current
+   state (at time t) and the previous ones. With order 0, it is the current state (what the solvers used before).
+   The states are recorded with their simulation time, so a step that is retried (with the same initial state) does
+   not add anything to the history. At most max(order + 1, num_states) of them are kept.
+   """
+   def __init__(self, order: int, num_states: int = 0) -> None:
+      self.order      = order
+      self.num_states = max(order + 1, num_states)
+      self.times:  List[float]         = []
+      self.states: List[numpy.ndarray] = []
+
+   def predict(self, Q: numpy.ndarray, t: float, dt: float) -> numpy.ndarray:
+      """Record the state Q at time t, and predict the state at time t + dt."""
+      while len(self.times) > 0 and self.times[-1] >= t:
+         self.times.pop()
+         self.states.pop()
+      self.times.append(t)
+      self.states.append(Q.copy())
+      del self.times[:-self.num_states]
+      del self.states[:-self.num_states]
+
+      num_points = min(len(self.states), self.order + 1)
+      if num_points == 1: return Q
+
+      nodes = [time_i - t for time_i in self.times[-num_points:]]
+      return sum(w * state for w, state in zip(lagrange_weights(nodes, dt), self.states[-num_points:]))
+
+   def previous_states(self) -> List[numpy.ndarray]:
+      """The recorded states, most recent first"""
+      return self.states[::-1]
+
+   def checkpoint_data(self) -> Tuple[Dict[str, numpy.ndarray], Dict[str, Any]]:
+      return {f'predictor_state_{i}': state for i, state in enumerate(self.states)}, {'predictor_times': self.times}
+
+   def restore_checkpoint_data(self, arrays: Dict[str, numpy.ndarray], scalars: Dict[str, Any]) -> None:
+      self.times  = list(scalars.get('predictor_times', []))
+      self.states = [arrays[f'predictor_state_{i}'] for i in range(len(self.times))]
+
+def remainder_error_estimate(rhs_handle, Q: numpy.ndarray, rhs: numpy.ndarray, Q_new: numpy.ndarray, dt: float,
+                             jacobian_method: str = 'complex') -> numpy.ndarray:
+   """Local error estimate for integrators that treat the linearization of the RHS at Q exactly (or with a stable
+   approximation), like exponential and Rosenbrock methods: dt/2 * R(Q_new), where
+   R(Q_new) = f(Q_new) - f(Q) - J(Q) (Q_new - Q) is the nonlinear remainder. Unlike the difference with an explicit
+   solution, it does not contain the stiff linear part of the RHS. It is O(dt^3), and costs two RHS evaluations."""
+   delta_Q = Q_new - Q
+   J_delta_Q = numpy.reshape(matvec_fun(delta_Q, 1., Q, rhs, rhs_handle, jacobian_method), Q.shape)
+   return 0.5 * dt * (rhs_handle(Q_new) - rhs - J_delta_Q)
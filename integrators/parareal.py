@@ -0,0 +1,155 @@
+from time   import time
+from typing import Callable, List, Optional, Tuple
+
+from mpi4py import MPI
+import numpy
+
+from common.program_options import Configuration
+from solvers                import global_norm
+from .integrator            import Integrator
+
+class Parareal:
+   """
+   Parallel-in-time driver. A time window is divided into as many consecutive slices as there are PEs in the time
+   communicator, and every slice is advanced by its own group of PEs (which share the spatial domain, see
+   common.parallel.split_world). Each slice has two propagators, built on ordinary integrators:
+   - the fine one, which takes fine_steps steps of size dt over the slice (the solution we want);
+   - the coarse one, a cheaper integrator that crosses the slice in coarse_steps (larger) steps.
+
+   The Parareal iteration starts from a sequential coarse prediction of the slice boundaries, then repeats
+      U_{n+1}^{k+1} = G(U_n^{k+1}) + F(U_n^k) - G(U_n^k),
+   where the fine propagations F are all performed concurrently, and only the (cheap) coarse corrections G are
+   sequential. After iteration k, the first k + 1 slices are exact, so max_iter = number of slices reproduces the
+   sequential fine solution exactly (but without any speedup). The iteration stops when no slice boundary changes by
+   more than tol (relative) from one iteration to the next.
+
+   Every propagation starts with the initial history of its integrator, since a slice does not know the previous steps
+   of its predecessor: multistep methods are (re)started at the beginning of each slice.
+   """
+   def __init__(self,
+                param: Configuration,
+                fine: Integrator,
+                coarse: Integrator,
+                time_comm: MPI.Comm,
+                post_step: Optional[Callable[[numpy.ndarray, float], numpy.ndarray]] = None) -> None:
+      self.fine      = fine
+      self.coarse    = coarse
+      self.time_comm = time_comm
+      self.post_step = post_step
+
+      self.num_slices   = time_comm.size
+      self.slice_id     = time_comm.rank
+      self.fine_steps   = param.parareal_fine_steps
+      self.coarse_steps = param.parareal_coarse_steps
+      self.max_iter     = min(param.parareal_max_iter, self.num_slices) if param.parareal_max_iter > 0 \
+                          else self.num_slices
+      self.tol          = param.parareal_tol
+
+      # History of the integrators before their first step, restored before every propagation
+      self.fine_history   = fine.checkpoint_data()
+      self.coarse_history = coarse.checkpoint_data()
+
+      self.num_iterations = 0
+
+   @property
+   def window_steps(self) -> int:
+      """Number of fine steps in a full time window"""
+      return self.num_slices * self.fine_steps
+
+   def slice_steps(self, slice_id: int, remaining_steps: int) -> int:
+      """Number of fine steps of the given slice, when there are only remaining_steps left to do (the last window
+      may be shorter, in which case the last slices are empty)"""
+      return min(max(remaining_steps - slice_id * self.fine_steps, 0), self.fine_steps)
+
+   def _propagate(self, integrator: Integrator, history: Tuple, Q: numpy.ndarray, t: float, dt: float,
+                  num_steps: int, last_dt: float) -> numpy.ndarray:
+      integrator.restore_checkpoint_data(*history)
+      integrator.sim_time = t
+      for i in range(num_steps):
+         step_dt = last_dt if i == num_steps - 1 else dt
+         Q = integrator.step(Q, step_dt)
+         if self.post_step is not None:
+            Q = self.post_step(Q, step_dt)
+      return Q
+
+   def _fine(self, Q: numpy.ndarray, t: float, dt: float, num_steps: int, last_dt: float) -> numpy.ndarray:
+      return self._propagate(self.fine, self.fine_history, Q, t, dt, num_steps, last_dt)
+
+   def _coarse(self, Q: numpy.ndarray, t: float, dt: float, num_steps: int, last_dt: float) -> numpy.ndarray:
+      """Cross the same time span as the fine propagator (including its shorter last step, if any)"""
+      if num_steps == 0: return Q
+      coarse_dt = ((num_steps - 1) * dt + last_dt) / self.coarse_steps
+      return self._propagate(self.coarse, self.coarse_history, Q, t, coarse_dt, self.coarse_steps, coarse_dt)
+
+   def _send(self, Q: numpy.ndarray, tag: int) -> None:
+      if self.slice_id < self.num_slices - 1:
+         self.time_comm.Send(numpy.ascontiguousarray(Q), dest=self.slice_id + 1, tag=tag)
+
+   def _recv(self, like: numpy.ndarray, tag: int) -> numpy.ndarray:
+      Q = numpy.empty_like(like)
+      self.time_comm.Recv(Q, source=self.slice_id - 1, tag=tag)
+      return Q
+
+   def advance(self, Q0: numpy.ndarray, t0: float, dt: float, remaining_steps: int, t_end: float) \
+         -> Tuple[numpy.ndarray, Optional[List[numpy.ndarray]]]:
+      """Advance the state Q0 (known by every slice) over one time window starting at t0, with at most
+      remaining_steps fine steps of size dt. Like in the sequential time loop, the very last step of the simulation is
+      shortened so that it ends at t_end.
+
+      Returns the state at the end of the window (on every slice) and, on the first slice only, the list of states at
+      the end of each slice (None on the other slices)."""
+      t_start = time()
+      n = self.slice_id
+      num_steps = self.slice_steps(n, remaining_steps)
+      t = t0 + n * self.fine_steps * dt
+      # Only the slice that ends the simulation may have a shorter last step
+      last_dt = dt
+      if num_steps > 0 and n * self.fine_steps + num_steps == remaining_steps:
+         last_dt = t_end - (t + (num_steps - 1) * dt)
+
+      # Coarse prediction of the start of each slice, passed from one slice to the next
+      U = Q0 if n == 0 else self._recv(Q0, tag=0)
+      G_old = self._coarse(U, t, dt, num_steps, last_dt)
+      self._send(G_old, tag=0)
+      slice_end = G_old
+
+      self.num_iterations = 0
+      for k in range(self.max_iter):
+         # Slices before k have converged (their start is exact), they have nothing left to do
+         if n >= k:
+            F_U = self._fine(U, t, dt, num_steps, last_dt)
+
+         if n > k:
+            U = self._recv(Q0, tag=k + 1)
+            G_new = self._coarse(U, t, dt, num_steps, last_dt)
+            new_end = G_new + F_U - G_old
+            G_old = G_new
+         elif n == k:
+            new_end = F_U
+         else:
+            new_end = slice_end
+
+         if n >= k: self._send(new_end, tag=k + 1)
+
+         norm_end = global_norm(numpy.ravel(new_end))
+         change = global_norm(numpy.ravel(new_end - slice_end)) / norm_end if norm_end > 0.0 else 0.0
+         slice_end = new_end
+         self.num_iterations = k + 1
+
+         max_change = self.time_comm.allreduce(change, op=MPI.MAX)
+         if MPI.COMM_WORLD.rank == 0:
+            print(f'Parareal iteration {k + 1}: largest relative change of a slice boundary {max_change:.2e}')
+         if max_change <= self.tol: break
+
+      # The first slice collects the end of every slice, and every slice gets the end of the window
+      slice_end = numpy.ascontiguousarray(slice_end)
+      all_ends = numpy.empty((self.num_slices,) + slice_end.shape, dtype=slice_end.dtype) if n == 0 else None
+      self.time_comm.Gather(slice_end, all_ends, root=0)
+
+      Q_end = numpy.empty_like(slice_end) if n != self.num_slices - 1 else slice_end
+      self.time_comm.Bcast(Q_end, root=self.num_slices - 1)
+
+      if MPI.COMM_WORLD.rank == 0:
+         print(f'Parareal window: {self.num_iterations} iterations in {time() - t_start:.3f} s')
+
+      return Q_end, (list(all_ends) if n == 0 else None)
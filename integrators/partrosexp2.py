@@ -7,7 +7,7 @@ from scipy.sparse.linalg import LinearOperator
 
 from common.program_options import Configuration
 from .integrator            import Integrator, SolverInfo
-from solvers                import fgmres, matvec_fun, pmex
+from solvers                import ExpSolverState, FgmresSolver, matvec_fun, pmex
 
 class PartRosExp2(Integrator):
    def __init__(self, param: Configuration, rhs_full: Callable, rhs_imp: Callable, preconditioner):
@@ -17,6 +17,8 @@ class PartRosExp2(Integrator):
       self.rhs_imp = rhs_imp
       self.tol = param.tolerance
       self.gmres_restart = param.gmres_restart
+      self.pmex_state = ExpSolverState(krylov_size=10, mmin=1, mmax=128, smooth_krylov_size=False)
+      self.fgmres = FgmresSolver()
 
    def __step__(self, Q: numpy.ndarray, dt: float):
 
@@ -37,7 +39,9 @@ class PartRosExp2(Integrator):
       vec[1,:] = f_exp.copy()
 
       tic = time()
-      phiv, stats = pmex([1.], J_exp, vec, tol=self.tol,task1=False)
+      phiv, stats = pmex([1.], J_exp, vec, tol=self.tol, m_init=self.pmex_state.krylov_size,
+                         mmax=self.pmex_state.mmax, task1=False, state=self.pmex_state)
+      self.pmex_state.update(stats[5])
       time_exp = time() - tic
       if MPI.COMM_WORLD.rank == 0:
          print(f'PMEX convergence at iteration {stats[2]} (using {stats[0]} internal substeps and {stats[1]} rejected expm)')
@@ -47,7 +51,7 @@ class PartRosExp2(Integrator):
          return v - J_imp(v) / 2
       b = ( A(Q_flat) + (phiv + 0.5 * f_imp) * dt ).flatten()
       Q_x0 = Q_flat.copy()
-      Qnew, norm_r, norm_b, num_iter, flag, residuals = fgmres(
+      Qnew, norm_r, norm_b, num_iter, flag, residuals = self.fgmres(
          A, b, x0=Q_x0, tol=self.tol, restart=self.gmres_restart, maxiter=None, preconditioner=self.preconditioner,
          verbose=self.verbose_solver)
       time_imp = time() - tic
@@ -5,11 +5,14 @@ import numpy
 from mpi4py import MPI
 
 from common.program_options  import Configuration
-from solvers                 import fgmres, MatvecOpRat, SolverInfo
-from .integrator             import Integrator
-from solvers                 import fgmres, gcrot, matvec_rat, SolverInfo
+from solvers                 import FgmresSolver, MatvecOpRat, SolverInfo
+from .integrator             import Integrator, SolutionPredictor, remainder_error_estimate
+from solvers                 import gcrot, matvec_rat, projected_initial_guess, SolverInfo
 
 class Ros2(Integrator):
+   # Error estimate from the nonlinear remainder of the RHS
+   error_order = 3
+
    Q_flat: numpy.ndarray
    A: MatvecOpRat
    b: numpy.ndarray
@@ -19,23 +22,38 @@ class Ros2(Integrator):
       self.tol            = param.tolerance
       self.gmres_restart  = param.gmres_restart
       self.linear_solver  = param.linear_solver
+      self.jacobian_method = param.jacobian_method
+      self.fgmres = FgmresSolver()
+      self.predictor = SolutionPredictor(param.predictor_order, param.predictor_projection)
+      self.num_projection = param.predictor_projection
+
+   def checkpoint_data(self):
+      return self.predictor.checkpoint_data()
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      self.predictor.restore_checkpoint_data(arrays, scalars)
 
    def __prestep__(self, Q: numpy.ndarray, dt: float) -> None:
       rhs = self.rhs_handle(Q)
+      self.rhs = rhs
       self.Q_flat = numpy.ravel(Q)
       self.A = MatvecOpRat(dt, Q, rhs, self.rhs_handle)
       self.b = self.A(self.Q_flat) + numpy.ravel(rhs) * dt
 
    def __step__(self, Q: numpy.ndarray, dt: float):
 
+      x0 = numpy.ravel(self.predictor.predict(Q, self.sim_time, dt))
+      if self.num_projection > 0:
+         x0 = projected_initial_guess(self.A, self.b, self.predictor.previous_states()[:self.num_projection])
+
       maxiter = 20000 // self.gmres_restart
       if self.preconditioner is not None:
          maxiter = 400 // self.gmres_restart
 
       if self.linear_solver == 'fgmres':
          t0 = time()
-         Qnew, norm_r, norm_b, num_iter, flag, residuals = fgmres(
-            self.A, self.b, x0=self.Q_flat, tol=self.tol, restart=self.gmres_restart, maxiter=maxiter,
+         Qnew, norm_r, norm_b, num_iter, flag, residuals = self.fgmres(
+            self.A, self.b, x0=x0, tol=self.tol, restart=self.gmres_restart, maxiter=maxiter,
             preconditioner=self.preconditioner,
             verbose=self.verbose_solver)
          t1 = time()
@@ -48,7 +66,7 @@ class Ros2(Integrator):
                   f' relative residual {norm_r/norm_b : .2e}')
       else:
          t0 = time()
-         Qnew, local_error, num_iter, flag, residuals = gcrot(self.A, self.b, x0=self.Q_flat, tol=self.tol)
+         Qnew, local_error, num_iter, flag, residuals = gcrot(self.A, self.b, x0=x0, tol=self.tol)
          t1 = time()
          local_error = numpy.linalg.norm(self.b - self.A(Qnew))/numpy.linalg.norm(self.b)
 
@@ -62,4 +80,8 @@ class Ros2(Integrator):
 
       self.failure_flag = flag
 
-      return numpy.reshape(Qnew, Q.shape)
+      Qnew = numpy.reshape(Qnew, Q.shape)
+      if self.step_controller is not None:
+         self.error_estimate = remainder_error_estimate(self.rhs_handle, Q, self.rhs, Qnew, dt, self.jacobian_method)
+
+      return Qnew
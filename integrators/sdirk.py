@@ -32,7 +32,6 @@ class SDIRKLstable(Integrator):
 
       maxiter = None
       if self.preconditioner is not None:
-         self.preconditioner.prepare(dt, Q)
          maxiter = 800
 
       # Update solution
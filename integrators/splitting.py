@@ -1,43 +1,96 @@
+from time   import time
+from typing import Sequence
+
+import numpy
+
 from common.program_options import Configuration
-from .integrator            import Integrator
+from .integrator            import Integrator, SolverInfo
 
-class LieSplitting(Integrator):
-   def __init__(self, param: Configuration, scheme1: Integrator, scheme2: Integrator):
+class OperatorSplitting(Integrator):
+   """
+   Operator splitting method described by a table of coefficients: for each stage (row), every sub-integrator (column)
+   with a nonzero coefficient advances the state by that fraction of the time step, in order.
+
+   The sub-integrators are called directly (not through their own step()), with the following data shared between the
+   sub-steps of a time step:
+   - Each preconditioner is prepared once per time step (and sub-step size), at the first sub-step that uses it, then
+     reused by the following sub-steps of the same size. The preparation is tracked per preconditioner object, in case
+     several sub-integrators share one. The Krylov solvers and exponential solvers of each sub-integrator keep their
+     own state (workspace, Krylov size) from one sub-step to the next.
+   - The solver statistics of all sub-steps are added together and reported as those of the whole step.
+   """
+   def __init__(self, param: Configuration, schemes: Sequence[Integrator], coefficients) -> None:
       super().__init__(param, preconditioner=None)
-      self.scheme1 = scheme1
-      self.scheme2 = scheme2
+      self.schemes      = list(schemes)
+      self.coefficients = numpy.atleast_2d(numpy.array(coefficients, dtype=float))
+
+      if self.coefficients.shape[1] != len(self.schemes):
+         raise ValueError(f'The splitting coefficients {self.coefficients.shape} must have one column per scheme '
+                          f'({len(self.schemes)})')
+
+   def checkpoint_data(self):
+      arrays, scalars = {}, {}
+      for i, scheme in enumerate(self.schemes):
+         scheme_arrays, scheme_scalars = scheme.checkpoint_data()
+         arrays.update({f'scheme{i}_{name}': array for name, array in scheme_arrays.items()})
+         scalars[f'scheme{i}'] = scheme_scalars
+      return arrays, scalars
+
+   def restore_checkpoint_data(self, arrays, scalars):
+      for i, scheme in enumerate(self.schemes):
+         prefix = f'scheme{i}_'
+         scheme.restore_checkpoint_data({name[len(prefix):]: array for name, array in arrays.items()
+                                         if name.startswith(prefix)},
+                                        scalars.get(f'scheme{i}', {}))
+
+   def __step__(self, Q: numpy.ndarray, dt: float):
+      t0 = time()
+      prepared_dt = {} # Sub-step size for which each preconditioner was last prepared
+      flag, total_num_it, iterations = 0, 0, []
+      sub_time = self.sim_time
+
+      for stage in self.coefficients:
+         for scheme, coeff in zip(self.schemes, stage):
+            if coeff == 0.0: continue
+            sub_dt = coeff * dt
+
+            # Prepare the preconditioner only when it was not already prepared for that sub-step size
+            must_prepare = prepared_dt.get(id(scheme.preconditioner)) != sub_dt
+            prepared_dt[id(scheme.preconditioner)] = sub_dt
 
-   def __step__(self, Q, dt):
-      Q1 = self.scheme1.step(Q, dt)
-      Q2 = self.scheme2.step(Q1, dt)
-      return Q2
+            Q_natural = Q if self.state_layout is None else self.state_layout.to_natural(Q)
+            scheme.sim_time = sub_time
+            Q = scheme._try_step(Q_natural, Q, sub_dt, prepare_preconditioner=must_prepare)
+            sub_time += sub_dt
 
-class StrangSplitting(Integrator):
+            if scheme.solver_info is not None:
+               flag = min(flag, scheme.solver_info.flag)
+               total_num_it += scheme.solver_info.total_num_it
+               iterations += scheme.solver_info.iterations
+               scheme.solver_info = None
+
+      self.solver_info = SolverInfo(flag, time() - t0, total_num_it, iterations)
+      return Q
+
+class LieSplitting(OperatorSplitting):
    def __init__(self, param: Configuration, scheme1: Integrator, scheme2: Integrator):
-      super().__init__(param, preconditioner=None)
+      super().__init__(param, [scheme1, scheme2], [[1.0, 1.0]])
       self.scheme1 = scheme1
       self.scheme2 = scheme2
 
-   def __step__(self, Q, dt):
-      Q1 = self.scheme1.step(Q, dt/2)
-      Q2 = self.scheme2.step(Q1, dt)
-      Q3 = self.scheme1.step(Q2, dt/2)
-      return Q3
-
-class OS22Splitting(Integrator):
-    def __init__(self, param: Configuration, scheme1: Integrator, scheme2: Integrator, os_param):
-      super().__init__()
+class StrangSplitting(OperatorSplitting):
+   def __init__(self, param: Configuration, scheme1: Integrator, scheme2: Integrator):
+      super().__init__(param, [scheme1, scheme2], [[0.5, 1.0],
+                                                   [0.5, 0.0]])
       self.scheme1 = scheme1
       self.scheme2 = scheme2
+
+class OS22Splitting(OperatorSplitting):
+   """Two-stage, second-order splitting with a free parameter (os_param, which cannot be 1)"""
+   def __init__(self, param: Configuration, scheme1: Integrator, scheme2: Integrator, os_param: float):
       self.os_param = os_param
       self.alpha = numpy.array([[(2 * self.os_param - 1) / (2 * self.os_param - 2), 1 - self.os_param],
-                             [-1 / (2 * self.os_param - 2), self.os_param]])
-
-    def __step__(self, Q, dt):
-      for numofstage in range(0,self.alpha.shape[0]):
-            if self.alpha[numofstage,0] != 0:
-                  Q = self.scheme1.step(Q, self.alpha[numofstage,0] * dt)
-            if self.alpha[numofstage,1] != 0:
-                  Q = self.scheme2.step(Q, self.alpha[numofstage,1] * dt)
-      return Q
-
+                                [-1 / (2 * self.os_param - 2), self.os_param]])
+      super().__init__(param, [scheme1, scheme2], self.alpha)
+      self.scheme1 = scheme1
+      self.scheme2 = scheme2
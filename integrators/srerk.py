@@ -5,7 +5,7 @@ import numpy
 
 from common.program_options import Configuration
 from .integrator            import Integrator, alpha_coeff
-from solvers                import kiops, matvec_fun, pmex
+from solvers                import ExponentialSolver, matvec_fun
 
 # Computes nodes for SRERK methods with minimal error terms
 def opt_nodes(order: int):
@@ -34,9 +34,8 @@ class Srerk(Integrator):
       super().__init__(param, preconditioner=None)
       self.rhs = rhs
       self.tol = param.tolerance
-      self.krylov_size = 1
       self.jacobian_method = param.jacobian_method
-      self.exponential_solver = param.exponential_solver
+      self.exp_solver = ExponentialSolver(param, mmin=16, mmax=64)
 
       if nodes:
          self.c = nodes
@@ -49,36 +48,29 @@ class Srerk(Integrator):
          self.alpha.append(alpha_coeff(self.c[i]))
 
    def __step__(self, Q: numpy.ndarray, dt: float):
+      self.exp_solver.start_step()
       rhs = self.rhs(Q)
       matvec_handle = lambda v: matvec_fun(v, dt, Q, rhs, self.rhs, self.jacobian_method)
+      Q_flat = Q.flatten()
+      rhs_flat = rhs.flatten()
+
+      # Every projection is evaluated with a single Krylov pass: all its nodes are output times of the same call, and
+      # the stage vectors of all its nodes are combined in the rows of the augmented matrix. The projections themselves
+      # have to be done one after the other, since each one needs the stage values of the previous one.
 
       # Initial projection
       vec = numpy.zeros((2, rhs.size))
-      vec[1, :] = rhs.flatten()
-
-      if self.exponential_solver == 'kiops':
-         z, stats = kiops(self.c[0], matvec_handle, vec, tol=self.tol, m_init=self.krylov_size, mmin=16, mmax=64, task1=False)
-
-         print(f'KIOPS converged at iteration {stats[2]} (using {stats[0]} internal substeps and {stats[1]} rejected expm)'
-               f' to a solution with local error {stats[4]:.2e}')
+      vec[1, :] = rhs_flat
 
-         self.krylov_size = math.floor(0.7 * stats[5] + 0.3 * self.krylov_size)
+      z, stats = self.exp_solver(self.c[0], matvec_handle, vec, tol=self.tol)
 
-      elif self.exponential_solver == 'pmex':
-
-         z, stats = pmex(self.c[0], matvec_handle, vec, tol=self.tol, mmax=64, task1=False)
-
-         print(f'PMEX converged at iteration {stats[2]} (using {stats[0]} internal substeps and {stats[1]} rejected expm)'
-               f' to a solution with local error {stats[4]:.2e}')
-      else:
-         print('There is nothing to see here, go away!')
-         exit(0)
+      print(f'{self.exp_solver.name} converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
+            f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
 
       # Loop over all the other projections
       for i_proj in range(1, self.n_proj):
 
-         for i in range(z.shape[0]):
-            z[i, :] = Q.flatten() + dt * z[i,:]
+         z = Q_flat + dt * z
 
          # Compute r(z_i)
          rz = numpy.empty_like(z)
@@ -87,27 +79,13 @@ class Srerk(Integrator):
             rz[i,:] = (self.rhs(tmp_z) - rhs).flatten() - matvec_handle(tmp_z - Q)/dt
 
          vec = numpy.zeros((z.shape[0]+3, rhs.size))
-         vec[1, :] = rhs.flatten()
+         vec[1, :] = rhs_flat
          vec[3:,:] = self.alpha[i_proj-1] @ rz
 
-         if self.exponential_solver == 'kiops':
-            z, stats = kiops(self.c[i_proj], matvec_handle, vec, tol=self.tol, m_init=self.krylov_size, mmin=16, mmax=64,
-                             task1=False)
-
-            print(f'KIOPS converged at iteration {stats[2]} (using {stats[0]} internal substeps and {stats[1]} rejected expm)'
-                  f' to a solution with local error {stats[4]:.2e}')
-
-            self.krylov_size = math.floor(0.7 * stats[5] + 0.3 * self.krylov_size)
-
-         elif self.exponential_solver == 'pmex':
-
-            z, stats = pmex(self.c[i_proj], matvec_handle, vec, tol=self.tol, mmax=64, task1=False)
+         z, stats = self.exp_solver(self.c[i_proj], matvec_handle, vec, tol=self.tol)
 
-            print(f'PMEX converged at iteration {stats[2]} (using {stats[0]} internal substeps and {stats[1]} rejected expm)'
-                  f' to a solution with local error {stats[4]:.2e}')
-         else:
-            print('There is nothing to see here, go away!')
-            exit(0)
+         print(f'{self.exp_solver.name} converged at iteration {stats[2]} (using {stats[0]} internal substeps and'
+               f' {stats[1]} rejected expm) to a solution with local error {stats[4]:.2e}')
 
       # Update solution
       return Q + dt * numpy.reshape(z, Q.shape)
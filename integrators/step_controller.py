@@ -0,0 +1,70 @@
+from typing import Dict, Tuple
+
+import numpy
+
+from common.parallel        import space_comm
+from common.program_options import Configuration
+
+class StepController:
+   """
+   Proportional-integral (PI) controller for the time step size, based on the local error estimate provided by the
+   integrator at every step.
+
+   The error estimate is measured in a weighted RMS norm (over all PEs), where the weight of each point is
+   adaptive_atol + adaptive_rtol * |Q|, so that a step is acceptable if its norm is at most 1. The next step size is
+   then
+
+      dt_next = dt * safety * err^(-beta_1 / k) * err_prev^(beta_2 / k),
+
+   where k is the order of the error estimate (err ~ dt^k) and err_prev is the norm of the previously accepted step.
+   After a rejected step, only the integral part (err^(-1 / k)) is used. The step size is always kept within
+   [dt_min, dt_max], and the growth factor within [factor_min, factor_max].
+   """
+   safety     = 0.9
+   beta_1     = 0.7
+   beta_2     = 0.4
+   factor_min = 0.2
+   factor_max = 5.0
+
+   def __init__(self, param: Configuration) -> None:
+      self.rtol   = param.adaptive_rtol
+      self.atol   = param.adaptive_atol
+      self.dt_min = param.dt_min
+      self.dt_max = param.dt_max
+
+      self.previous_error = 1.0
+      self.dt_next        = param.dt
+
+   def checkpoint_data(self) -> Dict[str, float]:
+      """State of the controller, needed to restart a run exactly from a checkpoint"""
+      return {'dt_next': self.dt_next, 'previous_error': self.previous_error}
+
+   def restore_checkpoint_data(self, scalars: Dict[str, float]) -> None:
+      self.dt_next        = scalars['dt_next']
+      self.previous_error = scalars['previous_error']
+
+   def error_norm(self, error: numpy.ndarray, Q: numpy.ndarray, Q_new: numpy.ndarray) -> float:
+      """Weighted RMS norm of the given local error estimate, over all PEs of the spatial domain"""
+      Q_flat     = numpy.ravel(Q)
+      Q_new_flat = numpy.ravel(Q_new)
+      scale = self.atol + self.rtol * numpy.maximum(numpy.abs(Q_flat), numpy.abs(Q_new_flat))
+      local_sum = float(numpy.sum((numpy.ravel(error) / scale) ** 2))
+      global_sum, global_size = space_comm().allreduce(numpy.array([local_sum, Q_flat.size]))
+      return float(numpy.sqrt(global_sum / global_size))
+
+   def update(self, error: float, dt: float, order: int) -> Tuple[bool, float]:
+      """Decide whether a step of size dt with the given error norm is accepted, and compute the size of the next
+      step (or of the next attempt, if rejected)."""
+      error = max(error, 1e-10)
+      accepted = error <= 1.0 or dt <= self.dt_min
+
+      if accepted:
+         factor = self.safety * error ** (-self.beta_1 / order) * self.previous_error ** (self.beta_2 / order)
+         factor = min(max(factor, self.factor_min), self.factor_max)
+         self.previous_error = error
+      else:
+         factor = self.safety * error ** (-1.0 / order)
+         factor = min(max(factor, self.factor_min), 1.0)
+
+      self.dt_next = min(max(dt * factor, self.dt_min), self.dt_max)
+      return accepted, self.dt_next
@@ -0,0 +1,79 @@
+import queue
+import threading
+from typing import Callable, List, Optional
+
+import numpy
+
+OutputAction = Callable[[numpy.ndarray, int], None]
+
+class AsyncOutputWriter:
+   """Perform output operations on a dedicated thread, from a snapshot of the state vector.
+
+   The state is copied into one of a small set of buffers (double buffering by default), so that the time loop can
+   keep modifying its own copy while the writer thread computes diagnostics and writes files. Submitting a new
+   snapshot only blocks when every buffer is still held by the writer thread.
+
+   Output actions are executed in the order in which they were submitted, on every PE. Any collective operation they
+   perform must use a communicator that is *not* used by the main thread (see OutputManager).
+   """
+   buffers: List[Optional[numpy.ndarray]]
+
+   def __init__(self, num_buffers: int = 2) -> None:
+      self.buffers     = [None for _ in range(num_buffers)]
+      self.free_slots  = queue.Queue()
+      self.tasks       = queue.Queue()
+      self.error: Optional[BaseException] = None
+
+      for slot in range(num_buffers):
+         self.free_slots.put(slot)
+
+      self.thread = threading.Thread(target=self._run, name='gef_output_writer', daemon=True)
+      self.thread.start()
+
+   def submit(self, Q: numpy.ndarray, step_id: int, action: OutputAction) -> None:
+      """Take a snapshot of Q and schedule the given action to be performed on it by the writer thread."""
+      self._check_error()
+
+      slot = self.free_slots.get()
+      buffer = self.buffers[slot]
+      if buffer is None or buffer.shape != Q.shape or buffer.dtype != Q.dtype:
+         buffer = numpy.empty_like(Q)
+         self.buffers[slot] = buffer
+
+      buffer[...] = Q
+      self.tasks.put((slot, step_id, action))
+
+   def wait(self) -> None:
+      """Block until every submitted action has been performed."""
+      self.tasks.join()
+      self._check_error()
+
+   def finalize(self) -> None:
+      """Perform the remaining actions and stop the writer thread."""
+      self.tasks.put(None)
+      self.thread.join()
+      self._check_error()
+
+   def _run(self) -> None:
+      while True:
+         task = self.tasks.get()
+         if task is None:
+            self.tasks.task_done()
+            break
+
+         slot, step_id, action = task
+         try:
+            # Skip remaining work after a failure, the error will be raised from the main thread
+            if self.error is None:
+               action(self.buffers[slot], step_id)
+         except Exception as e:
+            self.error = e
+         finally:
+            self.free_slots.put(slot)
+            self.tasks.task_done()
+
+   def _check_error(self) -> None:
+      if self.error is not None:
+         error = self.error
+         self.error = None
+         raise RuntimeError('An error occurred in the output writer thread') from error
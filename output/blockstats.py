@@ -8,7 +8,7 @@ from geometry                import Cartesian2D, CubedSphere
 from init.shallow_water_test import height_vortex, height_case1, height_case2, height_unsteady_zonal
 from output.diagnostic       import total_energy, potential_enstrophy, global_integral
 
-def blockstats_cs(Q, geom, topo, metric, mtrx, param, step):
+def blockstats_cs(Q, geom, topo, metric, mtrx, param, step, comm=MPI.COMM_WORLD):
 
    h  = Q[0,:,:]
 
@@ -29,7 +29,7 @@ def blockstats_cs(Q, geom, topo, metric, mtrx, param, step):
       energy = total_energy(h, u1_contra, u2_contra, geom, topo, metric)
       enstrophy = potential_enstrophy(h, u1_contra, u2_contra, geom, metric, mtrx, param)
 
-   if MPI.COMM_WORLD.rank == 0:
+   if comm.rank == 0:
       print("\n================================================================================================")
 
 
@@ -39,49 +39,49 @@ def blockstats_cs(Q, geom, topo, metric, mtrx, param, step):
       global initial_enstrophy
 
       try:
-         if initial_mass is None and MPI.COMM_WORLD.rank == 0:
+         if initial_mass is None and comm.rank == 0:
             print('Nothing!!!!!')
       except NameError:
-         initial_mass = global_integral(h, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-         initial_energy = global_integral(energy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-         initial_enstrophy = global_integral(enstrophy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
+         initial_mass = global_integral(h, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+         initial_energy = global_integral(energy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+         initial_enstrophy = global_integral(enstrophy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
 
-         if MPI.COMM_WORLD.rank == 0:
+         if comm.rank == 0:
             print(f'Integral of mass = {initial_mass}')
             print(f'Integral of energy = {initial_energy}')
             print(f'Integral of enstrophy = {initial_enstrophy}')
 
-   if MPI.COMM_WORLD.rank == 0: print("Blockstats for timestep ", step)
+   if comm.rank == 0: print("Blockstats for timestep ", step)
 
    if param.case_number <= 2 or param.case_number == 10:
-      absol_err = global_integral(abs(h - h_anal), mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-      int_h_anal = global_integral(abs(h_anal), mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
+      absol_err = global_integral(abs(h - h_anal), mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+      int_h_anal = global_integral(abs(h_anal), mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
 
-      absol_err2 = global_integral((h - h_anal)**2, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-      int_h_anal2 = global_integral(h_anal**2, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
+      absol_err2 = global_integral((h - h_anal)**2, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+      int_h_anal2 = global_integral(h_anal**2, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
 
-      max_absol_err = MPI.COMM_WORLD.allreduce(numpy.max(abs(h - h_anal)), op=MPI.MAX)
-      max_h_anal = MPI.COMM_WORLD.allreduce(numpy.max(h_anal), op=MPI.MAX)
+      max_absol_err = comm.allreduce(numpy.max(abs(h - h_anal)), op=MPI.MAX)
+      max_h_anal = comm.allreduce(numpy.max(h_anal), op=MPI.MAX)
 
       l1 = absol_err / int_h_anal
       l2 = math.sqrt( absol_err2 / int_h_anal2 )
       linf = max_absol_err / max_h_anal
-      if MPI.COMM_WORLD.rank == 0: print(f'l1 = {l1} \t l2 = {l2} \t linf = {linf}')
+      if comm.rank == 0: print(f'l1 = {l1} \t l2 = {l2} \t linf = {linf}')
 
    if param.case_number >= 2:
-      int_mass = global_integral(h, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-      int_energy = global_integral(energy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
-      int_enstrophy = global_integral(enstrophy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal) 
+      int_mass = global_integral(h, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+      int_energy = global_integral(energy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
+      int_enstrophy = global_integral(enstrophy, mtrx, metric, param.nbsolpts, param.nb_elements_horizontal, comm)
 
       normalized_mass = ( int_mass - initial_mass ) / initial_mass
       normalized_energy = ( int_energy - initial_energy ) / initial_energy
       normalized_enstrophy = ( int_enstrophy - initial_enstrophy ) / initial_enstrophy
-      if MPI.COMM_WORLD.rank == 0:
+      if comm.rank == 0:
          print(f'normalized error for mass = {normalized_mass}')
          print(f'normalized error for energy = {normalized_energy}')
          print(f'normalized error for enstrophy = {normalized_enstrophy}')
 
-   if MPI.COMM_WORLD.rank == 0:
+   if comm.rank == 0:
       print("================================================================================================")
 
 def blockstats_cart(Q: numpy.ndarray, geom: Cartesian2D, step_id: int):
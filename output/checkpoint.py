@@ -0,0 +1,186 @@
+"""
+Binary checkpoint files that contain the state vector of every PE, along with the data needed to restart the time
+integrator exactly.
+
+A checkpoint is a single file, written collectively with MPI-IO. It starts with a small JSON header that describes its
+content, followed by a set of arrays. Each array is stored with its *global* shape (the whole domain, independently of
+how it is distributed among PEs), so that a simulation can be restarted with a different number of PEs. Reading is done
+through a memory map, so that each PE only loads the part of the file that it needs.
+
+File layout:
+   [0:8)                    Magic string
+   [8:16)                   Length of the JSON header, in bytes (little-endian uint64)
+   [16:16+len)              JSON header
+   [data_start:...)         Arrays, in C order. data_start is aligned on a page boundary
+"""
+
+import hashlib
+import json
+import math
+from typing import Any, Dict, Optional, Tuple
+
+from mpi4py import MPI
+from mpi4py.util.dtlib import from_numpy_dtype
+import numpy
+
+from common.parallel        import DistributedWorld
+from common.program_options import Configuration
+
+__all__ = ['Checkpoint', 'checkpoint_config', 'checkpoint_file_name', 'read_checkpoint', 'write_checkpoint']
+
+_magic          = b'GEFCKPT1'
+_prefix_size    = 16
+_page_size      = 4096
+_format_version = 1
+
+def checkpoint_config(param: Configuration) -> Dict[str, Any]:
+   """The set of parameters that must match between a checkpoint and the simulation that restarts from it. It must be
+   taken from the configuration as given (before the time loop modifies dt), so that it is the same for all the
+   checkpoints of a run and for the run that restarts from them."""
+   return {
+      'equations':                    param.equations,
+      'grid_type':                    param.grid_type,
+      'case_number':                  param.case_number,
+      'nbsolpts':                     param.nbsolpts,
+      'nb_elements_horizontal_total': param.nb_elements_horizontal_total,
+      'nb_elements_vertical':         param.nb_elements_vertical,
+      'dt':                           param.dt,
+   }
+
+def checkpoint_file_name(output_dir: str, config: Dict[str, Any], step_id: int) -> str:
+   """Name of the checkpoint file for the given step and configuration (see checkpoint_config). It does not depend on
+   the number of PEs."""
+   summary = json.dumps(config, sort_keys=True).encode('utf-8')
+   config_hash = hashlib.sha1(summary).hexdigest()[:12]
+   return f'{output_dir}/checkpoint_{config_hash}.{step_id:08d}.chk'
+
+class _Layout:
+   """Position of the local part of a distributed array inside the corresponding global array.
+
+   On the cubed sphere, the global array has an additional leading dimension for the panel, and its last two
+   dimensions span an entire panel. Otherwise, the local array *is* the global array.
+   """
+   def __init__(self, local_shape: Tuple[int, ...], ptopo: Optional[DistributedWorld]) -> None:
+      self.local_shape = tuple(local_shape)
+      if ptopo is None:
+         self.global_shape = self.local_shape
+         self.starts       = (0,) * len(self.local_shape)
+         self.sub_shape    = self.local_shape
+      else:
+         nj, ni = self.local_shape[-2:]
+         n = ptopo.nb_lines_per_panel
+         self.global_shape = (6,) + self.local_shape[:-2] + (nj * n, ni * n)
+         self.starts       = (ptopo.my_panel,) + (0,) * (len(self.local_shape) - 2) + \
+                             (ptopo.my_row * nj, ptopo.my_col * ni)
+         self.sub_shape    = (1,) + self.local_shape
+
+   def local_slice(self) -> Tuple[slice, ...]:
+      return tuple(slice(start, start + size) for start, size in zip(self.starts, self.sub_shape))
+
+class Checkpoint:
+   """Read-only access to a checkpoint file. Arrays are memory-mapped, not loaded."""
+   def __init__(self, file_name: str) -> None:
+      self.file_name = file_name
+      with open(file_name, 'rb') as f:
+         prefix = f.read(_prefix_size)
+         if len(prefix) < _prefix_size or prefix[:8] != _magic:
+            raise ValueError(f'{file_name} is not a GEF checkpoint file')
+         header_size = int.from_bytes(prefix[8:], 'little')
+         self.header = json.loads(f.read(header_size).decode('utf-8'))
+
+      if self.header['version'] != _format_version:
+         raise ValueError(f'Unsupported checkpoint version {self.header["version"]} (in {file_name})')
+
+      self.data_start = _align(_prefix_size + header_size)
+
+   @property
+   def step_id(self) -> int:
+      return self.header['step_id']
+
+   @property
+   def metadata(self) -> Dict[str, Any]:
+      return self.header['metadata']
+
+   def field_names(self):
+      return self.header['fields'].keys()
+
+   def global_field(self, name: str) -> numpy.memmap:
+      """Memory map of an entire (global) array."""
+      desc = self.header['fields'][name]
+      return numpy.memmap(self.file_name, dtype=numpy.dtype(desc['dtype']), mode='r',
+                          offset=self.data_start + desc['offset'], shape=tuple(desc['shape']))
+
+   def local_field(self, name: str, local_shape: Tuple[int, ...], ptopo: Optional[DistributedWorld]) -> numpy.ndarray:
+      """Extract the part of an array that belongs to this PE, given the current domain decomposition."""
+      layout = _Layout(local_shape, ptopo)
+      data = self.global_field(name)
+      if data.shape != layout.global_shape:
+         raise ValueError(f'Array "{name}" in checkpoint has shape {data.shape}, '
+                          f'but we need {layout.global_shape}')
+      return numpy.array(data[layout.local_slice()]).reshape(layout.local_shape)
+
+   def check_config(self, expected: Dict[str, Any]) -> None:
+      """Make sure the checkpoint was produced by a compatible configuration (see checkpoint_config)."""
+      for key, value in self.header['config'].items():
+         if expected.get(key) != value:
+            raise ValueError(f'Checkpoint was produced with {key} = {value}, but we have {expected.get(key)}')
+
+def read_checkpoint(file_name: str) -> Checkpoint:
+   return Checkpoint(file_name)
+
+def write_checkpoint(file_name: str,
+                     config: Dict[str, Any],
+                     step_id: int,
+                     fields: Dict[str, numpy.ndarray],
+                     ptopo: Optional[DistributedWorld],
+                     metadata: Optional[Dict[str, Any]] = None,
+                     comm: MPI.Comm = MPI.COMM_WORLD) -> None:
+   """Collectively write the given (distributed) arrays into a single checkpoint file.
+
+   All PEs must provide the same set of fields, with the same shapes. Metadata is taken from the first PE and must be
+   JSON-serializable.
+   """
+
+   # Describe all fields and their position in the file
+   layouts = {}
+   field_desc = {}
+   offset = 0
+   for name, field in fields.items():
+      layout = _Layout(field.shape, ptopo)
+      layouts[name] = layout
+      field_desc[name] = {'dtype': field.dtype.str, 'shape': list(layout.global_shape), 'offset': offset}
+      offset = _align(offset + math.prod(layout.global_shape) * field.dtype.itemsize)
+
+   header = {
+      'version':     _format_version,
+      'step_id':     step_id,
+      'num_pe':      comm.size,
+      'config':      config,
+      'fields':      field_desc,
+      'metadata':    metadata if metadata is not None else {},
+   }
+   header_bytes = json.dumps(header).encode('utf-8')
+   data_start   = _align(_prefix_size + len(header_bytes))
+
+   fh = MPI.File.Open(comm, file_name, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+   try:
+      fh.Set_size(data_start + offset)
+
+      if comm.rank == 0:
+         fh.Write_at(0, numpy.frombuffer(_magic + len(header_bytes).to_bytes(8, 'little') + header_bytes,
+                                         dtype=numpy.uint8))
+
+      for name, field in fields.items():
+         layout = layouts[name]
+         host_field = field.get() if hasattr(field, 'get') else field
+         etype = from_numpy_dtype(host_field.dtype)
+         filetype = etype.Create_subarray(layout.global_shape, layout.sub_shape, layout.starts)
+         filetype.Commit()
+         fh.Set_view(data_start + field_desc[name]['offset'], etype, filetype)
+         fh.Write_all(numpy.ascontiguousarray(host_field))
+         filetype.Free()
+   finally:
+      fh.Close()
+
+def _align(size: int) -> int:
+   return ((size + _page_size - 1) // _page_size) * _page_size
@@ -55,7 +55,7 @@ def potential_enstrophy(h, u1_contra, u2_contra, geom, metric, mtrx, param):
    rv = relative_vorticity(u1_contra, u2_contra, geom, metric, mtrx, param)
    return (rv + metric.coriolis_f)**2 / (2 * h)
 
-def global_integral(field, mtrx, metric, nbsolpts, nb_elements_horiz):
+def global_integral(field, mtrx, metric, nbsolpts, nb_elements_horiz, comm=MPI.COMM_WORLD):
    local_sum = 0.
    for line in range(nb_elements_horiz):
       min_lin, max_lin = line * nbsolpts + numpy.array([0, nbsolpts])
@@ -63,5 +63,5 @@ def global_integral(field, mtrx, metric, nbsolpts, nb_elements_horiz):
          min_col, max_col = column * nbsolpts + numpy.array([0, nbsolpts])
          local_sum += numpy.sum( field[min_lin:max_lin,min_col:max_col] * metric.sqrtG[min_lin:max_lin,min_col:max_col] * mtrx.quad_weights )
 
-   return MPI.COMM_WORLD.allreduce(local_sum)
+   return comm.allreduce(local_sum)
 
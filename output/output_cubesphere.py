@@ -33,32 +33,33 @@ def prepare_array(param: Configuration) -> Callable[[NDArray], NDArray]:
    else:
       return lambda x: x
 
-def store_field(field: NDArray, name: str, step_id: int, file: 'netCDF4.Dataset') -> None:
+def store_field(field: NDArray, name: str, step_id: int, file: 'netCDF4.Dataset',
+                comm: MPI.Comm = MPI.COMM_WORLD) -> None:
    """Store data in a given file.
    
    If the netcdf_serial option is activated, this will gather the data on a single PE, and
    only that PE will perform the write operation.
    """
    if netcdf_serial:
-      fields: List = MPI.COMM_WORLD.gather(field, root=0)
-      if MPI.COMM_WORLD.rank == 0:
+      fields: List = comm.gather(field, root=0)
+      if comm.rank == 0:
          for i, f in enumerate(fields):
             file[name][step_id, i] = f
    else:
-      file[name][step_id, MPI.COMM_WORLD.rank] = field
+      file[name][step_id, comm.rank] = field
 
-def output_init(geom, param):
+def output_init(geom, param, comm: MPI.Comm = MPI.COMM_WORLD):
    """ Initialise the netCDF4 file."""
 
    sys.stdout.flush()
-   rank = MPI.COMM_WORLD.rank
+   rank = comm.rank
 
    # creating the netcdf file(s)
    global ncfile
    ncfile = None
 
    try:
-      ncfile = netCDF4.Dataset(param.output_file, 'w', format='NETCDF4', parallel = True)
+      ncfile = netCDF4.Dataset(param.output_file, 'w', format='NETCDF4', parallel = True, comm = comm)
    except ValueError:
       global netcdf_serial
       netcdf_serial = True
@@ -91,7 +92,7 @@ def output_init(geom, param):
       ncfile.details = 'Cubed-sphere coordinates, Gauss-Legendre collocated grid'
 
       ncfile.createDimension('time', None) # unlimited
-      npe = MPI.COMM_WORLD.Get_size()
+      npe = comm.Get_size()
       ncfile.createDimension('npe', npe)
       ncfile.createDimension('Ydim', ni)
       ncfile.createDimension('Xdim', nj)
@@ -288,12 +289,12 @@ def output_init(geom, param):
          zzz[:] = prepare(geom.x3[:,0,0]) 
 
    if netcdf_serial:
-      ranks = MPI.COMM_WORLD.gather(rank, root=0)
-      lons  = MPI.COMM_WORLD.gather(prepare(geom.lon * 180/math.pi), root=0)
-      lats  = MPI.COMM_WORLD.gather(prepare(geom.lat * 180/math.pi), root=0)
+      ranks = comm.gather(rank, root=0)
+      lons  = comm.gather(prepare(geom.lon * 180/math.pi), root=0)
+      lats  = comm.gather(prepare(geom.lat * 180/math.pi), root=0)
       if param.equations == "euler":
-         elevs = MPI.COMM_WORLD.gather(prepare(geom.coordVec_latlon[2,:,:,:]), root=0)
-         topos = MPI.COMM_WORLD.gather(prepare(geom.zbot[:,:]), root=0)
+         elevs = comm.gather(prepare(geom.coordVec_latlon[2,:,:,:]), root=0)
+         topos = comm.gather(prepare(geom.zbot[:,:]), root=0)
 
       if rank == 0:
          for my_rank, my_lon, my_lat in zip(ranks, lons, lats):
@@ -314,9 +315,8 @@ def output_init(geom, param):
          topo[rank,:,:] = prepare(geom.zbot[:,:])
 
 
-def output_netcdf(Q, geom, metric, mtrx, topo, step, param):
+def output_netcdf(Q, geom, metric, mtrx, topo, step, param, comm: MPI.Comm = MPI.COMM_WORLD):
    """ Writes u,v,eta fields on every nth time step """
-   rank = MPI.COMM_WORLD.rank
 
    prepare = prepare_array(param)
 
@@ -329,7 +329,7 @@ def output_netcdf(Q, geom, metric, mtrx, topo, step, param):
 
       # Unpack physical variables
       h = Q[idx_h, :, :] + topo.hsurf
-      store_field(prepare(h), 'h', idx, ncfile)
+      store_field(prepare(h), 'h', idx, ncfile, comm)
 
       if param.case_number >= 2: # Shallow water
          u1 = Q[idx_hu1,:,:] / h
@@ -338,10 +338,10 @@ def output_netcdf(Q, geom, metric, mtrx, topo, step, param):
          rv = relative_vorticity(u1, u2, geom, metric, mtrx, param)
          pv = potential_vorticity(h, u1, u2, geom, metric, mtrx, param)
 
-         store_field(prepare(u), 'U', idx, ncfile)
-         store_field(prepare(v), 'V', idx, ncfile)
-         store_field(prepare(rv), 'RV', idx, ncfile)
-         store_field(prepare(pv), 'PV', idx, ncfile)
+         store_field(prepare(u), 'U', idx, ncfile, comm)
+         store_field(prepare(v), 'V', idx, ncfile, comm)
+         store_field(prepare(rv), 'RV', idx, ncfile, comm)
+         store_field(prepare(pv), 'PV', idx, ncfile, comm)
 
    elif param.equations == "euler":
       rho   = Q[idx_rho, :, :, :]
@@ -352,21 +352,21 @@ def output_netcdf(Q, geom, metric, mtrx, topo, step, param):
 
       u, v, w = contra2wind_3d(u1, u2, u3, geom, metric)
 
-      store_field(prepare(rho), 'rho', idx, ncfile)
-      store_field(prepare(u), 'U', idx, ncfile)
-      store_field(prepare(v), 'V', idx, ncfile)
-      store_field(prepare(w), 'W', idx, ncfile)
-      store_field(prepare(theta), 'theta', idx, ncfile)
-      store_field(prepare(p0 * (Q[idx_rho_theta] * Rd / p0)**(cpd / cvd)), 'P', idx, ncfile)
+      store_field(prepare(rho), 'rho', idx, ncfile, comm)
+      store_field(prepare(u), 'U', idx, ncfile, comm)
+      store_field(prepare(v), 'V', idx, ncfile, comm)
+      store_field(prepare(w), 'W', idx, ncfile, comm)
+      store_field(prepare(theta), 'theta', idx, ncfile, comm)
+      store_field(prepare(p0 * (Q[idx_rho_theta] * Rd / p0)**(cpd / cvd)), 'P', idx, ncfile, comm)
 
       if param.case_number == 11 or param.case_number == 12:
-         store_field(prepare(Q[5, :, :, :] / rho), 'q1', idx, ncfile)
+         store_field(prepare(Q[5, :, :, :] / rho), 'q1', idx, ncfile, comm)
 
       if param.case_number == 11:
          for i in [6, 7, 8]:
-            store_field(prepare(Q[i, :, :, :] / rho), f'q{i-4}', idx, ncfile)
+            store_field(prepare(Q[i, :, :, :] / rho), f'q{i-4}', idx, ncfile, comm)
 
-def output_finalize():
+def output_finalize(comm: MPI.Comm = MPI.COMM_WORLD):
    """ Finalise the output netCDF4 file."""
-   if MPI.COMM_WORLD.rank == 0:
+   if comm.rank == 0:
       ncfile.close()
@@ -1,13 +1,17 @@
 import os
-from typing  import Callable, Optional, Union
+from typing  import Callable, Dict, Optional, Tuple, Union
 
 from mpi4py import MPI
 import numpy
 
+from common.parallel        import space_comm
+from common.profiler        import profiler
 from common.program_options import Configuration
 from geometry               import Cartesian2D, CubedSphere, Geometry, Metric, Metric3DTopo, DFROperators
 from init.initialize        import Topo
+from output.async_writer    import AsyncOutputWriter
 from output.blockstats      import blockstats_cart, blockstats_cs
+from output.checkpoint      import checkpoint_config, checkpoint_file_name, write_checkpoint
 from output.solver_stats    import SolverStatsOutput
 from output.state           import save_state
 from precondition.multigrid import Multigrid
@@ -19,6 +23,7 @@ class OutputManager:
    """
    final_function: Callable[[], None]
    output_file_name: Callable[[int], str]
+   integrator: Optional['Integrator']
    def __init__(self,
                 param: Configuration,
                 geometry: Geometry,
@@ -32,20 +37,36 @@ class OutputManager:
       self.operators = operators
       self.topo      = topo
 
+      # Time integrator whose history is saved along with the state vector. Must be assigned after the integrator is
+      # created (see run.py)
+      self.integrator = None
+
       os.makedirs(os.path.abspath(param.output_dir), exist_ok=True)
 
       self.solver_stats_output = SolverStatsOutput(param)
 
+      # Output is collective over the PEs that share the spatial domain. When writing asynchronously, output
+      # operations (including their collective communications) are performed by a separate thread, so they need their
+      # own communicator
+      self.async_writer = None
+      self.comm = space_comm()
+      if param.async_output:
+         if MPI.Query_thread() >= MPI.THREAD_MULTIPLE:
+            self.comm = self.comm.Dup()
+            self.async_writer = AsyncOutputWriter()
+         elif MPI.COMM_WORLD.rank == 0:
+            print(f'WARNING: Asynchronous output requires MPI_THREAD_MULTIPLE support. Will write synchronously.')
+
       self.final_function = lambda x=None: None
       self.blockstat_function = lambda Q, step_id: None
 
       if param.output_freq > 0:
          if self.geometry.grid_type == 'cubed_sphere':
             from output.output_cubesphere import output_init, output_netcdf, output_finalize
-            output_init(self.geometry, self.param)
+            output_init(self.geometry, self.param, self.comm)
             self.step_function = lambda Q, step_id: \
-               output_netcdf(Q, self.geometry, self.metric, self.operators, self.topo, step_id, self.param)
-            self.final_function = output_finalize
+               output_netcdf(Q, self.geometry, self.metric, self.operators, self.topo, step_id, self.param, self.comm)
+            self.final_function = lambda: output_finalize(self.comm)
          elif self.geometry.grid_type == 'cartesian2d':
             from output.output_cartesian import output_step
 
@@ -60,7 +81,8 @@ class OutputManager:
                if self.topo is None:
                   raise ValueError(f'Need a topo for this!')
                self.blockstat_function = lambda Q, step_id: \
-                  blockstats_cs(Q, self.geometry, self.topo, self.metric, self.operators, self.param, step_id)
+                  blockstats_cs(Q, self.geometry, self.topo, self.metric, self.operators, self.param, step_id,
+                                self.comm)
             else:
                if MPI.COMM_WORLD.rank == 0: print(f'WARNING: Blockstat only implemented for Shallow Water equations')
          elif isinstance(self.geometry, Cartesian2D):
@@ -68,39 +90,113 @@ class OutputManager:
 
       # Choose a file name hash based on a certain set of parameters:
       state_params = (param.dt, param.nb_elements_horizontal, param.nb_elements_vertical, param.nbsolpts,
-                      MPI.COMM_WORLD.size)
+                      self.comm.size)
       self.config_hash = state_params.__hash__() & 0xffffffffffff
 
+      # Same for checkpoints. Both are determined from the configured dt, which the time loop may modify later
+      self.checkpoint_config = checkpoint_config(param)
+
    def state_file_name(self, step_id: int) -> str:
       """Return the name of the file where to save the state vector for the current problem, for the given timestep."""
-      base_name = f'state_vector_{self.config_hash:012x}_{MPI.COMM_WORLD.rank:03d}'
+      base_name = f'state_vector_{self.config_hash:012x}_{self.comm.rank:03d}'
       return f'{self.param.output_dir}/{base_name}.{step_id:08d}.npy'
 
+   def checkpoint_file_name(self, step_id: int) -> str:
+      """Return the name of the checkpoint file for the current problem, for the given timestep."""
+      return checkpoint_file_name(self.param.output_dir, self.checkpoint_config, step_id)
+
    def step(self, Q: numpy.ndarray, step_id: int) -> None:
-      """Output the result of the latest timestep."""
+      """Output the result of the latest timestep.
+
+      In asynchronous mode, this only takes a snapshot of Q; the output itself is performed by the writer thread."""
+      if not self._is_output_step(step_id): return
+
+      if self.param.output_freq > 0 and step_id % self.param.output_freq == 0:
+         if MPI.COMM_WORLD.rank == 0: print(f'=> Writing dynamic output for step {step_id}')
+
+      # Integrator history (and time) must be taken from the current step, even if the output is performed later
+      integrator_data = ({}, {})
+      if self._is_checkpoint_step(step_id) and self.integrator is not None:
+         arrays, scalars = self.integrator.checkpoint_data()
+         if self.integrator.state_layout is not None:
+            arrays = {name: self.integrator.state_layout.to_natural(array) for name, array in arrays.items()}
+         if self.async_writer is not None:
+            arrays = {name: array.copy() for name, array in arrays.items()}
+         integrator_data = (arrays, self._checkpoint_metadata(step_id, scalars))
+
+      action = lambda Q, step_id: self._write_step(Q, step_id, integrator_data)
+      if self.async_writer is not None:
+         self.async_writer.submit(Q, step_id, action)
+      else:
+         action(Q, step_id)
+
+   def _is_output_step(self, step_id: int) -> bool:
+      """Whether any type of output is needed at the given step"""
+      return any(freq > 0 and step_id % freq == 0
+                 for freq in [self.param.output_freq, self.param.save_state_freq, self.param.stat_freq])
+
+   def _is_checkpoint_step(self, step_id: int) -> bool:
+      return self.param.state_format == 'checkpoint' and \
+             self.param.save_state_freq > 0 and step_id % self.param.save_state_freq == 0
+
+   @profiler.profile('output')
+   def _write_step(self, Q: numpy.ndarray, step_id: int, integrator_data: Tuple[Dict, Dict]) -> None:
+      """Perform the output operations that are due at the given step."""
       if self.param.output_freq > 0:
          if step_id % self.param.output_freq == 0:
-            if MPI.COMM_WORLD.rank == 0: print(f'=> Writing dynamic output for step {step_id}')
             self.step_function(Q, step_id)
 
       if self.param.save_state_freq > 0:
          if step_id % self.param.save_state_freq == 0:
-            save_state(Q, self.param, self.state_file_name(step_id))
+            if self.param.state_format == 'checkpoint':
+               self._save_checkpoint(Q, step_id, integrator_data)
+            else:
+               save_state(Q, self.param, self.state_file_name(step_id))
 
       if self.param.stat_freq > 0:
          if step_id % self.param.stat_freq == 0:
             self.blockstat_function(Q, step_id)
 
+   def _checkpoint_metadata(self, step_id: int, integrator_scalars: Dict) -> Dict:
+      """Scalar data saved in a checkpoint: simulation time, step controller and integrator data"""
+      if self.integrator is None:
+         return {'sim_time': step_id * self.param.dt, 'integrator': None, 'integrator_data': {}}
+
+      metadata = {
+         'sim_time':        self.integrator.sim_time,
+         'integrator':      type(self.integrator).__name__,
+         'integrator_data': integrator_scalars,
+      }
+      # With an adaptive step size, the state of the controller (which determines the size of the next step)
+      if self.integrator.step_controller is not None:
+         metadata['step_controller'] = self.integrator.step_controller.checkpoint_data()
+      return metadata
+
+   def _save_checkpoint(self, Q: numpy.ndarray, step_id: int, integrator_data: Tuple[Dict, Dict]) -> None:
+      """Save the state vector, along with the history of the time integrator, in a single checkpoint file."""
+      arrays, metadata = integrator_data
+      if self.integrator is None: metadata = self._checkpoint_metadata(step_id, {})
+      fields = {'state': Q}
+      fields.update({f'integrator/{name}': array for name, array in arrays.items()})
+      ptopo = self.geometry.ptopo if isinstance(self.geometry, CubedSphere) else None
+      write_checkpoint(self.checkpoint_file_name(step_id), self.checkpoint_config, step_id, fields, ptopo, metadata,
+                       self.comm)
+
    def store_solver_stats(self, total_time: float, simulation_time: float, dt: float, solver_info: SolverInfo,
-                          precond: Optional[Multigrid]):
+                          precond: Optional[Multigrid], num_rejected: int = 0):
       if self.param.store_solver_stats > 0:
          self.solver_stats_output.write_output(
             total_time, simulation_time, dt, solver_info.total_num_it, solver_info.time, solver_info.flag,
-            solver_info.iterations, precond)
+            solver_info.iterations, precond, num_rejected)
 
    def finalize(self) -> None:
       """
       Perform any necessary operation to properly finish outputting
       """
+      if self.async_writer is not None:
+         self.async_writer.finalize()
+
+      self.solver_stats_output.finalize()
+
       if self.param.output_freq > 0:
          self.final_function()
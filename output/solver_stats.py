@@ -1,7 +1,10 @@
 from copy   import deepcopy
-from typing import Any, List, Optional, Tuple
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
 from mpi4py import MPI
+import numpy
 
 try:
    import sqlite3
@@ -10,6 +13,7 @@ except ModuleNotFoundError:
    sqlite_available = False
    print(f'No sqlite, won\'t be able to print solver stats')
 
+from common.parallel        import space_comm
 from common.program_options import Configuration
 from precondition.multigrid import Multigrid
 
@@ -28,7 +32,7 @@ class ColumnSet:
       self.num_elem_h        = Column('int', param.nb_elements_horizontal_total)
       self.num_elem_v        = Column('int', param.nb_elements_vertical)
       self.initial_dt        = Column('int', param.dt)
-      self.dt                = Column('int', param.dt)
+      self.dt                = Column('float', param.dt)
       self.equations         = Column('varchar(64)', param.equations)
       self.case_number       = Column('int', param.case_number)
       self.grid_type         = Column('varchar(64)', param.grid_type)
@@ -50,6 +54,7 @@ class ColumnSet:
       self.num_solver_it     = Column('int')
       self.solver_time       = Column('float')
       self.solver_flag       = Column('int')
+      self.num_rejected      = Column('int', 0)
 
       default_radii = '' if not hasattr(param, 'exp_smoothe_spectral_radii') else str(param.exp_smoothe_spectral_radii)
       self.smoother_radii    = Column('varchar(128)', default_radii)
@@ -76,16 +81,24 @@ class ColumnSet:
          self.ztop = Column('float', param.ztop)
 
 
+StatsRow = Tuple[List[Any], int, List[Tuple[float, float, float]]]
+
 class SolverStatsOutput:
-   """Contains necessary info to store solver stats into a SQL database"""
+   """Contains necessary info to store solver stats into a SQL database
+
+   Stats are accumulated in memory and written to the database in bulk, every param.solver_stats_flush_freq steps
+   and when finalizing. The writes can optionally be performed by a separate thread. The stats of the entire run can
+   also be exported to a .npz file (one array per column), which is much faster to load for large campaigns.
+   """
 
    def __init__(self, param: Configuration) -> None:
       """Connect to the DB file and create (if necessary) the tables. Only 1 PE will perform DB operations. """
 
       # Only 1 PE will connect to the DB and log solver stats
-      self.is_writer = MPI.COMM_WORLD.rank == 0
+      comm = space_comm()
+      self.is_writer = comm.rank == 0
       if not (sqlite_available and self.is_writer):
-         if MPI.COMM_WORLD.allreduce(0) != 0:
+         if comm.allreduce(0) != 0:
             raise ValueError("Seems like init failed on root PE...")
          return
 
@@ -99,17 +112,36 @@ class SolverStatsOutput:
       self.db_name       = self.param.solver_stats_file
       self.db            = f'{self.param.output_dir}/{self.db_name}'
 
+      self.flush_freq    = self.param.solver_stats_flush_freq
+      self.pending_rows: List[StatsRow] = []
+
+      self.export_file = None
+      self.export_columns: Dict[str, List[Any]] = {}
+      if self.param.solver_stats_export != '':
+         self.export_file = f'{self.param.output_dir}/{self.param.solver_stats_export}'
+         self.export_columns = {name: [] for name in _exported_columns + _exported_residual_columns}
+
       try:
-         self.db_connection = sqlite3.connect(self.db)
+         # The connection may be used by the flush thread, but only by one thread at a time
+         self.db_connection = sqlite3.connect(self.db, check_same_thread=False)
          self.db_cursor     = self.db_connection.cursor()
+         if self.param.solver_stats_async:
+            self.db_cursor.execute('PRAGMA journal_mode=WAL')
          self.create_results_table()
-         MPI.COMM_WORLD.allreduce(0)
+         comm.allreduce(0)
 
       except sqlite3.OperationalError:
          # Signal failure to the other PEs
-         MPI.COMM_WORLD.allreduce(1)
+         comm.allreduce(1)
          raise
 
+      self.flush_queue  = None
+      self.flush_thread = None
+      if self.param.solver_stats_async:
+         self.flush_queue  = queue.Queue()
+         self.flush_thread = threading.Thread(target=self._run_flush_thread, name='gef_solver_stats', daemon=True)
+         self.flush_thread.start()
+
    def create_results_table(self):
       """Create the results tables in the database, if they don't already exist."""
       # First make sure the results table does not exist yet in the DB
@@ -168,23 +200,9 @@ class SolverStatsOutput:
                     local_time: float,
                     flag: int,
                     residuals: List[Tuple[float, float, float]],
-                    precond: Optional[Multigrid]):
-      try:
-         self._exec_write_output(total_time, simulation_time, dt, num_iter, local_time, flag, residuals, precond)      
-      except sqlite3.OperationalError as e:
-         print(f'Got an SQL error. Not gonna store anything at this point.')
-         print(str(e))
-
-
-   def _exec_write_output(self,
-                    total_time:float,
-                    simulation_time: float,
-                    dt: float,
-                    num_iter: int,
-                    local_time: float,
-                    flag: int,
-                    residuals: List[Tuple[float, float, float]],
-                    precond: Optional[Multigrid]):
+                    precond: Optional[Multigrid],
+                    num_rejected: int = 0):
+      """Record the stats of one timestep. They will be written to the database at the next flush."""
 
       if not (sqlite_available and self.is_writer): return
 
@@ -195,6 +213,7 @@ class SolverStatsOutput:
       self.columns.num_solver_it.value    = num_iter
       self.columns.solver_time.value      = local_time
       self.columns.solver_flag.value      = flag
+      self.columns.num_rejected.value     = num_rejected
 
       if hasattr(self.param, 'exp_smoothe_spectral_radii')  \
          and len(self.param.exp_smoothe_spectral_radii) > 0 \
@@ -205,14 +224,77 @@ class SolverStatsOutput:
          if len(precond.spectral_radii) > 3: self.columns.exp_radius_3.value = precond.spectral_radii[3]
          if len(precond.spectral_radii) > 4: self.columns.exp_radius_4.value = precond.spectral_radii[4]
 
-      insert_string = f'''
-         insert into results_param ({', '.join([f'{name}' for name in self.columns.__dict__])})
-         values ({', '.join(['?' for _ in self.columns.__dict__])})
-         returning results_param.entry_id;'''
-      insert_values = [col.value for _, col in self.columns.__dict__.items()]
-      self.db_cursor.execute(insert_string, insert_values)
+      self.pending_rows.append(([col.value for col in self.columns.__dict__.values()],
+                                self.columns.step_id.value,
+                                list(residuals)))
+
+      if self.export_file is not None:
+         for name in _exported_columns:
+            self.export_columns[name].append(getattr(self.columns, name).value)
+         for i, r in enumerate(residuals):
+            self.export_columns['residual_step_id'].append(self.columns.step_id.value)
+            self.export_columns['residual_iteration'].append(i)
+            self.export_columns['residual'].append(r[0])
+            self.export_columns['residual_time'].append(r[1])
+            self.export_columns['residual_work'].append(r[2])
 
+      self.columns.step_id.value += 1
+
+      if len(self.pending_rows) >= self.flush_freq:
+         self.flush()
+
+   def flush(self) -> None:
+      """Write all pending stats to the database (or hand them over to the flush thread)."""
+      if not (sqlite_available and self.is_writer) or len(self.pending_rows) == 0: return
+
+      rows = self.pending_rows
+      self.pending_rows = []
+      if self.flush_queue is not None:
+         self.flush_queue.put(rows)
+      else:
+         self._write_rows(rows)
+
+   def finalize(self) -> None:
+      """Write any remaining stats, stop the flush thread and export the stats of the run (if requested)."""
+      if not (sqlite_available and self.is_writer): return
+
+      self.flush()
+      if self.flush_thread is not None:
+         self.flush_queue.put(None)
+         self.flush_thread.join()
+         self.flush_queue  = None
+         self.flush_thread = None
+
+      if self.export_file is not None:
+         numpy.savez(self.export_file, run_id=self.columns.run_id.value,
+                     **{name: numpy.array(values) for name, values in self.export_columns.items()})
+
+   def _run_flush_thread(self) -> None:
+      while True:
+         rows = self.flush_queue.get()
+         if rows is None: break
+         self._write_rows(rows)
+
+   def _write_rows(self, rows: List[StatsRow]) -> None:
+      try:
+         self._exec_write_rows(rows)
+      except sqlite3.OperationalError as e:
+         print(f'Got an SQL error. Not gonna store anything at this point.')
+         print(str(e))
+
+   def _exec_write_rows(self, rows: List[StatsRow]) -> None:
+      """Insert the given rows in the database, in a single transaction."""
+      column_names = list(self.columns.__dict__.keys())
+      run_id_index = column_names.index('run_id')
+
+      # The run ID is the entry ID of the first row ever inserted
       if self.columns.run_id.value < 0:
+         first_values, _, _ = rows[0]
+         self.db_cursor.execute(f'''
+            insert into results_param ({', '.join(column_names)})
+            values ({', '.join(['?' for _ in column_names])})
+            returning results_param.entry_id;''',
+            first_values)
          self.columns.run_id.value = self.db_cursor.fetchall()[0][0]
          self.db_cursor.execute('''
          update results_param
@@ -220,15 +302,33 @@ class SolverStatsOutput:
          where entry_id = ?
          ''',
          [self.columns.run_id.value, self.columns.run_id.value])
+         remaining_rows = rows[1:]
+      else:
+         remaining_rows = rows
+
+      run_id = self.columns.run_id.value
+      param_values = []
+      for values, _, _ in remaining_rows:
+         values = list(values)
+         values[run_id_index] = run_id
+         param_values.append(values)
+
+      self.db_cursor.executemany(f'''
+         insert into results_param ({', '.join(column_names)})
+         values ({', '.join(['?' for _ in column_names])});''',
+         param_values)
 
       self.db_cursor.executemany('''
             insert into results_data values (?, ?, ?, ?, ?, ?);
          ''',
-         [[self.columns.run_id.value, self.columns.step_id.value, i, r[0], r[1], r[2]] for i, r in enumerate(residuals)]
+         [[run_id, step_id, i, r[0], r[1], r[2]] for _, step_id, residuals in rows for i, r in enumerate(residuals)]
       )
 
       self.db_connection.commit()
-      self.columns.step_id.value += 1
+
+_exported_columns = ['step_id', 'simulation_time', 'dt', 'total_solve_time', 'num_solver_it', 'solver_time',
+                     'solver_flag', 'num_rejected']
+_exported_residual_columns = ['residual_step_id', 'residual_iteration', 'residual', 'residual_time', 'residual_work']
 
 def _sanitize_params(params: Configuration) -> Configuration:
    new_p = deepcopy(params)
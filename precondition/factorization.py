@@ -5,6 +5,7 @@ import numpy
 from mpi4py import MPI
 import scipy
 
+from common.parallel         import space_comm
 from common.program_options  import Configuration
 from scripts.eigenvalue_util import gen_matrix
 from .preconditioner         import Preconditioner
@@ -23,7 +24,7 @@ class Factorization(Preconditioner):
       def str_hash(s):
          return int(hashlib.md5(s.encode()).hexdigest(), 16)
 
-      values = (param.dt, param.case_number, MPI.COMM_WORLD.size,
+      values = (param.dt, param.case_number, space_comm().size,
                 str_hash(param.equations), str_hash(param.grid_type), str_hash(param.jacobian_method),
                 param.nbsolpts, param.nb_elements_horizontal, param.nb_elements_vertical)
 
@@ -12,12 +12,13 @@ from common.definitions    import idx_2d_rho, idx_2d_rho_u, idx_2d_rho_w, idx_2d
                                   cpd, cvd, heat_capacity_ratio, p0, Rd
 from common.interpolation  import Interpolator
 from common.parallel        import DistributedWorld
+from common.profiler        import profiler
 from common.program_options import Configuration
-from geometry              import Cartesian2D, CubedSphere, DFROperators
+from geometry              import Cartesian2D, CubedSphere, DFROperators, StateLayout
 from init.init_state_vars  import init_state_vars
 from precondition.smoother import KiopsSmoother, ExponentialSmoother, RK1Smoother, RK3Smoother, ARK3Smoother
 from rhs.rhs_selector      import RhsBundle
-from solvers               import fgmres, global_norm, KrylovJacobian, matvec_rat, MatvecOp
+from solvers               import FgmresSolver, global_norm, KrylovJacobian, matvec_rat, MatvecOp
 
 MatvecOperator = Callable[[numpy.ndarray], numpy.ndarray]
 
@@ -188,10 +189,18 @@ class MultigridLevel:
 
       ##########################################
       # Matvec function of the system to solve
-      if self.param.time_integrator in ['ros2', 'rosexp2', 'partrosexp2', 'strang_epi2_ros2', 'strang_ros2_epi2']:
+      # (Also for splitting methods with a ros2 sub-step, like strang_epi2_ros2)
+      if self.param.time_integrator in ['ros2', 'rosexp2', 'partrosexp2'] \
+            or 'ros2' in self.param.time_integrator.split('_')[1:]:
          self.matrix_operator = functools.partial(matvec_rat, dt=dt, Q=field, rhs=self.rhs.full(field),
                                                   rhs_handle=self.rhs.full)
 
+      elif self.param.time_integrator[:5] == 'imex_':
+         # IMEX Runge-Kutta: I - dt/2 J_imp, like ros2 but with the implicit part only. The integrator passes twice
+         # the stage coefficient (2 gamma dt), so that the pseudo time step above is scaled like the ros2 one
+         self.matrix_operator = functools.partial(matvec_rat, dt=dt, Q=field, rhs=self.rhs.implicit(field),
+                                                  rhs_handle=self.rhs.implicit)
+
       elif self.param.time_integrator == 'crank_nicolson':
          cn_fun = CrankNicolsonFunFactory(field, dt, self.rhs.full)
 
@@ -221,7 +230,10 @@ class MultigridLevel:
 class Multigrid(MatvecOp):
    levels: dict[int, MultigridLevel]
    initial_interpolate: Callable[[numpy.ndarray], numpy.ndarray]
-   def __init__(self, param, ptopo, discretization, fv_only=False) -> None:
+   def __init__(self, param, ptopo, discretization, fv_only=False, state_layout: Optional[StateLayout] = None) -> None:
+
+      # Layout of the vectors given to apply() (the levels themselves always work with the natural layout)
+      self.state_layout = state_layout
 
       param = deepcopy(param)
 
@@ -243,6 +255,7 @@ class Multigrid(MatvecOp):
          param.discretization = 'dg'
 
       self.use_solver = param.mg_solve_coarsest
+      self.coarsest_solver = FgmresSolver() # Keeps its workspace from one application to the next
       self.verbose = param.verbose_precond if MPI.COMM_WORLD.rank == 0 else 0
 
       # Determine number of multigrid levels
@@ -366,9 +379,15 @@ class Multigrid(MatvecOp):
       if verbose is None: verbose = self.verbose
       param = self.levels[0].param
 
+      if self.state_layout is not None:
+         vec = self.state_layout.to_natural(vec)
+         if x0 is not None: x0 = numpy.ravel(self.state_layout.to_natural(x0))
+
       restricted_vec = numpy.ravel(self.initial_interpolate(vec))
       result = self.iterate(restricted_vec, x0=x0, num_levels=param.num_mg_levels, verbose=(verbose>1))
       prolonged_result = self.get_solution_back(result)
+      if self.state_layout is not None:
+         prolonged_result = self.state_layout.to_internal(prolonged_result)
       return numpy.ravel(prolonged_result)
 
    def compare_res(self, A, b, x, old_res = 0.0):
@@ -382,6 +401,7 @@ class Multigrid(MatvecOp):
 
       return abs_res, rel_res
 
+   @profiler.profile('multigrid_iterate')
    def iterate(self,
                b: numpy.ndarray,
                x0: Optional[numpy.ndarray] = None,
@@ -461,7 +481,7 @@ class Multigrid(MatvecOp):
          before_res = 0.0
          if verbose: before_res = global_norm(b - A(x).flatten())
          t0 = time()
-         x, _, _, num_iter, _, _ = fgmres(A, b, x0=x, tol=lvl_param.param.precond_tolerance, restart=100, verbose=False)
+         x, _, _, num_iter, _, _ = self.coarsest_solver(A, b, x0=x, tol=lvl_param.param.precond_tolerance, restart=100, verbose=False)
          t1 = time()
          if verbose:
             corr_res, rel = self.compare_res(A, b, x, before_res)
@@ -6,6 +6,7 @@ from mpi4py import MPI
 import numpy
 import scipy.linalg
 
+from common.parallel import space_comm
 from solvers import kiops, global_norm, matvec_rat, matvec_fun
 from rhs.rhs_selector import RhsBundle
 
@@ -60,10 +61,13 @@ class ExponentialSmoother(Smoother):
 
       happy   = False
 
+      # Global operations are over the PEs that share the spatial domain
+      comm = space_comm()
+
       # compute the 1-norm of u
       local_nrmU = numpy.sum(abs(u[1:, :]), axis=1)
       global_normU = numpy.empty_like(local_nrmU)
-      MPI.COMM_WORLD.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
+      comm.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
       normU = numpy.amax(global_normU)
 
       # Normalization factors
@@ -93,7 +97,7 @@ class ExponentialSmoother(Smoother):
       # Normalize initial vector (this norm is nonzero)
       local_sum = V[j, 0:n] @ V[j, 0:n]
       global_sum_nrm = numpy.empty_like(local_sum)
-      MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+      comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
       β = math.sqrt( global_sum_nrm + V[j, n:n+p] @ V[j, n:n+p] )
 
       # The first Krylov basis vector
@@ -112,7 +116,7 @@ class ExponentialSmoother(Smoother):
          #2. compute terms needed for R and T
          local_vec = V[0:j+1, 0:n] @ V[j-1:j+1, 0:n].T
          global_vec = numpy.empty_like(local_vec)
-         MPI.COMM_WORLD.Allreduce([local_vec, MPI.DOUBLE], [global_vec, MPI.DOUBLE])
+         comm.Allreduce([local_vec, MPI.DOUBLE], [global_vec, MPI.DOUBLE])
          global_vec += V[0:j+1, n:n+p] @ V[j-1:j+1, n:n+p].T
 
          #3. set values for Hessenberg matrix H
@@ -142,7 +146,7 @@ class ExponentialSmoother(Smoother):
             #use communication to compute norm estimate
             local_sum = V[j, 0:n] @ V[j, 0:n]
             global_sum_nrm = numpy.empty_like(local_sum)
-            MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+            comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
             curr_nrm = math.sqrt( global_sum_nrm + V[j,n:n+p] @ V[j, n:n+p] )
          else:
             curr_nrm = numpy.sqrt(global_vec[-1,1] - sum_sqrd)
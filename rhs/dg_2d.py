@@ -0,0 +1,106 @@
+"""
+Building blocks shared by the DG discretizations of the 2D Euler equations (rhs_bubble, rhs_bubble_implicit and
+rhs_bubble_convective).
+
+As in the comma_* functions of DFROperators, element-wise operations are expressed as a few large matrix products on
+reshaped views of the arrays, rather than as loops over elements. Interface values are stored with the following
+shapes (for each variable):
+   x-faces: (nb_points_z, nb_elements_x, 2), [..., 0] being the west side of an element and [..., 1] its east side
+   z-faces: (nb_elements_z, 2, nb_points_x), [:, 0, :] being the bottom side of an element and [:, 1, :] its top side
+"""
+
+from typing import Callable, Union
+
+import numpy
+
+from common.definitions import idx_2d_rho, idx_2d_rho_u, idx_2d_rho_w, \
+                               p0, Rd, cpd, cvd
+from geometry           import DFROperators
+
+InterfaceFlux = Callable[..., None]
+
+def pressure_2d(rho_theta: numpy.ndarray) -> numpy.ndarray:
+   """Pressure from the potential temperature density, p = p0 * (Rd * rho_theta / p0)^(cp/cv)"""
+   return p0 * numpy.exp((cpd / cvd) * numpy.log((Rd / p0) * rho_theta))
+
+def extrapolate_x(field: numpy.ndarray, mtrx: DFROperators, nbsolpts: int) -> numpy.ndarray:
+   """Values of the given field(s) at the west and east boundaries of every element (x-face layout)."""
+   faces = field.reshape(-1, nbsolpts) @ mtrx.extrap_faces_tr
+   return faces.reshape(field.shape[:-1] + (-1, 2))
+
+def extrapolate_z(field: numpy.ndarray, mtrx: DFROperators, nbsolpts: int) -> numpy.ndarray:
+   """Values of the given field(s) at the bottom and top boundaries of every element (z-face layout)."""
+   return mtrx.extrap_faces @ field.reshape(field.shape[:-2] + (-1, nbsolpts, field.shape[-1]))
+
+def derivative_x(flux: numpy.ndarray,
+                 faces_flux: numpy.ndarray,
+                 mtrx: DFROperators,
+                 nbsolpts: int,
+                 factor: float) -> numpy.ndarray:
+   """Derivative along x of the given flux(es), corrected with the common flux at the x-faces."""
+   deriv = flux.reshape(-1, nbsolpts) @ mtrx.diff_solpt_tr
+   deriv += faces_flux.reshape(-1, 2) @ mtrx.correction_tr
+   deriv *= factor
+   return deriv.reshape(flux.shape)
+
+def derivative_z(flux: numpy.ndarray,
+                 faces_flux: numpy.ndarray,
+                 mtrx: DFROperators,
+                 nbsolpts: int,
+                 factor: Union[float, numpy.ndarray]) -> numpy.ndarray:
+   """Derivative along z of the given flux(es), corrected with the common flux at the z-faces. The factor (the
+   inverse of the element half-height) can be given for each element, with shape (nb_elements_z, 1, 1)."""
+   deriv = mtrx.diff_solpt @ flux.reshape(flux.shape[:-2] + (-1, nbsolpts, flux.shape[-1]))
+   deriv += mtrx.correction @ faces_flux
+   deriv *= factor
+   return deriv.reshape(flux.shape)
+
+def wall_boundaries_x(faces_pres: numpy.ndarray, faces_flux: numpy.ndarray) -> None:
+   """Zero flux at the west and east boundaries of the domain, except for the pressure in the momentum equation."""
+   faces_flux[:, :, 0, 0]  = 0.0
+   faces_flux[:, :, -1, 1] = 0.0
+   faces_flux[idx_2d_rho_u, :, 0, 0]  = faces_pres[:, 0, 0]
+   faces_flux[idx_2d_rho_u, :, -1, 1] = faces_pres[:, -1, 1]
+
+def wall_boundaries_z(faces_pres: numpy.ndarray, faces_flux: numpy.ndarray) -> None:
+   """Zero flux at the bottom and top of the domain, except for the pressure in the momentum equation."""
+   faces_flux[:, 0, 0, :]  = 0.0
+   faces_flux[:, -1, 1, :] = 0.0
+   faces_flux[idx_2d_rho_w, 0, 0, :]  = faces_pres[0, 0, :]
+   faces_flux[idx_2d_rho_w, -1, 1, :] = faces_pres[-1, 1, :]
+
+def central_flux(var_L, var_R, pres_L, pres_R, idx_normal: int, flux) -> None:
+   """Centered flux across a set of interfaces, given the states on each side. The result is stored in flux."""
+   w_L = var_L[idx_normal] / var_L[idx_2d_rho]
+   w_R = var_R[idx_normal] / var_R[idx_2d_rho]
+
+   flux[...] = 0.5 * (var_L * w_L + var_R * w_R)
+   flux[idx_normal] += 0.5 * (pres_L + pres_R)
+
+def interface_flux_x(faces_var: numpy.ndarray,
+                     faces_pres: numpy.ndarray,
+                     faces_flux: numpy.ndarray,
+                     flux_function: InterfaceFlux,
+                     periodic: bool = False,
+                     **kwargs) -> None:
+   """Compute the common flux at every x-interface between two elements (including the domain boundary, if
+   periodic), and store it on both sides of the interface."""
+   flux_function(faces_var[:, :, :-1, 1], faces_var[:, :, 1:, 0], faces_pres[:, :-1, 1], faces_pres[:, 1:, 0],
+                 idx_2d_rho_u, faces_flux[:, :, 1:, 0], **kwargs)
+   faces_flux[:, :, :-1, 1] = faces_flux[:, :, 1:, 0]
+
+   if periodic:
+      flux_function(faces_var[:, :, -1, 1], faces_var[:, :, 0, 0], faces_pres[:, -1, 1], faces_pres[:, 0, 0],
+                    idx_2d_rho_u, faces_flux[:, :, 0, 0], **kwargs)
+      faces_flux[:, :, -1, 1] = faces_flux[:, :, 0, 0]
+
+def interface_flux_z(faces_var: numpy.ndarray,
+                     faces_pres: numpy.ndarray,
+                     faces_flux: numpy.ndarray,
+                     flux_function: InterfaceFlux,
+                     **kwargs) -> None:
+   """Compute the common flux at every z-interface between two elements, and store it on both sides of the
+   interface."""
+   flux_function(faces_var[:, :-1, 1, :], faces_var[:, 1:, 0, :], faces_pres[:-1, 1, :], faces_pres[1:, 0, :],
+                 idx_2d_rho_w, faces_flux[:, 1:, 0, :], **kwargs)
+   faces_flux[:, :-1, 1, :] = faces_flux[:, 1:, 0, :]
@@ -0,0 +1,300 @@
+"""
+Pointwise numerical fluxes (Riemann solvers) across element interfaces, computed for all the interfaces of one
+direction at once.
+
+Every flux has two implementations:
+   - A NumPy one, made of whole-array operations. Each of these operations is a pass over the interface arrays that
+     creates a temporary array.
+   - A compiled one (if Numba is available), where the flux at each interface point is computed in a single loop,
+     without any temporary array.
+Both accept real and complex arrays (the latter are used by the complex-step Jacobian), with the same conventions as
+NumPy for complex numbers (e.g. maximum(0, M) compares the real parts first). The implementation is selected for the
+whole program with set_flux_kernels, according to the 'flux_kernels' option.
+
+The states on the left and right sides of the interfaces are given as (possibly non-contiguous) views that all have the
+same shape, with an additional leading dimension for the variables. The result is stored in the given flux array (or
+view), which has the same shape as the states.
+"""
+
+from typing import Optional, Tuple
+
+import numpy
+
+from common.definitions import idx_2d_rho, idx_h, idx_hu1, idx_hu2, idx_rho, idx_rho_u1, idx_rho_w, \
+                               gravity, heat_capacity_ratio
+
+try:
+   import numba
+   numba_available = True
+except ModuleNotFoundError:
+   numba_available = False
+
+__all__ = ['ausm_2d', 'ausm_sw', 'numba_available', 'rusanov_3d', 'set_flux_kernels']
+
+flux_kernel_types = ['numpy', 'numba']
+_use_numba = False
+
+def set_flux_kernels(kernel_type: str) -> None:
+   """Select the implementation of the flux kernels ('numpy' or 'numba'). Numba must be available for the latter."""
+   global _use_numba
+   if kernel_type not in flux_kernel_types:
+      raise ValueError(f'Unknown flux kernel type "{kernel_type}", should be one of {flux_kernel_types}')
+   if kernel_type == 'numba' and not numba_available:
+      raise ValueError('Numba flux kernels were requested, but numba is not available')
+   _use_numba = kernel_type == 'numba'
+
+def ausm_2d(var_L: numpy.ndarray,
+            var_R: numpy.ndarray,
+            pres_L: numpy.ndarray,
+            pres_R: numpy.ndarray,
+            idx_normal: int,
+            flux: numpy.ndarray,
+            mass_only: bool = False) -> None:
+   """AUSM flux of the 2D Euler equations across a set of interfaces, given the states on each side. With mass_only,
+   only the mass and the pressure are transported (the other equations are left untouched)."""
+   if not _use_numba:
+      _ausm_2d_numpy(var_L, var_R, pres_L, pres_R, idx_normal, flux, mass_only)
+      return
+
+   if pres_L.ndim == 1: # A single row of interfaces
+      var_L, var_R, flux = var_L[:, None], var_R[:, None], flux[:, None]
+      pres_L, pres_R     = pres_L[None], pres_R[None]
+   _ausm_2d_loop(var_L, var_R, pres_L, pres_R, idx_normal, flux, mass_only)
+
+def ausm_sw(var_L: numpy.ndarray,
+            var_R: numpy.ndarray,
+            sqrtG: numpy.ndarray,
+            H_normal: numpy.ndarray,
+            H_1: numpy.ndarray,
+            H_2: numpy.ndarray,
+            idx_normal: int,
+            flux: numpy.ndarray) -> None:
+   """AUSM flux of the shallow water equations across a set of interfaces, given the states on each side.
+   H_normal is the component of the contravariant metric along the normal direction (for the gravity wave speed), H_1
+   and H_2 the ones that multiply the pressure term in the hu1 and hu2 equations. The states may have a batch
+   dimension (after the variables), along which the metric terms are broadcast."""
+   if _use_numba:
+      if var_L.ndim > sqrtG.ndim + 1: # One batch member at a time
+         for b in range(var_L.shape[1]):
+            _ausm_sw_loop(var_L[:, b], var_R[:, b], sqrtG, H_normal, H_1, H_2, idx_normal, flux[:, b])
+      else:
+         _ausm_sw_loop(var_L, var_R, sqrtG, H_normal, H_1, H_2, idx_normal, flux)
+   else:
+      _ausm_sw_numpy(var_L, var_R, sqrtG, H_normal, H_1, H_2, idx_normal, flux)
+
+def rusanov_3d(var_L: numpy.ndarray,
+               var_R: numpy.ndarray,
+               u_L: numpy.ndarray,
+               u_R: numpy.ndarray,
+               pres_L: numpy.ndarray,
+               pres_R: numpy.ndarray,
+               metric_itf: numpy.ndarray,
+               advection_only: bool,
+               flux: numpy.ndarray,
+               wflux: Optional[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = None) -> None:
+   """Rusanov flux of the 3D Euler equations across a set of interfaces, given the states on each side.
+
+   u_L and u_R are the velocities normal to the interface (given separately since they can differ from momentum/rho
+   at the domain boundaries). metric_itf contains the metric terms at the interfaces, packed as
+   [√g, H^dd, √g H^d1, √g H^d2, √g H^d3] for interfaces along direction d (see Metric3DTopo.riemann_metric_itf_*).
+   H^dd is used for the speed of sound (unless advection_only) and the last 3 terms multiply the pressure in the
+   momentum equations.
+
+   If wflux is given, the two parts of the rho-w flux are also stored separately, in its 3 arrays: the advective part
+   and the pressure part divided by the pressure on the left and on the right side, respectively.
+
+   The states (and fluxes) may have additional dimensions before the 3 interface dimensions, for a batch of states
+   (the variables are then indexed as (var, member, ...)). The metric terms are the same for all members."""
+   if not _use_numba:
+      metric_itf = metric_itf.reshape(metric_itf.shape[:1] + (1,) * (u_L.ndim - 3) + metric_itf.shape[1:])
+      _rusanov_3d_numpy(var_L, var_R, u_L, u_R, pres_L, pres_R, metric_itf, advection_only, flux, wflux)
+      return
+
+   split_w = wflux is not None
+   if not split_w: wflux = (flux[0], flux[0], flux[0]) # Not accessed, but we need arrays with the right type
+   # The loop covers the interface dimensions, the members of a batch are processed one after the other
+   for member in numpy.ndindex(u_L.shape[:-3]):
+      var_member = (slice(None),) + member
+      _rusanov_3d_loop(var_L[var_member], var_R[var_member], u_L[member], u_R[member], pres_L[member],
+                       pres_R[member], metric_itf, advection_only, flux[var_member], split_w,
+                       *(array[member] for array in wflux))
+
+########################
+# NumPy implementations
+
+def _ausm_2d_numpy(var_L, var_R, pres_L, pres_R, idx_normal, flux, mass_only):
+   a_L = numpy.sqrt(heat_capacity_ratio * pres_L / var_L[idx_2d_rho])
+   M_L = var_L[idx_normal] / (var_L[idx_2d_rho] * a_L)
+
+   a_R = numpy.sqrt(heat_capacity_ratio * pres_R / var_R[idx_2d_rho])
+   M_R = var_R[idx_normal] / (var_R[idx_2d_rho] * a_R)
+
+   M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
+
+   transported = slice(idx_2d_rho, idx_2d_rho + 1) if mass_only else slice(None)
+   flux[transported] = var_L[transported] * (numpy.maximum(0., M) * a_L) + \
+                       var_R[transported] * (numpy.minimum(0., M) * a_R)
+   flux[idx_normal] += 0.5 * ((1. + M_L) * pres_L + (1. - M_R) * pres_R)
+
+def _ausm_sw_numpy(var_L, var_R, sqrtG, H_normal, H_1, H_2, idx_normal, flux):
+   # Left state
+   p1_L = sqrtG * 0.5 * gravity * H_1 * var_L[idx_h]**2
+   p2_L = sqrtG * 0.5 * gravity * H_2 * var_L[idx_h]**2
+   a_L  = numpy.sqrt(gravity * var_L[idx_h] * H_normal)
+   M_L  = var_L[idx_normal] / (var_L[idx_h] * a_L)
+
+   # Right state
+   p1_R = sqrtG * 0.5 * gravity * H_1 * var_R[idx_h]**2
+   p2_R = sqrtG * 0.5 * gravity * H_2 * var_R[idx_h]**2
+   a_R  = numpy.sqrt(gravity * var_R[idx_h] * H_normal)
+   M_R  = var_R[idx_normal] / (var_R[idx_h] * a_R)
+
+   M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
+
+   # Advection part, then pressure part
+   flux[...] = sqrtG * (numpy.maximum(0., M) * a_L * var_L + numpy.minimum(0., M) * a_R * var_R)
+   flux[idx_hu1] += 0.5 * ((1. + M_L) * p1_L + (1. - M_R) * p1_R)
+   flux[idx_hu2] += 0.5 * ((1. + M_L) * p2_L + (1. - M_R) * p2_R)
+
+def _rusanov_3d_numpy(var_L, var_R, u_L, u_R, pres_L, pres_R, metric_itf, advection_only, flux, wflux):
+   sqrtG    = metric_itf[0]
+   H_normal = metric_itf[1]
+   sqrtG_H  = metric_itf[2:]
+
+   if advection_only: # Eigenvalues are simply the advection speeds
+      eig_L = numpy.abs(u_L)
+      eig_R = numpy.abs(u_R)
+   else: # Maximum eigenvalue is |u| + c_sound
+      eig_L = numpy.abs(u_L) + numpy.sqrt(H_normal * heat_capacity_ratio * pres_L / var_L[idx_rho])
+      eig_R = numpy.abs(u_R) + numpy.sqrt(H_normal * heat_capacity_ratio * pres_R / var_R[idx_rho])
+
+   eig = numpy.maximum(eig_L, eig_R)
+
+   # Advective part of the flux ...
+   flux_L = sqrtG * u_L * var_L
+   flux_R = sqrtG * u_R * var_R
+
+   if wflux is not None:
+      wflux_adv, wflux_pres_L, wflux_pres_R = wflux
+      wflux_adv[...] = 0.5 * (flux_L[idx_rho_w] + flux_R[idx_rho_w] - eig * sqrtG * (var_R[idx_rho_w] - var_L[idx_rho_w]))
+      wflux_pres = 0.5 * (sqrtG_H[2] * pres_L + sqrtG_H[2] * pres_R)
+      wflux_pres_L[...] = wflux_pres / pres_L
+      wflux_pres_R[...] = wflux_pres / pres_R
+
+   # ... and add the pressure part
+   flux_L[idx_rho_u1:idx_rho_w + 1] += sqrtG_H * pres_L
+   flux_R[idx_rho_u1:idx_rho_w + 1] += sqrtG_H * pres_R
+
+   flux[...] = 0.5 * (flux_L + flux_R - eig * sqrtG * (var_R - var_L))
+
+########################
+# Numba implementations
+
+def _jit(function):
+   """Compile the given function with Numba (lazily, at its first call). Without Numba, the function is left as is,
+   but is never called."""
+   return numba.njit(cache=True)(function) if numba_available else function
+
+@_jit
+def _positive_part(x):
+   """Same as numpy.maximum(0., x), for a real or complex scalar"""
+   if x.real > 0. or (x.real == 0. and x.imag > 0.): return x
+   return x * 0.
+
+@_jit
+def _negative_part(x):
+   """Same as numpy.minimum(0., x), for a real or complex scalar"""
+   if x.real < 0. or (x.real == 0. and x.imag < 0.): return x
+   return x * 0.
+
+@_jit
+def _maximum(x, y):
+   """Same as numpy.maximum(x, y), for real or complex scalars"""
+   if x.real > y.real or (x.real == y.real and x.imag >= y.imag): return x
+   return y
+
+@_jit
+def _ausm_2d_loop(var_L, var_R, pres_L, pres_R, idx_normal, flux, mass_only):
+   first_eq, last_eq = (idx_2d_rho, idx_2d_rho + 1) if mass_only else (0, var_L.shape[0])
+   for i in range(pres_L.shape[0]):
+      for j in range(pres_L.shape[1]):
+         a_L = numpy.sqrt(heat_capacity_ratio * pres_L[i, j] / var_L[idx_2d_rho, i, j])
+         M_L = var_L[idx_normal, i, j] / (var_L[idx_2d_rho, i, j] * a_L)
+
+         a_R = numpy.sqrt(heat_capacity_ratio * pres_R[i, j] / var_R[idx_2d_rho, i, j])
+         M_R = var_R[idx_normal, i, j] / (var_R[idx_2d_rho, i, j] * a_R)
+
+         M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
+
+         coef_L = _positive_part(M) * a_L
+         coef_R = _negative_part(M) * a_R
+         for eq in range(first_eq, last_eq):
+            flux[eq, i, j] = var_L[eq, i, j] * coef_L + var_R[eq, i, j] * coef_R
+         flux[idx_normal, i, j] += 0.5 * ((1. + M_L) * pres_L[i, j] + (1. - M_R) * pres_R[i, j])
+
+@_jit
+def _ausm_sw_loop(var_L, var_R, sqrtG, H_normal, H_1, H_2, idx_normal, flux):
+   for i in range(sqrtG.shape[0]):
+      for j in range(sqrtG.shape[1]):
+         h_L = var_L[idx_h, i, j]
+         h_R = var_R[idx_h, i, j]
+         half_g = sqrtG[i, j] * 0.5 * gravity
+
+         a_L = numpy.sqrt(gravity * h_L * H_normal[i, j])
+         M_L = var_L[idx_normal, i, j] / (h_L * a_L)
+
+         a_R = numpy.sqrt(gravity * h_R * H_normal[i, j])
+         M_R = var_R[idx_normal, i, j] / (h_R * a_R)
+
+         M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
+
+         coef_L = _positive_part(M) * a_L
+         coef_R = _negative_part(M) * a_R
+         for eq in range(var_L.shape[0]):
+            flux[eq, i, j] = sqrtG[i, j] * (coef_L * var_L[eq, i, j] + coef_R * var_R[eq, i, j])
+
+         flux[idx_hu1, i, j] += 0.5 * ((1. + M_L) * (half_g * H_1[i, j] * h_L**2) +
+                                       (1. - M_R) * (half_g * H_1[i, j] * h_R**2))
+         flux[idx_hu2, i, j] += 0.5 * ((1. + M_L) * (half_g * H_2[i, j] * h_L**2) +
+                                       (1. - M_R) * (half_g * H_2[i, j] * h_R**2))
+
+@_jit
+def _rusanov_3d_loop(var_L, var_R, u_L, u_R, pres_L, pres_R, metric_itf, advection_only, flux, split_w, wflux_adv,
+                     wflux_pres_L, wflux_pres_R):
+   for i in range(u_L.shape[0]):
+      for j in range(u_L.shape[1]):
+         for k in range(u_L.shape[2]):
+            p_L = pres_L[i, j, k]
+            p_R = pres_R[i, j, k]
+
+            # Speed of sound (0 if advection only), with the same type as the pressure
+            c_L = p_L * 0.
+            c_R = p_R * 0.
+            if not advection_only:
+               c_L = numpy.sqrt(metric_itf[1, i, j, k] * heat_capacity_ratio * p_L / var_L[idx_rho, i, j, k])
+               c_R = numpy.sqrt(metric_itf[1, i, j, k] * heat_capacity_ratio * p_R / var_R[idx_rho, i, j, k])
+            eig = _maximum(abs(u_L[i, j, k]) + c_L, abs(u_R[i, j, k]) + c_R)
+
+            g     = metric_itf[0, i, j, k]
+            g_u_L = g * u_L[i, j, k]
+            g_u_R = g * u_R[i, j, k]
+            g_eig = eig * g
+            for eq in range(var_L.shape[0]):
+               flux_L = g_u_L * var_L[eq, i, j, k]
+               flux_R = g_u_R * var_R[eq, i, j, k]
+               jump   = g_eig * (var_R[eq, i, j, k] - var_L[eq, i, j, k])
+
+               if idx_rho_u1 <= eq <= idx_rho_w:
+                  if eq == idx_rho_w and split_w:
+                     wflux_adv[i, j, k] = 0.5 * (flux_L + flux_R - jump)
+                  g_H = metric_itf[2 + eq - idx_rho_u1, i, j, k]
+                  flux_L += g_H * p_L
+                  flux_R += g_H * p_R
+
+               flux[eq, i, j, k] = 0.5 * (flux_L + flux_R - jump)
+
+            if split_w:
+               g_H = metric_itf[4, i, j, k]
+               wflux_pres = 0.5 * (g_H * p_L + g_H * p_R)
+               wflux_pres_L[i, j, k] = wflux_pres / p_L
+               wflux_pres_R[i, j, k] = wflux_pres / p_R
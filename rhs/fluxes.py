@@ -7,6 +7,7 @@ import numpy
 
 from common.definitions import cpd, cvd, heat_capacity_ratio, p0, Rd, \
                                idx_2d_rho, idx_2d_rho_u, idx_2d_rho_w, idx_2d_rho_theta
+from .flux_kernels      import ausm_2d
 
 FluxFunction2D = Callable[[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray,
                            numpy.ndarray, numpy.ndarray],
@@ -15,40 +16,13 @@ FluxFunction2D = Callable[[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.nd
 def ausm_2d_fv(Q, ifaces_var, ifaces_pres, ifaces_flux, kfaces_var, kfaces_pres, kfaces_flux):
    del Q
    # --- Common AUSM fluxes --- vertical
-
-   # Left
-   a_L = numpy.sqrt(heat_capacity_ratio * kfaces_pres[:-1, 1, :] / kfaces_var[idx_2d_rho, :-1, 1, :])
-   M_L = kfaces_var[idx_2d_rho_w, :-1, 1, :] / (kfaces_var[idx_2d_rho, :-1, 1, :] * a_L)
-
-   # Right
-   a_R = numpy.sqrt(heat_capacity_ratio * kfaces_pres[1:, 0, :] / kfaces_var[idx_2d_rho, 1:, 0, :])
-   M_R = kfaces_var[idx_2d_rho_w, 1:, 0, :] / (kfaces_var[idx_2d_rho, 1:, 0, :] * a_R)
-
-   # Mid
-   M = 0.25 * (( M_L + 1.)**2 - (M_R - 1.)**2)
-
-   kfaces_flux[:, 1:, 0, :] = \
-      (kfaces_var[:, :-1, 1, :] * numpy.maximum(0., M) * a_L) + (kfaces_var[:, 1: , 0, :] * numpy.minimum(0., M) * a_R)
-   kfaces_flux[idx_2d_rho_w, 1:, 0, :] += \
-      0.5 * ((1. + M_L) * kfaces_pres[:-1,1,:] + (1. - M_R) * kfaces_pres[1:,0,:])
+   ausm_2d(kfaces_var[:, :-1, 1, :], kfaces_var[:, 1:, 0, :], kfaces_pres[:-1, 1, :], kfaces_pres[1:, 0, :],
+           idx_2d_rho_w, kfaces_flux[:, 1:, 0, :])
    kfaces_flux[:, :-1, 1, :] = kfaces_flux[:, 1:, 0, :]
 
    # --- Common AUSM fluxes --- horizontal
-
-   # Left state
-   a_L = numpy.sqrt(heat_capacity_ratio * ifaces_pres[:-1, :, 1] / ifaces_var[idx_2d_rho, :-1, :, 1])
-   M_L = ifaces_var[idx_2d_rho_u, :-1, :, 1] / (ifaces_var[idx_2d_rho, :-1, :, 1] * a_L)
-
-   # Right state
-   a_R = numpy.sqrt(heat_capacity_ratio * ifaces_pres[1:, :, 0] / ifaces_var[idx_2d_rho, 1:, :, 0])
-   M_R = ifaces_var[idx_2d_rho_u, 1:, :, 0] / ( ifaces_var[idx_2d_rho, 1:, :, 0] * a_R)
-
-   M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
-
-   ifaces_flux[:, 1:, :, 0] = \
-      (ifaces_var[:, :-1, :, 1] * numpy.maximum(0., M) * a_L) + (ifaces_var[:, 1:, :, 0] * numpy.minimum(0., M) * a_R)
-   ifaces_flux[idx_2d_rho_u, 1:, :, 0] += \
-      0.5 * ((1. + M_L) * ifaces_pres[:-1, :, 1] + (1. - M_R) * ifaces_pres[1:, :, 0])
+   ausm_2d(ifaces_var[:, :-1, :, 1], ifaces_var[:, 1:, :, 0], ifaces_pres[:-1, :, 1], ifaces_pres[1:, :, 0],
+           idx_2d_rho_u, ifaces_flux[:, 1:, :, 0])
    ifaces_flux[:, :-1, :, 1] = ifaces_flux[:, 1:, :, 0]
 
    return (ifaces_flux, kfaces_flux)
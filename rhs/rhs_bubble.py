@@ -1,33 +1,22 @@
 import numpy
 
-from common.definitions import idx_2d_rho, idx_2d_rho_u, idx_2d_rho_w, idx_2d_rho_theta,  \
-                               p0, Rd, cpd, cvd, heat_capacity_ratio, gravity
+from common.definitions import idx_2d_rho, idx_2d_rho_u, idx_2d_rho_w, idx_2d_rho_theta, gravity
+from common.profiler    import profiler
+from .dg_2d             import derivative_x, derivative_z, extrapolate_x, extrapolate_z, \
+                               interface_flux_x, interface_flux_z, pressure_2d, wall_boundaries_x, wall_boundaries_z
+from .flux_kernels      import ausm_2d
 
+@profiler.profile()
 def rhs_bubble(Q, geom, mtrx, nbsolpts, nb_elements_x, nb_elements_z):
 
-   datatype = Q.dtype
-   nb_equations = Q.shape[0] # Number of constituent Euler equations.  Probably 6.
-
-   nb_interfaces_x = nb_elements_x + 1
-   nb_interfaces_z = nb_elements_z + 1
-
-   flux_x1 = numpy.empty_like(Q, dtype=datatype)
-   flux_x3 = numpy.empty_like(Q, dtype=datatype)
-
-   df1_dx1 = numpy.empty_like(Q, dtype=datatype)
-   df3_dx3 = numpy.empty_like(Q, dtype=datatype)
-
-   kfaces_flux = numpy.empty((nb_equations, nb_elements_z, 2, nbsolpts*nb_elements_x), dtype=datatype)
-   kfaces_var  = numpy.empty((nb_equations, nb_elements_z, 2, nbsolpts*nb_elements_x), dtype=datatype)
-
-   ifaces_flux = numpy.empty((nb_equations, nb_elements_x, nbsolpts*nb_elements_z, 2), dtype=datatype)
-   ifaces_var  = numpy.empty((nb_equations, nb_elements_x, nbsolpts*nb_elements_z, 2), dtype=datatype)
+   flux_x1 = numpy.empty_like(Q)
+   flux_x3 = numpy.empty_like(Q)
 
    # --- Unpack physical variables
    rho      = Q[idx_2d_rho,:,:]
    uu       = Q[idx_2d_rho_u,:,:] / rho
    ww       = Q[idx_2d_rho_w,:,:] / rho
-   pressure = p0 * numpy.exp((cpd/cvd) * numpy.log((Rd/p0)*Q[idx_2d_rho_theta, :, :]))
+   pressure = pressure_2d(Q[idx_2d_rho_theta, :, :])
 
    # --- Compute the fluxes
    flux_x1[idx_2d_rho,:,:]       = Q[idx_2d_rho_u,:,:]
@@ -41,106 +30,33 @@ def rhs_bubble(Q, geom, mtrx, nbsolpts, nb_elements_x, nb_elements_z):
    flux_x3[idx_2d_rho_theta,:,:] = Q[idx_2d_rho_theta,:,:] * ww
 
    # --- Interpolate to the element interface
-   standard_slice = numpy.arange(nbsolpts)
-   for elem in range(nb_elements_z):
-      epais = elem * nbsolpts + standard_slice
-
-      kfaces_var[:,elem,0,:] = mtrx.extrap_down @ Q[:,epais,:]
-      kfaces_var[:,elem,1,:] = mtrx.extrap_up @ Q[:,epais,:]
-
-   for elem in range(nb_elements_x):
-      epais = elem * nbsolpts + standard_slice
-
-      ifaces_var[:,elem,:,0] = Q[:,:,epais] @ mtrx.extrap_west
-      ifaces_var[:,elem,:,1] = Q[:,:,epais] @ mtrx.extrap_east
+   ifaces_var = extrapolate_x(Q, mtrx, nbsolpts)
+   kfaces_var = extrapolate_z(Q, mtrx, nbsolpts)
 
    # --- Interface pressure
-   ifaces_pres = p0 * (ifaces_var[idx_2d_rho_theta] * Rd / p0)**(cpd / cvd)
-   kfaces_pres = p0 * (kfaces_var[idx_2d_rho_theta] * Rd / p0)**(cpd / cvd)
+   ifaces_pres = pressure_2d(ifaces_var[idx_2d_rho_theta])
+   kfaces_pres = pressure_2d(kfaces_var[idx_2d_rho_theta])
 
-   # --- Bondary treatement
-
-   # zeros flux BCs everywhere ...
-   kfaces_flux[:,0,0,:]  = 0.0
-   kfaces_flux[:,-1,1,:] = 0.0
+   ifaces_flux = numpy.empty_like(ifaces_var)
+   kfaces_flux = numpy.empty_like(kfaces_var)
 
-   # Skip periodic faces
+   # --- Bondary treatement
+   # Zero flux BCs everywhere, except for momentum eqs where pressure is extrapolated to BCs. Skip periodic faces.
+   wall_boundaries_z(kfaces_pres, kfaces_flux)
    if not geom.xperiodic:
-      ifaces_flux[:, 0,:,0] = 0.0
-      ifaces_flux[:,-1,:,1] = 0.0
-
-   # except for momentum eqs where pressure is extrapolated to BCs.
-   kfaces_flux[idx_2d_rho_w, 0, 0, :] = kfaces_pres[ 0, 0, :]
-   kfaces_flux[idx_2d_rho_w,-1, 1, :] = kfaces_pres[-1, 1, :]
-
-   ifaces_flux[idx_2d_rho_u, 0,:,0] = ifaces_pres[0,:,0]  # TODO : pour les cas théoriques seulement ...
-   ifaces_flux[idx_2d_rho_u,-1,:,1] = ifaces_pres[-1,:,1]
+      wall_boundaries_x(ifaces_pres, ifaces_flux) # TODO : pour les cas théoriques seulement ...
 
    # --- Common AUSM fluxes
-   for itf in range(1, nb_interfaces_z - 1):
-
-      left  = itf - 1
-      right = itf
-
-      # Left state
-      a_L = numpy.sqrt(heat_capacity_ratio * kfaces_pres[left, 1, :] / kfaces_var[idx_2d_rho, left, 1, :])
-      M_L = kfaces_var[idx_2d_rho_w, left, 1, :] / (kfaces_var[idx_2d_rho, left, 1, :] * a_L)
-
-      # Right state
-      a_R = numpy.sqrt(heat_capacity_ratio * kfaces_pres[right, 0, :] / kfaces_var[idx_2d_rho, right, 0, :])
-      M_R = kfaces_var[idx_2d_rho_w, right, 0, :] / (kfaces_var[idx_2d_rho, right, 0, :] * a_R)
-
-      M = 0.25 * (( M_L + 1.)**2 - (M_R - 1.)**2)
-
-      kfaces_flux[:,right,0,:] = (kfaces_var[:,left,1,:] * numpy.maximum(0., M) * a_L) + \
-                                 (kfaces_var[:,right,0,:] * numpy.minimum(0., M) * a_R)
-      kfaces_flux[idx_2d_rho_w,right,0,:] += 0.5 * ((1. + M_L) * kfaces_pres[left,1,:] + \
-                                                    (1. - M_R) * kfaces_pres[right,0,:])
-
-      kfaces_flux[:,left,1,:] = kfaces_flux[:,right,0,:]
-
-
-   start = 0 if geom.xperiodic else 1
-   for itf in range(start, nb_interfaces_x - 1):
-
-      left  = itf - 1
-      right = itf
-
-      # Left state
-      a_L = numpy.sqrt(heat_capacity_ratio * ifaces_pres[left, :, 1] / ifaces_var[idx_2d_rho, left, :, 1])
-      M_L = ifaces_var[idx_2d_rho_u, left, :, 1] / (ifaces_var[idx_2d_rho, left, :, 1] * a_L)
-
-      # Right state
-      a_R = numpy.sqrt(heat_capacity_ratio * ifaces_pres[right, :, 0] / ifaces_var[idx_2d_rho, right, :, 0])
-      M_R = ifaces_var[idx_2d_rho_u, right, :, 0] / ( ifaces_var[idx_2d_rho, right, :, 0] * a_R)
-
-      M = 0.25 * ((M_L + 1.)**2 - (M_R - 1.)**2)
-
-      ifaces_flux[:,right,:,0] = (ifaces_var[:,left,:,1] * numpy.maximum(0., M) * a_L) + \
-                                 (ifaces_var[:,right,:,0] * numpy.minimum(0., M) * a_R)
-      ifaces_flux[idx_2d_rho_u,right,:,0] += 0.5 * ((1. + M_L) * ifaces_pres[left,:,1] + \
-                                                    (1. - M_R) * ifaces_pres[right,:,0])
-
-      ifaces_flux[:,left,:,1] = ifaces_flux[:,right,:,0]
-
-   if geom.xperiodic:
-      ifaces_flux[:, 0, :, 0] = ifaces_flux[:, -1, :, 1]
+   interface_flux_z(kfaces_var, kfaces_pres, kfaces_flux, ausm_2d)
+   interface_flux_x(ifaces_var, ifaces_pres, ifaces_flux, ausm_2d, periodic=geom.xperiodic)
 
    # --- Compute the derivatives
-   for elem in range(nb_elements_z):
-      epais = elem * nbsolpts + standard_slice
-      factor = 2.0 / geom.Δx3
-      if elem < geom.nb_elements_relief_layer:
-         factor = 2.0 / geom.relief_layer_delta
-
-      df3_dx3[:, epais, :] = \
-         (mtrx.diff_solpt @ flux_x3[:, epais, :] + mtrx.correction @ kfaces_flux[:, elem, :, :]) * factor
-
-   for elem in range(nb_elements_x):
-      epais = elem * nbsolpts + numpy.arange(nbsolpts)
+   factor_x3 = numpy.full((nb_elements_z, 1, 1), 2.0 / geom.Δx3)
+   if geom.nb_elements_relief_layer > 0:
+      factor_x3[:geom.nb_elements_relief_layer] = 2.0 / geom.relief_layer_delta
 
-      df1_dx1[:,:,epais] = (flux_x1[:,:,epais] @ mtrx.diff_solpt.T + ifaces_flux[:,elem,:,:] @ mtrx.correction.T) * \
-                           2.0/geom.Δx1
+   df1_dx1 = derivative_x(flux_x1, ifaces_flux, mtrx, nbsolpts, 2.0 / geom.Δx1)
+   df3_dx3 = derivative_z(flux_x3, kfaces_flux, mtrx, nbsolpts, factor_x3)
 
    # --- Assemble the right-hand sides
    rhs = - ( df1_dx1 + df3_dx3 )
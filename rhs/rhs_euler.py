@@ -1,14 +1,16 @@
 import numpy
 import sys
 
-from common.definitions import idx_rho_u1, idx_rho_u2, idx_rho_w, idx_rho, idx_rho_theta, gravity, p0, Rd, cpd, cvd, heat_capacity_ratio
+from common.definitions import idx_rho_u1, idx_rho_u2, idx_rho_w, idx_rho, idx_rho_theta, gravity, p0, Rd, cpd, cvd
+from common.profiler    import profiler
+from rhs.flux_kernels   import rusanov_3d
 
 # For type hints
 from common.parallel import DistributedWorld
 from geometry        import CubedSphere, DFROperators, Metric3DTopo
 from init.dcmip      import dcmip_schar_damping
 
-#@profile
+@profiler.profile()
 def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric: Metric3DTopo, ptopo: DistributedWorld,
                nbsolpts: int, nb_elements_hori: int, nb_elements_vert: int, case_number: int):
    '''Evaluate the right-hand side of the three-dimensional Euler equations.
@@ -21,10 +23,14 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
 
    Note that this function includes MPI communication for inter-process boundary interactions, so it must be called collectively.
 
+   Several states can be evaluated in a single call, by stacking them along a leading (member) axis of Q. The batch is
+   then processed as one state whose variables carry an extra member dimension: the metric terms broadcast along it, and
+   the interfaces of all members go to the neighbouring processes in the same message.
+
    Parameters
    ----------
    Q : numpy.ndarray
-      Input array of the current model state, indexed as (var,k,j,i)
+      Input array of the current model state, indexed as (var,k,j,i), or of a batch of states, indexed as (member,var,k,j,i)
    geom : CubedSphere
       Geometry definition, containing parameters relating to the spherical coordinate system
    mtrx : DFR_operators
@@ -48,34 +54,37 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
    Returns:
    --------
    rhs : numpy.ndarray
-      Output of right-hand-side terms of Euler equations
+      Output of right-hand-side terms of Euler equations, with the same shape as Q
    '''
 
+   # A batch is laid out as (var,member,k,j,i), so that each variable holds all the members
+   batched = Q.ndim == 5
+   if batched:
+      Q = numpy.ascontiguousarray(numpy.moveaxis(Q, 0, 1))
+
    type_vec = Q.dtype #  Output/processing type -- may be complex
    nb_equations = Q.shape[0] # Number of constituent Euler equations.  Probably 6.
+   batch_shape = Q.shape[1:-3] # (nb_members,) for a batch, () otherwise
    nb_interfaces_hori = nb_elements_hori + 1 # Number of element interfaces per horizontal dimension
    nb_interfaces_vert = nb_elements_vert + 1 # Number of element interfaces in the vertical dimension
    nb_pts_hori = nb_elements_hori * nbsolpts # Total number of solution points per horizontal dimension
    nb_vertical_levels = nb_elements_vert * nbsolpts # Total number of solution points in the vertical dimension
 
-   # Create new arrays for each component of T^μν_:ν, plus one more for the final right hand side
-   df1_dx1, df2_dx2, df3_dx3, rhs = [numpy.empty_like(Q, dtype=type_vec) for _ in range(4)]
-
    # Array for forcing: Coriolis terms, metric corrections from the curvilinear coordinate, and gravity
    forcing = numpy.zeros_like(Q, dtype=type_vec)
 
    # Array to extrapolate variables and fluxes to the boundaries along x (i)
-   variables_itf_i = numpy.ones((nb_equations, nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec) # Initialized to one in the halo to avoid division by zero later
+   variables_itf_i = numpy.ones((nb_equations,) + batch_shape + (nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec) # Initialized to one in the halo to avoid division by zero later
    # Note that flux_x1_itf_i has a different shape than variables_itf_i
-   flux_x1_itf_i   = numpy.empty((nb_equations, nb_vertical_levels, nb_elements_hori + 2, nb_pts_hori, 2), dtype=type_vec)
+   flux_x1_itf_i   = numpy.empty((nb_equations,) + batch_shape + (nb_vertical_levels, nb_elements_hori + 2, nb_pts_hori, 2), dtype=type_vec)
 
    # Extrapolation arrays along y (j)
-   variables_itf_j = numpy.ones((nb_equations, nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec) # Initialized to one in the halo to avoid division by zero later
-   flux_x2_itf_j   = numpy.empty((nb_equations, nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec)
+   variables_itf_j = numpy.ones((nb_equations,) + batch_shape + (nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec) # Initialized to one in the halo to avoid division by zero later
+   flux_x2_itf_j   = numpy.empty((nb_equations,) + batch_shape + (nb_vertical_levels, nb_elements_hori + 2, 2, nb_pts_hori), dtype=type_vec)
 
    # Extrapolation arrays along z (k), note dimensions of (6, nj, nk+2, 2, ni)
-   variables_itf_k = numpy.empty((nb_equations, nb_pts_hori, nb_elements_vert + 2, 2, nb_pts_hori), dtype=type_vec)
-   flux_x3_itf_k   = numpy.empty((nb_equations, nb_pts_hori, nb_elements_vert + 2, 2, nb_pts_hori), dtype=type_vec)
+   variables_itf_k = numpy.empty((nb_equations,) + batch_shape + (nb_pts_hori, nb_elements_vert + 2, 2, nb_pts_hori), dtype=type_vec)
+   flux_x3_itf_k   = numpy.empty((nb_equations,) + batch_shape + (nb_pts_hori, nb_elements_vert + 2, 2, nb_pts_hori), dtype=type_vec)
 
    # Special arrays for calculation of (ρw) flux
    wflux_adv_x1_itf_i = numpy.zeros_like(flux_x1_itf_i[0,:])
@@ -116,18 +125,26 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
    #    variables_itf_j[:, :, pos, 0, :] = mtrx.extrap_south @ Q[:, :, epais, :]
    #    variables_itf_j[:, :, pos, 1, :] = mtrx.extrap_north @ Q[:, :, epais, :]
 
-   variables_itf_i[:,:,1:-1,:,:] = mtrx.extrapolate_i(Q,geom).transpose((0,1,3,4,2))
-   variables_itf_j[:,:,1:-1,:,:] = mtrx.extrapolate_j(Q,geom)
+   # Density and potential temperature are reconstructed from their logarithm. We extrapolate all variables and
+   # the two scaled variables together, so that each direction needs a single pass over the data
+   idx_logrho      = nb_equations
+   idx_logrhotheta = nb_equations + 1
+   variables_ext = numpy.empty((nb_equations + 2,) + Q.shape[1:], dtype=type_vec)
+   variables_ext[:nb_equations]   = Q
+   variables_ext[idx_logrho]      = numpy.log(Q[idx_rho])
+   variables_ext[idx_logrhotheta] = numpy.log(Q[idx_rho_theta])
 
-   # Scaled variables for separate reconstruction
-   logrho = numpy.log(Q[idx_rho,:])
-   logrhotheta = numpy.log(Q[idx_rho_theta,:])
+   ext_itf_i = numpy.moveaxis(mtrx.extrapolate_i(variables_ext, geom), -3, -1)
+   ext_itf_j = mtrx.extrapolate_j(variables_ext, geom)
 
-   variables_itf_i[idx_rho,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_i(logrho,geom)).transpose((0,2,3,1))
-   variables_itf_j[idx_rho,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_j(logrho,geom))
+   variables_itf_i[...,1:-1,:,:] = ext_itf_i[:nb_equations]
+   variables_itf_j[...,1:-1,:,:] = ext_itf_j[:nb_equations]
 
-   variables_itf_i[idx_rho_theta,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_i(logrhotheta,geom)).transpose((0,2,3,1))
-   variables_itf_j[idx_rho_theta,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_j(logrhotheta,geom))
+   variables_itf_i[idx_rho,...,1:-1,:,:] = numpy.exp(ext_itf_i[idx_logrho])
+   variables_itf_j[idx_rho,...,1:-1,:,:] = numpy.exp(ext_itf_j[idx_logrho])
+
+   variables_itf_i[idx_rho_theta,...,1:-1,:,:] = numpy.exp(ext_itf_i[idx_logrhotheta])
+   variables_itf_j[idx_rho_theta,...,1:-1,:,:] = numpy.exp(ext_itf_j[idx_logrhotheta])
 
    # Transfer boundary values to neighbouring proessors/panels, including conversion of vector quantities
    # to the recipient's local coordinate system
@@ -143,41 +160,46 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
 
    # Compute the fluxes (equation 3 of Charron & Gaudreault 2021, LHS)
 
+   # All the quantities that are differentiated along a given direction are stored in a single array, so that they
+   # can be differentiated together: the fluxes, then the advective and pressure parts of the (ρw) flux, then log(p)
+   idx_wflux_adv  = nb_equations
+   idx_wflux_pres = nb_equations + 1
+   idx_logp       = nb_equations + 2
+   nb_derivatives = nb_equations + 3
+   all_flux_x1, all_flux_x2, all_flux_x3 = \
+      [numpy.empty((nb_derivatives,) + Q.shape[1:], dtype=type_vec) for _ in range(3)]
+
    # Compute the advective fluxes ...
-   flux_x1 = metric.sqrtG * u1 * Q
-   flux_x2 = metric.sqrtG * u2 * Q
-   flux_x3 = metric.sqrtG * w  * Q
+   flux_x1 = numpy.multiply(metric.sqrtG * u1, Q, out=all_flux_x1[:nb_equations])
+   flux_x2 = numpy.multiply(metric.sqrtG * u2, Q, out=all_flux_x2[:nb_equations])
+   flux_x3 = numpy.multiply(metric.sqrtG * w,  Q, out=all_flux_x3[:nb_equations])
 
-   wflux_adv_x1 = metric.sqrtG * u1 * Q[idx_rho_w,:]
-   wflux_adv_x2 = metric.sqrtG * u2 * Q[idx_rho_w,:]
-   wflux_adv_x3 = metric.sqrtG * w  * Q[idx_rho_w,:]
+   wflux_adv_x1 = all_flux_x1[idx_wflux_adv]
+   wflux_adv_x2 = all_flux_x2[idx_wflux_adv]
+   wflux_adv_x3 = all_flux_x3[idx_wflux_adv]
+   wflux_adv_x1[:] = flux_x1[idx_rho_w]
+   wflux_adv_x2[:] = flux_x2[idx_rho_w]
+   wflux_adv_x3[:] = flux_x3[idx_rho_w]
 
    # ... and add the pressure component
    # Performance note: exp(log) is measuably faster than ** (pow)
    pressure = p0 * numpy.exp((cpd/cvd) * numpy.log((Rd/p0)*Q[idx_rho_theta]))
    #pressure = Rd * Q[idx_rho_theta]
 
-   wflux_pres_x1 = numpy.zeros(metric.sqrtG.shape,dtype=type_vec)
-   wflux_pres_x2 = numpy.zeros(metric.sqrtG.shape,dtype=type_vec)
-   wflux_pres_x3 = numpy.zeros(metric.sqrtG.shape,dtype=type_vec)
+   wflux_pres_x1 = all_flux_x1[idx_wflux_pres]
+   wflux_pres_x2 = all_flux_x2[idx_wflux_pres]
+   wflux_pres_x3 = all_flux_x3[idx_wflux_pres]
 
-   flux_x1[idx_rho_u1] += metric.sqrtG * metric.H_contra_11 * pressure
-   flux_x1[idx_rho_u2] += metric.sqrtG * metric.H_contra_12 * pressure
-   flux_x1[idx_rho_w]  += metric.sqrtG * metric.H_contra_13 * pressure
+   # The momentum equations are contiguous, so each flux gets its 3 pressure terms (√g H^ij p) in one operation. With a
+   # batch, the metric terms need a (size-1) member dimension to broadcast against the momentum equations
+   sqrtG_H_contra = numpy.expand_dims(metric.sqrtG_H_contra, tuple(range(2, 2 + len(batch_shape))))
+   flux_x1[idx_rho_u1:idx_rho_w+1] += sqrtG_H_contra[0] * pressure
+   flux_x2[idx_rho_u1:idx_rho_w+1] += sqrtG_H_contra[1] * pressure
+   flux_x3[idx_rho_u1:idx_rho_w+1] += sqrtG_H_contra[2] * pressure
 
-   wflux_pres_x1[:] = metric.sqrtG * metric.H_contra_13 # times pressure
-
-   flux_x2[idx_rho_u1] += metric.sqrtG * metric.H_contra_21 * pressure
-   flux_x2[idx_rho_u2] += metric.sqrtG * metric.H_contra_22 * pressure
-   flux_x2[idx_rho_w]  += metric.sqrtG * metric.H_contra_23 * pressure
-
-   wflux_pres_x2[:] = metric.sqrtG * metric.H_contra_23 # times pressure
-
-   flux_x3[idx_rho_u1] += metric.sqrtG * metric.H_contra_31 * pressure
-   flux_x3[idx_rho_u2] += metric.sqrtG * metric.H_contra_32 * pressure
-   flux_x3[idx_rho_w]  += metric.sqrtG * metric.H_contra_33 * pressure
-
-   wflux_pres_x3[:] = metric.sqrtG * metric.H_contra_33 # times pressure
+   wflux_pres_x1[:] = metric.sqrtG_H_contra[0, 2] # times pressure
+   wflux_pres_x2[:] = metric.sqrtG_H_contra[1, 2] # times pressure
+   wflux_pres_x3[:] = metric.sqrtG_H_contra[2, 2] # times pressure
 
    # if (ptopo.rank == 0): print('√g: %e, H^33: %e' % (metric.sqrtG[0,0],metric.H_contra_33[0,0]))
 
@@ -209,18 +231,19 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
    #       variables_itf_k[:, slab, pos, 0, :] = mtrx.extrap_down @ Q[:, epais, slab, :]
    #       variables_itf_k[:, slab, pos, 1, :] = mtrx.extrap_up   @ Q[:, epais, slab, :]
 
-   variables_itf_k[:,:,1:-1,:,:] = mtrx.extrapolate_k(Q,geom).transpose((0,3,1,2,4))
+   ext_itf_k = numpy.moveaxis(mtrx.extrapolate_k(variables_ext, geom), -2, -4)
 
-   variables_itf_k[idx_rho,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_k(logrho,geom).transpose((2,0,1,3)))
-   variables_itf_k[idx_rho_theta,:,1:-1,:,:] = numpy.exp(mtrx.extrapolate_k(logrhotheta,geom).transpose((2,0,1,3)))
+   variables_itf_k[...,1:-1,:,:] = ext_itf_k[:nb_equations]
+   variables_itf_k[idx_rho,...,1:-1,:,:] = numpy.exp(ext_itf_k[idx_logrho])
+   variables_itf_k[idx_rho_theta,...,1:-1,:,:] = numpy.exp(ext_itf_k[idx_logrhotheta])
 
    # For consistency at the surface and top boundaries, treat the extrapolation as continuous.  That is,
    # the "top" of the ground is equal to the "bottom" of the atmosphere, and the "bottom" of the model top
    # is equal to the "top" of the atmosphere.
-   variables_itf_k[:, :, 0, 1, :] = variables_itf_k[:, :, 1, 0, :]
-   variables_itf_k[:, :, 0, 0, :] = variables_itf_k[:, :, 0, 1, :] # Unused?
-   variables_itf_k[:, :, -1, 0, :] = variables_itf_k[:, :, -2, 1, :]
-   variables_itf_k[:, :, -1, 1, :] = variables_itf_k[:, :, -1, 0, :] # Unused?
+   variables_itf_k[..., 0, 1, :] = variables_itf_k[..., 1, 0, :]
+   variables_itf_k[..., 0, 0, :] = variables_itf_k[..., 0, 1, :] # Unused?
+   variables_itf_k[..., -1, 0, :] = variables_itf_k[..., -2, 1, :]
+   variables_itf_k[..., -1, 1, :] = variables_itf_k[..., -1, 0, :] # Unused?
 
    # Evaluate pressure at the vertical element interfaces based on ρθ.
    pressure_itf_k = p0 * numpy.exp((cpd/cvd)*numpy.log(variables_itf_k[idx_rho_theta] * (Rd / p0)))
@@ -230,78 +253,25 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
 
    # Surface and top boundary treatement, imposing no flow (w=0) through top and bottom
    # csubich -- apply odd symmetry to w at boundary so there is no advective _flux_ through boundary
-   w_itf_k[:, 0, 0, :] = 0. # Bottom of bottom element (unused)
-   w_itf_k[:, 0, 1, :] = -w_itf_k[:,1,0,:] # Top of bottom element (negative symmetry)
+   w_itf_k[..., 0, 0, :] = 0. # Bottom of bottom element (unused)
+   w_itf_k[..., 0, 1, :] = -w_itf_k[...,1,0,:] # Top of bottom element (negative symmetry)
    #w_itf_k[:, 0, 1, :] = 0.0  # Top of bottom element (bottom boundary, 0)
    #w_itf_k[:, 1, 0, :] = 0. # Bottom of lowest interior element (bottom boundary, 0)
 
-   w_itf_k[:, -1, 1, :] = 0. # Top of top element (unused)
-   w_itf_k[:, -1, 0, :] = -w_itf_k[:,-2,1,:] # Bottom of top boundary element (negative symmetry)
+   w_itf_k[..., -1, 1, :] = 0. # Top of top element (unused)
+   w_itf_k[..., -1, 0, :] = -w_itf_k[...,-2,1,:] # Bottom of top boundary element (negative symmetry)
    #w_itf_k[:, -1, 0, :] = 0.0 # Bottom of top boundary element (0)
    #w_itf_k[:, -2, 1, :] = 0. # Top of top interior element (0)
 
-   # Common Rusanov vertical fluxes
-   # flux_D_itf_k = numpy.empty((nb_equations, nb_interfaces_vert, geom.nj, geom.ni))
-   # flux_U_itf_k = numpy.empty((nb_equations, nb_interfaces_vert, geom.nj, geom.ni))
-   # eig_D_itf_k = numpy.empty((nb_interfaces_vert, geom.nj, geom.ni))
-   # eig_U_itf_k = numpy.empty((nb_interfaces_vert, geom.nj, geom.ni))
-   for itf in range(nb_interfaces_vert):
-
-      elem_D = itf
-      elem_U = itf + 1
-
-      # Direction x3
-
-      w_D = w_itf_k[:, elem_D, 1, :] # w at the top of the lower element
-      w_U = w_itf_k[:, elem_U, 0, :] # w at the bottom of the upper element
-
-      if advection_only: # Eigenvalues are simply the advection speeds
-         eig_D = numpy.abs(w_D)
-         eig_U = numpy.abs(w_U)
-      else: # Maximum eigenvalue is w + (c_sound)
-         eig_D = numpy.abs(w_D) + numpy.sqrt(metric.H_contra_33_itf_k[itf,:,:] * heat_capacity_ratio * \
-                                                pressure_itf_k[:, elem_D, 1, :] / variables_itf_k[idx_rho, :, elem_D, 1, :])
-         eig_U = numpy.abs(w_U) + numpy.sqrt(metric.H_contra_33_itf_k[itf,:,:] * heat_capacity_ratio * \
-                                                pressure_itf_k[:, elem_U, 0, :] / variables_itf_k[idx_rho, :, elem_U, 0, :])
-
-      eig = numpy.maximum(eig_D, eig_U)
-
-      # Advective part of the flux ...
-      flux_D = metric.sqrtG_itf_k[itf,:,:] * w_D * variables_itf_k[:, :, elem_D, 1, :]
-      flux_U = metric.sqrtG_itf_k[itf,:,:] * w_U * variables_itf_k[:, :, elem_U, 0, :]
-
-      # Separate variables for rho-w flux
-      wflux_adv_D = flux_D[idx_rho_w,:].copy()
-      wflux_adv_U = flux_U[idx_rho_w,:].copy()
-
-      # eig_D_itf_k[itf,:,:] = eig_D
-      # eig_U_itf_k[itf,:,:] = eig_U
-      # flux_D_itf_k[:,itf,:,:] = flux_D
-      # flux_U_itf_k[:,itf,:,:] = flux_U
-
-      # ... and add the pressure part
-      flux_D[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-
-      flux_U[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-
-      # For rho_w pressure flux, account for the pressure terms separately from the advection terms
-      wflux_pres_D = metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      wflux_pres_U = metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-
-      # Riemann solver
-      flux_x3_itf_k[:, :, elem_D, 1, :] = 0.5 * ( flux_D + flux_U - eig * metric.sqrtG_itf_k[itf,:,:] * ( variables_itf_k[:, :, elem_U, 0, :] - variables_itf_k[:, :, elem_D, 1, :] ) )
-      flux_x3_itf_k[:, :, elem_U, 0, :] = flux_x3_itf_k[:, :, elem_D, 1, :]
-
-      # Riemann solver, separating pressure and advection terms for rho-w
-      wflux_adv_x3_itf_k[:, elem_D, 1, :] = 0.5 * ( wflux_adv_D + wflux_adv_U - eig * metric.sqrtG_itf_k[itf,:,:] * \
-                                          ( variables_itf_k[idx_rho_w, :, elem_U, 0, :] - variables_itf_k[idx_rho_w, :, elem_D, 1, :] ) )
-      wflux_adv_x3_itf_k[:, elem_U, 0, :] = wflux_adv_x3_itf_k[:, elem_D, 1, :]
-      wflux_pres_x3_itf_k[:, elem_D, 1, :] = 0.5 * (wflux_pres_D + wflux_pres_U)/pressure_itf_k[:,elem_D,1,:]
-      wflux_pres_x3_itf_k[:, elem_U, 0, :] = 0.5 * (wflux_pres_D + wflux_pres_U)/pressure_itf_k[:,elem_U,0,:]
+   # Common Rusanov vertical fluxes, for all interfaces at once. Interface [itf] is between element [itf] (down) and
+   # element [itf + 1] (up) of the interface arrays
+   rusanov_3d(variables_itf_k[..., :-1, 1, :], variables_itf_k[..., 1:, 0, :],
+              w_itf_k[..., :-1, 1, :], w_itf_k[..., 1:, 0, :], pressure_itf_k[..., :-1, 1, :], pressure_itf_k[..., 1:, 0, :],
+              metric.riemann_metric_itf_k, advection_only,
+              flux_x3_itf_k[..., :-1, 1, :],
+              (wflux_adv_x3_itf_k[..., :-1, 1, :], wflux_pres_x3_itf_k[..., :-1, 1, :], wflux_pres_x3_itf_k[..., 1:, 0, :]))
+   flux_x3_itf_k[..., 1:, 0, :] = flux_x3_itf_k[..., :-1, 1, :]
+   wflux_adv_x3_itf_k[..., 1:, 0, :] = wflux_adv_x3_itf_k[..., :-1, 1, :]
 
    # for slab in range(nb_pts_hori):
    #    for elem in range(nb_elements_vert):
@@ -322,104 +292,26 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
    pressure_itf_i = p0 * numpy.exp((cpd/cvd) * numpy.log(variables_itf_i[idx_rho_theta] * (Rd / p0)))
    pressure_itf_j = p0 * numpy.exp((cpd/cvd) * numpy.log(variables_itf_j[idx_rho_theta] * (Rd / p0)))
 
-   # Riemann solver
-   for itf in range(nb_interfaces_hori):
-
-      elem_L = itf
-      elem_R = itf + 1
-
-      # Direction x1
-      u1_L = u1_itf_i[:, elem_L, 1, :] # u at the right interface of the left element
-      u1_R = u1_itf_i[:, elem_R, 0, :] # u at the left interface of the right element
-
-      if advection_only: # Advection only, eigenvalues are the velocities alone
-         eig_L = numpy.abs( u1_L )
-         eig_R = numpy.abs( u1_R )
-      else: # Otherwise, maximum eigenvalue is |u| + c_sound
-         eig_L = numpy.abs( u1_L ) + numpy.sqrt(metric.H_contra_11_itf_i[:,:,itf] * heat_capacity_ratio * pressure_itf_i[:, elem_L, 1, :] / variables_itf_i[idx_rho, :, elem_L, 1, :])
-         eig_R = numpy.abs( u1_R ) + numpy.sqrt(metric.H_contra_11_itf_i[:,:,itf] * heat_capacity_ratio * pressure_itf_i[:, elem_R, 0, :] / variables_itf_i[idx_rho, :, elem_R, 0, :])
-
-      eig = numpy.maximum(eig_L, eig_R)
-
-      # Advective part of the flux ...
-      flux_L = metric.sqrtG_itf_i[:, :, itf] * u1_L * variables_itf_i[:, :, elem_L, 1, :]
-      flux_R = metric.sqrtG_itf_i[:, :, itf] * u1_R * variables_itf_i[:, :, elem_R, 0, :]
-
-      # rho-w specific advective flux
-      wflux_adv_L = flux_L[idx_rho_w,:].copy()
-      wflux_adv_R = flux_R[idx_rho_w,:].copy()
-
-      # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-                                                                                        
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-
-      # Pressure contribution specifically for rho-w
-      wflux_pres_L = metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      wflux_pres_R = metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-
-      # --- Common Rusanov fluxes
-
-      flux_x1_itf_i[:, :, elem_L, :, 1] = 0.5 * ( flux_L  + flux_R - eig * metric.sqrtG_itf_i[:, :, itf] * ( variables_itf_i[:, :, elem_R, 0, :] - variables_itf_i[:, :, elem_L, 1, :] ) )
-      flux_x1_itf_i[:, :, elem_R, :, 0] = flux_x1_itf_i[:, :, elem_L, :, 1]
-
-      # Separating advective and pressure fluxes for rho-w
-      wflux_adv_x1_itf_i[:,elem_L,:,1] = 0.5*(wflux_adv_L + wflux_adv_R - eig*metric.sqrtG_itf_i[:,:,itf] * \
-                                       ( variables_itf_i[idx_rho_w, :, elem_R, 0, :] - variables_itf_i[idx_rho_w, :, elem_L, 1, :] ))
-      wflux_adv_x1_itf_i[:,elem_R,:,0] = wflux_adv_x1_itf_i[:,elem_L,:,1]
-      wflux_pres_x1_itf_i[:,elem_L,:,1] = 0.5*(wflux_pres_L + wflux_pres_R)/pressure_itf_i[:,elem_L,1,:]
-      wflux_pres_x1_itf_i[:,elem_R,:,0] = 0.5*(wflux_pres_L + wflux_pres_R)/pressure_itf_i[:,elem_R,0,:]
-
-      # Direction x2
-
-      u2_L = u2_itf_j[:, elem_L, 1, :] # v at the north interface of the south element
-      u2_R = u2_itf_j[:, elem_R, 0, :] # v at the south interface of the north element
-
-      if advection_only:
-         eig_L = numpy.abs( u2_L )
-         eig_R = numpy.abs( u2_R )
-      else:
-         eig_L = numpy.abs( u2_L ) + numpy.sqrt(metric.H_contra_22_itf_j[:, itf, :] * heat_capacity_ratio * pressure_itf_j[:, elem_L, 1, :] / variables_itf_j[idx_rho, :, elem_L, 1, :])
-         eig_R = numpy.abs( u2_R ) + numpy.sqrt(metric.H_contra_22_itf_j[:, itf, :]  * heat_capacity_ratio * pressure_itf_j[:, elem_R, 0, :] / variables_itf_j[idx_rho, :, elem_R, 0, :])
-
-      eig = numpy.maximum(eig_L, eig_R)
-
-      # Advective part of the flux
-      flux_L = metric.sqrtG_itf_j[:, itf, :] * u2_L * variables_itf_j[:, :, elem_L, 1, :]
-      flux_R = metric.sqrtG_itf_j[:, itf, :] * u2_R * variables_itf_j[:, :, elem_R, 0, :]
-
-      # rho-w specific advective flux
-      wflux_adv_L = flux_L[idx_rho_w,:].copy()
-      wflux_adv_R = flux_R[idx_rho_w,:].copy()
-
-      # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-
-      wflux_pres_L = metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      wflux_pres_R = metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-
-      # --- Common Rusanov fluxes
-
-      flux_x2_itf_j[:, :, elem_L, 1, :] = 0.5 * ( flux_L + flux_R - eig * metric.sqrtG_itf_j[:, itf, :]  * ( variables_itf_j[:, :, elem_R, 0, :] - variables_itf_j[:, :, elem_L, 1, :] ) )
-      flux_x2_itf_j[:, :, elem_R, 0, :] = flux_x2_itf_j[:, :, elem_L, 1, :]
-
-      # Separation of advective and pressure flux for rho-w
-      wflux_adv_x2_itf_j[:,elem_L,1,:] =  0.5 * ( wflux_adv_L + wflux_adv_R - eig * metric.sqrtG_itf_j[:, itf, :]  *\
-                                          ( variables_itf_j[idx_rho_w, :, elem_R, 0, :] - variables_itf_j[idx_rho_w, :, elem_L, 1, :] ) )
-      wflux_adv_x2_itf_j[:,elem_R,0,:] = wflux_adv_x2_itf_j[:,elem_L,1,:]
-      
-      wflux_pres_x2_itf_j[:,elem_L,1,:] = 0.5 * (wflux_pres_L + wflux_pres_R)/pressure_itf_j[:,elem_L,1,:]
-      wflux_pres_x2_itf_j[:,elem_R,0,:] = 0.5 * (wflux_pres_L + wflux_pres_R)/pressure_itf_j[:,elem_R,0,:]
+   # Common Rusanov fluxes, for all interfaces at once. Interface [itf] is between element [itf] (left) and
+   # element [itf + 1] (right) of the interface arrays
+
+   # Direction x1
+   rusanov_3d(variables_itf_i[..., :-1, 1, :], variables_itf_i[..., 1:, 0, :],
+              u1_itf_i[..., :-1, 1, :], u1_itf_i[..., 1:, 0, :], pressure_itf_i[..., :-1, 1, :], pressure_itf_i[..., 1:, 0, :],
+              metric.riemann_metric_itf_i, advection_only,
+              flux_x1_itf_i[..., :-1, :, 1],
+              (wflux_adv_x1_itf_i[..., :-1, :, 1], wflux_pres_x1_itf_i[..., :-1, :, 1], wflux_pres_x1_itf_i[..., 1:, :, 0]))
+   flux_x1_itf_i[..., 1:, :, 0] = flux_x1_itf_i[..., :-1, :, 1]
+   wflux_adv_x1_itf_i[..., 1:, :, 0] = wflux_adv_x1_itf_i[..., :-1, :, 1]
+
+   # Direction x2
+   rusanov_3d(variables_itf_j[..., :-1, 1, :], variables_itf_j[..., 1:, 0, :],
+              u2_itf_j[..., :-1, 1, :], u2_itf_j[..., 1:, 0, :], pressure_itf_j[..., :-1, 1, :], pressure_itf_j[..., 1:, 0, :],
+              metric.riemann_metric_itf_j, advection_only,
+              flux_x2_itf_j[..., :-1, 1, :],
+              (wflux_adv_x2_itf_j[..., :-1, 1, :], wflux_pres_x2_itf_j[..., :-1, 1, :], wflux_pres_x2_itf_j[..., 1:, 0, :]))
+   flux_x2_itf_j[..., 1:, 0, :] = flux_x2_itf_j[..., :-1, 1, :]
+   wflux_adv_x2_itf_j[..., 1:, 0, :] = wflux_adv_x2_itf_j[..., :-1, 1, :]
 
    # # Add corrections to the derivatives
    # for elem in range(nb_elements_hori):
@@ -433,56 +325,62 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
 
    #    df2_dx2[:, :, epais, :] += mtrx.correction @ flux_x2_itf_j[:, :, elem+offset, :, :]
 
-   # Perform flux derivatives
-
-   flux_x1_bdy = flux_x1_itf_i.transpose((0,1,3,2,4))[:,:,:,1:-1,:].copy()
-   df1_dx1 = mtrx.comma_i(flux_x1,flux_x1_bdy,geom)
-   flux_x2_bdy = flux_x2_itf_j[:,:,1:-1,:,:].copy()
-   df2_dx2 = mtrx.comma_j(flux_x2,flux_x2_bdy,geom)
-   flux_x3_bdy = flux_x3_itf_k[:,:,1:-1,:,:].transpose(0,2,3,1,4).copy()
-   df3_dx3[:,:,:,:] = mtrx.comma_k(flux_x3,flux_x3_bdy,geom)
+   # Perform flux derivatives. The boundary values of all differentiated quantities are gathered in the same order
+   # as the interior values (see all_flux_x*), in the layout expected by comma_i/j/k.
 
    logp_int = numpy.log(pressure)
-
-   pressure_bdy_i = pressure_itf_i[:,1:-1,:,:].transpose((0,3,1,2)).copy()
-   pressure_bdy_j = pressure_itf_j[:,1:-1,:,:].copy()
-   pressure_bdy_k = pressure_itf_k[:,1:-1,:,:].transpose(1,2,0,3).copy()
-
-   logp_bdy_i = numpy.log(pressure_bdy_i)
-   logp_bdy_j = numpy.log(pressure_bdy_j)
-   logp_bdy_k = numpy.log(pressure_bdy_k)
-
-   wflux_adv_x1_bdy_i = wflux_adv_x1_itf_i.transpose((0,2,1,3))[:,:,1:-1,:].copy()
-   wflux_pres_x1_bdy_i = wflux_pres_x1_itf_i.transpose((0,2,1,3))[:,:,1:-1,:].copy()
-
-   wflux_adv_x2_bdy_j = wflux_adv_x2_itf_j[:,1:-1,:,:].copy()
-   wflux_pres_x2_bdy_j = wflux_pres_x2_itf_j[:,1:-1,:,:].copy()
-
-   wflux_adv_x3_bdy_k = wflux_adv_x3_itf_k[:,1:-1,:,:].transpose(1,2,0,3).copy()
-   wflux_pres_x3_bdy_k = wflux_pres_x3_itf_k[:,1:-1,:,:].transpose(1,2,0,3).copy()
+   all_flux_x1[idx_logp] = logp_int
+   all_flux_x2[idx_logp] = logp_int
+   all_flux_x3[idx_logp] = logp_int
+
+   all_flux_x1_bdy = numpy.empty((nb_derivatives,) + batch_shape + (nb_vertical_levels, nb_pts_hori, nb_elements_hori, 2), dtype=type_vec)
+   all_flux_x1_bdy[:nb_equations]   = flux_x1_itf_i.swapaxes(-3,-2)[...,1:-1,:]
+   all_flux_x1_bdy[idx_wflux_adv]   = wflux_adv_x1_itf_i.swapaxes(-3,-2)[...,1:-1,:]
+   all_flux_x1_bdy[idx_wflux_pres]  = wflux_pres_x1_itf_i.swapaxes(-3,-2)[...,1:-1,:]
+   all_flux_x1_bdy[idx_logp]        = numpy.log(numpy.moveaxis(pressure_itf_i[...,1:-1,:,:], -1, -3))
+
+   all_flux_x2_bdy = numpy.empty((nb_derivatives,) + batch_shape + (nb_vertical_levels, nb_elements_hori, 2, nb_pts_hori), dtype=type_vec)
+   all_flux_x2_bdy[:nb_equations]   = flux_x2_itf_j[...,1:-1,:,:]
+   all_flux_x2_bdy[idx_wflux_adv]   = wflux_adv_x2_itf_j[...,1:-1,:,:]
+   all_flux_x2_bdy[idx_wflux_pres]  = wflux_pres_x2_itf_j[...,1:-1,:,:]
+   all_flux_x2_bdy[idx_logp]        = numpy.log(pressure_itf_j[...,1:-1,:,:])
+
+   all_flux_x3_bdy = numpy.empty((nb_derivatives,) + batch_shape + (nb_elements_vert, 2, nb_pts_hori, nb_pts_hori), dtype=type_vec)
+   all_flux_x3_bdy[:nb_equations]   = numpy.moveaxis(flux_x3_itf_k[...,1:-1,:,:], -4, -2)
+   all_flux_x3_bdy[idx_wflux_adv]   = numpy.moveaxis(wflux_adv_x3_itf_k[...,1:-1,:,:], -4, -2)
+   all_flux_x3_bdy[idx_wflux_pres]  = numpy.moveaxis(wflux_pres_x3_itf_k[...,1:-1,:,:], -4, -2)
+   all_flux_x3_bdy[idx_logp]        = numpy.log(numpy.moveaxis(pressure_itf_k[...,1:-1,:,:], -4, -2))
+
+   all_df1_dx1 = mtrx.comma_i(all_flux_x1, all_flux_x1_bdy, geom)
+   all_df2_dx2 = mtrx.comma_j(all_flux_x2, all_flux_x2_bdy, geom)
+   all_df3_dx3 = mtrx.comma_k(all_flux_x3, all_flux_x3_bdy, geom)
+
+   df1_dx1 = all_df1_dx1[:nb_equations]
+   df2_dx2 = all_df2_dx2[:nb_equations]
+   df3_dx3 = all_df3_dx3[:nb_equations]
 
    # dFw/dx = d(adv)/dx + d(pres*metric)/dx = d(adv)/dx + pres*(d(metric)/dx + metric*d(logp)/dx)
-   w_df1_dx1_adv = mtrx.comma_i(wflux_adv_x1,wflux_adv_x1_bdy_i,geom)
-   w_df1_dx1_presa = pressure*mtrx.comma_i(wflux_pres_x1,wflux_pres_x1_bdy_i,geom)
-   w_df1_dx1_presb = pressure*wflux_pres_x1*mtrx.comma_i(logp_int,logp_bdy_i,geom)
+   w_df1_dx1_adv = all_df1_dx1[idx_wflux_adv]
+   w_df1_dx1_presa = pressure*all_df1_dx1[idx_wflux_pres]
+   w_df1_dx1_presb = pressure*wflux_pres_x1*all_df1_dx1[idx_logp]
    w_df1_dx1 = w_df1_dx1_adv + w_df1_dx1_presa + w_df1_dx1_presb
 
    # dFw/dy = d(adv)/dy + d(pres*metric)/dy = d(adv)/dy + pres*(d(metric)/dy + metric*d(logp)/dy)
-   w_df2_dx2_adv = mtrx.comma_j(wflux_adv_x2,wflux_adv_x2_bdy_j,geom)
-   w_df2_dx2_presa = pressure*mtrx.comma_j(wflux_pres_x2,wflux_pres_x2_bdy_j,geom)
-   w_df2_dx2_presb = pressure*wflux_pres_x2*mtrx.comma_j(logp_int,logp_bdy_j,geom)
+   w_df2_dx2_adv = all_df2_dx2[idx_wflux_adv]
+   w_df2_dx2_presa = pressure*all_df2_dx2[idx_wflux_pres]
+   w_df2_dx2_presb = pressure*wflux_pres_x2*all_df2_dx2[idx_logp]
    w_df2_dx2 = w_df2_dx2_adv + w_df2_dx2_presa + w_df2_dx2_presb
 
 
    # dFw/dz = d(adv)/dz + d(pres*metric)/dz = d(adv)/dz + pres*(d(metric)/dz + metric*d(logp)/dz)
-   w_df3_dx3c = mtrx.comma_k(wflux_adv_x3,wflux_adv_x3_bdy_k,geom) 
-   w_df3_dx3a = pressure*mtrx.comma_k(wflux_pres_x3,wflux_pres_x3_bdy_k,geom) 
-   w_df3_dx3b = pressure*wflux_pres_x3*mtrx.comma_k(logp_int,logp_bdy_k,geom)
+   w_df3_dx3c = all_df3_dx3[idx_wflux_adv]
+   w_df3_dx3a = pressure*all_df3_dx3[idx_wflux_pres]
+   w_df3_dx3b = pressure*wflux_pres_x3*all_df3_dx3[idx_logp]
    w_df3_dx3 = w_df3_dx3a + w_df3_dx3b + w_df3_dx3c
 
 
    # Add coriolis, metric terms and other forcings
-   forcing[idx_rho,:,:,:] = 0.0
+   forcing[idx_rho] = 0.0
 
    # TODO: could be simplified
    #pressure[:] = 0
@@ -538,4 +436,8 @@ def rhs_euler (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metric:
       rhs[idx_rho_u2]    = 0.0
       rhs[idx_rho_w]     = 0.0
       rhs[idx_rho_theta] = 0.0
+
+   if batched:
+      rhs = numpy.ascontiguousarray(numpy.moveaxis(rhs, 1, 0))
+
    return rhs
@@ -131,17 +131,9 @@ def rhs_euler_convective (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperator
    # Performance note: exp(log) is measuably faster than ** (pow)
    pressure = p0 * numpy.exp((cpd/cvd) * numpy.log((Rd/p0)*Q[idx_rho_theta]))
 
-   flux_x1[idx_rho_u1] += metric.sqrtG * metric.H_contra_11 * pressure
-   flux_x1[idx_rho_u2] += metric.sqrtG * metric.H_contra_12 * pressure
-   flux_x1[idx_rho_w]  += metric.sqrtG * metric.H_contra_13 * pressure
-
-   flux_x2[idx_rho_u1] += metric.sqrtG * metric.H_contra_21 * pressure
-   flux_x2[idx_rho_u2] += metric.sqrtG * metric.H_contra_22 * pressure
-   flux_x2[idx_rho_w]  += metric.sqrtG * metric.H_contra_23 * pressure
-
-   flux_x3[idx_rho_u1] += metric.sqrtG * metric.H_contra_31 * pressure
-   flux_x3[idx_rho_u2] += metric.sqrtG * metric.H_contra_32 * pressure
-   flux_x3[idx_rho_w]  += metric.sqrtG * metric.H_contra_33 * pressure
+   flux_x1[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[0] * pressure
+   flux_x2[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[1] * pressure
+   flux_x3[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[2] * pressure
 
    # if (ptopo.rank == 0): print('√g: %e, H^33: %e' % (metric.sqrtG[0,0],metric.H_contra_33[0,0]))
 
@@ -218,13 +210,9 @@ def rhs_euler_convective (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperator
       # flux_U_itf_k[:,itf,:,:] = flux_U
 
       # ... and add the pressure part
-      flux_D[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
+      flux_D[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_k[2:, :, itf, :] * pressure_itf_k[:, elem_D, 1, :]
 
-      flux_U[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
+      flux_U[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_k[2:, :, itf, :] * pressure_itf_k[:, elem_U, 0, :]
 
       # Riemann solver
       flux_x3_itf_k[:, :, elem_D, 1, :] = 0.5 * ( flux_D + flux_U )
@@ -264,13 +252,9 @@ def rhs_euler_convective (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperator
       flux_R = metric.sqrtG_itf_i[:, :, itf] * u1_R * variables_itf_i[:, :, elem_R, 0, :]
 
       # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
+      flux_L[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_i[2:, :, itf, :] * pressure_itf_i[:, elem_L, 1, :]
                                                                                         
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
+      flux_R[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_i[2:, :, itf, :] * pressure_itf_i[:, elem_R, 0, :]
 
       # --- Common Rusanov fluxes
 
@@ -287,13 +271,9 @@ def rhs_euler_convective (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperator
       flux_R = metric.sqrtG_itf_j[:, itf, :] * u2_R * variables_itf_j[:, :, elem_R, 0, :]
 
       # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
+      flux_L[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_j[2:, :, itf, :] * pressure_itf_j[:, elem_L, 1, :]
 
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
+      flux_R[idx_rho_u1:idx_rho_w+1] += metric.riemann_metric_itf_j[2:, :, itf, :] * pressure_itf_j[:, elem_R, 0, :]
 
       # --- Common Rusanov fluxes
 
@@ -1,7 +1,8 @@
 import numpy
 import sys
 
-from common.definitions import idx_rho_u1, idx_rho_u2, idx_rho_w, idx_rho, idx_rho_theta, gravity, p0, Rd, cpd, cvd, heat_capacity_ratio
+from common.definitions import idx_rho_u1, idx_rho_u2, idx_rho_w, idx_rho, idx_rho_theta, gravity, p0, Rd, cpd, cvd
+from rhs.flux_kernels   import rusanov_3d
 
 # For type hints
 from common.parallel import DistributedWorld
@@ -132,17 +133,9 @@ def rhs_euler_fv (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metri
    # Performance note: exp(log) is measuably faster than ** (pow)
    pressure = p0 * numpy.exp((cpd/cvd) * numpy.log((Rd/p0)*Q[idx_rho_theta]))
 
-   flux_x1[idx_rho_u1] += metric.sqrtG * metric.H_contra_11 * pressure
-   flux_x1[idx_rho_u2] += metric.sqrtG * metric.H_contra_12 * pressure
-   flux_x1[idx_rho_w]  += metric.sqrtG * metric.H_contra_13 * pressure
-
-   flux_x2[idx_rho_u1] += metric.sqrtG * metric.H_contra_21 * pressure
-   flux_x2[idx_rho_u2] += metric.sqrtG * metric.H_contra_22 * pressure
-   flux_x2[idx_rho_w]  += metric.sqrtG * metric.H_contra_23 * pressure
-
-   flux_x3[idx_rho_u1] += metric.sqrtG * metric.H_contra_31 * pressure
-   flux_x3[idx_rho_u2] += metric.sqrtG * metric.H_contra_32 * pressure
-   flux_x3[idx_rho_w]  += metric.sqrtG * metric.H_contra_33 * pressure
+   flux_x1[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[0] * pressure
+   flux_x2[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[1] * pressure
+   flux_x3[idx_rho_u1:idx_rho_w+1] += metric.sqrtG_H_contra[2] * pressure
 
    # if (ptopo.rank == 0): print('√g: %e, H^33: %e' % (metric.sqrtG[0,0],metric.H_contra_33[0,0]))
 
@@ -196,53 +189,13 @@ def rhs_euler_fv (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metri
    w_itf_k[:, -1, :, :] = 0.
    w_itf_k[:, -2, 1, :] = 0.
 
-   # Common Rusanov vertical fluxes
-   # flux_D_itf_k = numpy.empty((nb_equations, nb_interfaces_vert, geom.nj, geom.ni))
-   # flux_U_itf_k = numpy.empty((nb_equations, nb_interfaces_vert, geom.nj, geom.ni))
-   # eig_D_itf_k = numpy.empty((nb_interfaces_vert, geom.nj, geom.ni))
-   # eig_U_itf_k = numpy.empty((nb_interfaces_vert, geom.nj, geom.ni))
-   for itf in range(nb_interfaces_vert):
-
-      elem_D = itf
-      elem_U = itf + 1
-
-      # Direction x3
-
-      w_D = w_itf_k[:, elem_D, 1, :] # w at the top of the lower element
-      w_U = w_itf_k[:, elem_U, 0, :] # w at the bottom of the upper element
-
-      if advection_only: # Eigenvalues are simply the advection speeds
-         eig_D = numpy.abs(w_D)
-         eig_U = numpy.abs(w_U)
-      else: # Maximum eigenvalue is w + (c_sound)
-         eig_D = numpy.abs(w_D) + numpy.sqrt(metric.H_contra_33_itf_k[itf,:,:] * heat_capacity_ratio * \
-                                                pressure_itf_k[:, elem_D, 1, :] / variables_itf_k[idx_rho, :, elem_D, 1, :])
-         eig_U = numpy.abs(w_U) + numpy.sqrt(metric.H_contra_33_itf_k[itf,:,:] * heat_capacity_ratio * \
-                                                pressure_itf_k[:, elem_U, 0, :] / variables_itf_k[idx_rho, :, elem_U, 0, :])
-
-      eig = numpy.maximum(eig_D, eig_U)
-
-      # Advective part of the flux ...
-      flux_D = metric.sqrtG_itf_k[itf,:,:] * w_D * variables_itf_k[:, :, elem_D, 1, :]
-      flux_U = metric.sqrtG_itf_k[itf,:,:] * w_U * variables_itf_k[:, :, elem_U, 0, :]
-
-      # eig_D_itf_k[itf,:,:] = eig_D
-      # eig_U_itf_k[itf,:,:] = eig_U
-      # flux_D_itf_k[:,itf,:,:] = flux_D
-      # flux_U_itf_k[:,itf,:,:] = flux_U
-
-      # ... and add the pressure part
-      flux_D[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-      flux_D[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_D, 1, :]
-
-      flux_U[idx_rho_u1] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_31_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_u2] += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_32_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-      flux_U[idx_rho_w]  += metric.sqrtG_itf_k[itf,:,:] * metric.H_contra_33_itf_k[itf,:,:] * pressure_itf_k[:, elem_U, 0, :]
-
-      # Riemann solver
-      flux_x3_itf_k[:, :, elem_D, 1, :] = 0.5 * ( flux_D + flux_U - eig * metric.sqrtG_itf_k[itf,:,:] * ( variables_itf_k[:, :, elem_U, 0, :] - variables_itf_k[:, :, elem_D, 1, :] ) )
-      flux_x3_itf_k[:, :, elem_U, 0, :] = flux_x3_itf_k[:, :, elem_D, 1, :]
+   # Common Rusanov vertical fluxes, for all interfaces at once. Interface [itf] is between element [itf] (down) and
+   # element [itf + 1] (up) of the interface arrays
+   rusanov_3d(variables_itf_k[:, :, :-1, 1, :], variables_itf_k[:, :, 1:, 0, :],
+              w_itf_k[:, :-1, 1, :], w_itf_k[:, 1:, 0, :], pressure_itf_k[:, :-1, 1, :], pressure_itf_k[:, 1:, 0, :],
+              metric.riemann_metric_itf_k, advection_only,
+              flux_x3_itf_k[:, :, :-1, 1, :])
+   flux_x3_itf_k[:, :, 1:, 0, :] = flux_x3_itf_k[:, :, :-1, 1, :]
 
    for slab in range(nb_pts_hori):
       for elem in range(nb_elements_vert):
@@ -268,74 +221,22 @@ def rhs_euler_fv (Q: numpy.ndarray, geom: CubedSphere, mtrx: DFROperators, metri
    pressure_itf_i = p0 * numpy.exp((cpd/cvd) * numpy.log(variables_itf_i[idx_rho_theta] * (Rd / p0)))
    pressure_itf_j = p0 * numpy.exp((cpd/cvd) * numpy.log(variables_itf_j[idx_rho_theta] * (Rd / p0)))
 
-   # Riemann solver
-   for itf in range(nb_interfaces_hori):
-
-      elem_L = itf
-      elem_R = itf + 1
-
-      # Direction x1
-      u1_L = u1_itf_i[:, elem_L, 1, :] # u at the right interface of the left element
-      u1_R = u1_itf_i[:, elem_R, 0, :] # u at the left interface of the right element
-
-      if advection_only: # Advection only, eigenvalues are the velocities alone
-         eig_L = numpy.abs( u1_L )
-         eig_R = numpy.abs( u1_R )
-      else: # Otherwise, maximum eigenvalue is |u| + c_sound
-         eig_L = numpy.abs( u1_L ) + numpy.sqrt(metric.H_contra_11_itf_i[:,:,itf] * heat_capacity_ratio * pressure_itf_i[:, elem_L, 1, :] / variables_itf_i[idx_rho, :, elem_L, 1, :])
-         eig_R = numpy.abs( u1_R ) + numpy.sqrt(metric.H_contra_11_itf_i[:,:,itf] * heat_capacity_ratio * pressure_itf_i[:, elem_R, 0, :] / variables_itf_i[idx_rho, :, elem_R, 0, :])
-
-      eig = numpy.maximum(eig_L, eig_R)
-
-      # Advective part of the flux ...
-      flux_L = metric.sqrtG_itf_i[:, :, itf] * u1_L * variables_itf_i[:, :, elem_L, 1, :]
-      flux_R = metric.sqrtG_itf_i[:, :, itf] * u1_R * variables_itf_i[:, :, elem_R, 0, :]
-
-      # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-      flux_L[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_L, 1, :]
-                                                                                        
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_11_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_12_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-      flux_R[idx_rho_w]  += metric.sqrtG_itf_i[:, :, itf] * metric.H_contra_13_itf_i[:, :, itf] * pressure_itf_i[:, elem_R, 0, :]
-
-      # --- Common Rusanov fluxes
-
-      flux_x1_itf_i[:, :, elem_L, :, 1] = 0.5 * ( flux_L  + flux_R - eig * metric.sqrtG_itf_i[:, :, itf] * ( variables_itf_i[:, :, elem_R, 0, :] - variables_itf_i[:, :, elem_L, 1, :] ) )
-      flux_x1_itf_i[:, :, elem_R, :, 0] = flux_x1_itf_i[:, :, elem_L, :, 1]
-
-      # Direction x2
-
-      u2_L = u2_itf_j[:, elem_L, 1, :] # v at the north interface of the south element
-      u2_R = u2_itf_j[:, elem_R, 0, :] # v at the south interface of the north element
-
-      if advection_only:
-         eig_L = numpy.abs( u2_L )
-         eig_R = numpy.abs( u2_R )
-      else:
-         eig_L = numpy.abs( u2_L ) + numpy.sqrt(metric.H_contra_22_itf_j[:, itf, :] * heat_capacity_ratio * pressure_itf_j[:, elem_L, 1, :] / variables_itf_j[idx_rho, :, elem_L, 1, :])
-         eig_R = numpy.abs( u2_R ) + numpy.sqrt(metric.H_contra_22_itf_j[:, itf, :]  * heat_capacity_ratio * pressure_itf_j[:, elem_R, 0, :] / variables_itf_j[idx_rho, :, elem_R, 0, :])
-
-      eig = numpy.maximum(eig_L, eig_R)
-
-      # Advective part of the flux
-      flux_L = metric.sqrtG_itf_j[:, itf, :] * u2_L * variables_itf_j[:, :, elem_L, 1, :]
-      flux_R = metric.sqrtG_itf_j[:, itf, :] * u2_R * variables_itf_j[:, :, elem_R, 0, :]
-
-      # ... and now add the pressure contribution
-      flux_L[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-      flux_L[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_L, 1, :]
-
-      flux_R[idx_rho_u1] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_21_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_u2] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_22_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-      flux_R[idx_rho_w] += metric.sqrtG_itf_j[:, itf, :]  * metric.H_contra_23_itf_j[:, itf, :]  * pressure_itf_j[:, elem_R, 0, :]
-
-      # --- Common Rusanov fluxes
-
-      flux_x2_itf_j[:, :, elem_L, 1, :] = 0.5 * ( flux_L + flux_R - eig * metric.sqrtG_itf_j[:, itf, :]  * ( variables_itf_j[:, :, elem_R, 0, :] - variables_itf_j[:, :, elem_L, 1, :] ) )
-      flux_x2_itf_j[:, :, elem_R, 0, :] = flux_x2_itf_j[:, :, elem_L, 1, :]
+   # Common Rusanov fluxes, for all interfaces at once. Interface [itf] is between element [itf] (left) and
+   # element [itf + 1] (right) of the interface arrays
+
+   # Direction x1
+   rusanov_3d(variables_itf_i[:, :, :-1, 1, :], variables_itf_i[:, :, 1:, 0, :],
+              u1_itf_i[:, :-1, 1, :], u1_itf_i[:, 1:, 0, :], pressure_itf_i[:, :-1, 1, :], pressure_itf_i[:, 1:, 0, :],
+              metric.riemann_metric_itf_i, advection_only,
+              flux_x1_itf_i[:, :, :-1, :, 1])
+   flux_x1_itf_i[:, :, 1:, :, 0] = flux_x1_itf_i[:, :, :-1, :, 1]
+
+   # Direction x2
+   rusanov_3d(variables_itf_j[:, :, :-1, 1, :], variables_itf_j[:, :, 1:, 0, :],
+              u2_itf_j[:, :-1, 1, :], u2_itf_j[:, 1:, 0, :], pressure_itf_j[:, :-1, 1, :], pressure_itf_j[:, 1:, 0, :],
+              metric.riemann_metric_itf_j, advection_only,
+              flux_x2_itf_j[:, :, :-1, 1, :])
+   flux_x2_itf_j[:, :, 1:, 0, :] = flux_x2_itf_j[:, :, :-1, 1, :]
 
    # Add corrections to the derivatives
    for elem in range(nb_elements_hori):
@@ -7,6 +7,7 @@ from gef_cuda                  import rhs_bubble_cuda
 from gef_cuda                  import rhs_euler_cuda
 from geometry                  import Cartesian2D, CubedSphere
 from init.initialize           import Topo
+from rhs.flux_kernels          import set_flux_kernels
 from rhs.fluxes                import ausm_2d_fv, upwind_2d_fv, rusanov_2d_fv
 from rhs.rhs_bubble            import rhs_bubble
 from rhs.rhs_bubble_convective import rhs_bubble as rhs_bubble_convective
@@ -20,10 +21,13 @@ from rhs.rhs_sw_stiff          import rhs_sw_stiff
 from rhs.rhs_sw_nonstiff       import rhs_sw_nonstiff
 from rhs.rhs_advection2d       import rhs_advection2d
 
+# RHS functions that can evaluate a batch of states (with a leading member axis) in a single call
+batched_rhs_functions = {rhs_euler, rhs_sw}
+
 # For type hints
 from common.parallel        import DistributedWorld
 from common.program_options import Configuration
-from geometry               import DFROperators, Geometry, Metric
+from geometry               import DFROperators, Geometry, Metric, StateLayout
 
 class RhsBundle:
    '''Set of RHS functions that are associated with a certain geometry and equations
@@ -35,19 +39,32 @@ class RhsBundle:
                 topo: Topo,
                 ptopo: Optional[DistributedWorld],
                 param: Configuration,
-                fields_shape: Tuple[int, ...]) -> None:
-      '''Determine handles to appropriate RHS functions.'''
+                fields_shape: Tuple[int, ...],
+                layout: Optional[StateLayout] = None) -> None:
+      '''Determine handles to appropriate RHS functions. When a layout is given, the generated functions take (and
+      return) vectors in its internal layout, rather than in the natural one.'''
 
-      self.shape = fields_shape
+      self.shape  = fields_shape
+      self.layout = layout if layout is not None else StateLayout('natural', fields_shape, 1)
+      set_flux_kernels(param.flux_kernels)
 
       def generate_rhs(rhs_func: Callable, *args, **kwargs) -> Callable[[numpy.ndarray], numpy.ndarray]:
          '''Generate a function that calls the given (RHS) function on a vector. The generated function will
-         first reshape the vector, then return a result with the original input vector shape.'''
+         first convert the vector to the natural layout, then return a result with the original input vector layout
+         and shape.
+
+         The vector may also be a batch of states (ensemble members, block of Krylov vectors), with a leading member
+         axis. RHS functions that accept a batch (batched_rhs_functions) evaluate all members at once, the others are
+         called on one member at a time.'''
          # if MPI.COMM_WORLD.rank == 0: print(f'Generating {rhs_func} with shape {self.shape}')
          def actual_rhs(vec: numpy.ndarray):
             old_shape = vec.shape
-            result = rhs_func(vec.reshape(self.shape), *args, **kwargs)
-            return result.reshape(old_shape)
+            Q = self.layout.to_natural(vec)
+            if Q.ndim == len(self.shape) or rhs_func in batched_rhs_functions:
+               result = rhs_func(Q, *args, **kwargs)
+            else:
+               result = numpy.stack([rhs_func(Q_member, *args, **kwargs) for Q_member in Q])
+            return self.layout.to_internal(result).reshape(old_shape)
 
          return actual_rhs
 
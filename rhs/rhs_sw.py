@@ -1,52 +1,54 @@
 import numpy
 
 from common.definitions import idx_h, idx_hu1, idx_hu2, gravity
+from common.profiler    import profiler
+from .flux_kernels      import ausm_sw
 
+@profiler.profile()
 def rhs_sw (Q: numpy.ndarray, geom, mtrx, metric, topo, ptopo, nbsolpts: int, nb_elements_hori: int):
+   '''Shallow water RHS of a state (nb_equations, nj, ni), or of a batch of states (nb_members, nb_equations, nj, ni).
+
+   A batch is processed as a single state whose variables have an additional (member) dimension, placed just after
+   the variable index: the metric terms are then read once for all members (they broadcast along that dimension),
+   and the interfaces of all members are exchanged with the neighbours in a single message.'''
+
+   batched = Q.ndim == 4
+   if batched:
+      Q = numpy.ascontiguousarray(numpy.moveaxis(Q, 0, 1))
 
    type_vec = Q.dtype
    nb_equations = Q.shape[0]
-   nb_interfaces_hori = nb_elements_hori + 1
-
-   df1_dx1, df2_dx2, flux_x1, flux_x2 = [numpy.empty_like(Q, dtype=type_vec) for _ in range(4)]
+   batch_shape = Q.shape[1:-2]
 
-   flux_x1_itf_i = numpy.empty((nb_equations, nb_elements_hori+2, nbsolpts*nb_elements_hori, 2), dtype=type_vec)
-   flux_x2_itf_j, var_itf_i, var_itf_j= [numpy.empty((nb_equations, nb_elements_hori+2, 2, nbsolpts*nb_elements_hori), dtype=type_vec) for _ in range(3)]
+   flux_x1_itf_i = numpy.empty((nb_equations,) + batch_shape + (nb_elements_hori+2, nbsolpts*nb_elements_hori, 2), dtype=type_vec)
+   flux_x2_itf_j, var_itf_i, var_itf_j= [numpy.empty((nb_equations,) + batch_shape + (nb_elements_hori+2, 2, nbsolpts*nb_elements_hori), dtype=type_vec) for _ in range(3)]
 
    forcing = numpy.zeros_like(Q, dtype=type_vec)
 
-   # Offset due to the halo
-   offset = 1
-
    # Unpack dynamical variables
    HH = Q[idx_h] if topo is None else Q[idx_h] + topo.hsurf
    u1 = Q[idx_hu1] / Q[idx_h]
    u2 = Q[idx_hu2] / Q[idx_h]
 
-   # Interpolate to the element interface
-   for elem in range(nb_elements_hori):
-      epais = elem * nbsolpts + numpy.arange(nbsolpts)
-      pos   = elem + offset
-
-      # --- Direction x1
-
-      var_itf_i[idx_h, pos, 0, :] = HH[:, epais] @ mtrx.extrap_west
-      var_itf_i[idx_h, pos, 1, :] = HH[:, epais] @ mtrx.extrap_east
-
-      var_itf_i[1:, pos, 0, :] = Q[1:, :, epais] @ mtrx.extrap_west
-      var_itf_i[1:, pos, 1, :] = Q[1:, :, epais] @ mtrx.extrap_east
-
-      # --- Direction x2
-      var_itf_j[idx_h, pos, 0, :] = mtrx.extrap_south @ HH[epais, :]
-      var_itf_j[idx_h, pos, 1, :] = mtrx.extrap_north @ HH[epais, :]
+   # Variables to extrapolate: the height is extrapolated with the topography
+   if topo is None:
+      var = Q
+   else:
+      var = Q.copy()
+      var[idx_h] = HH
 
-      var_itf_j[1:, pos, 0, :] = mtrx.extrap_south @ Q[1:, epais, :]
-      var_itf_j[1:, pos, 1, :] = mtrx.extrap_north @ Q[1:, epais, :]
+   # Interpolate to the element interface, for all elements at once. Position 0 (and nb_elements_hori+1) in the
+   # interface arrays is reserved for exchanges with neighbouring PEs
+   var_itf_i[:, ..., 1:-1, :, :] = numpy.moveaxis(mtrx.extrapolate_i(var, geom), -3, -1)
+   var_itf_j[:, ..., 1:-1, :, :] = mtrx.extrapolate_j(var, geom)
 
    # Initiate transfers
    all_request = ptopo.xchange_sw_interfaces(geom, var_itf_i[idx_h], var_itf_j[idx_h], var_itf_i[idx_hu1], var_itf_i[idx_hu2], var_itf_j[idx_hu1], var_itf_j[idx_hu2], blocking=False)
 
    # Compute the fluxes
+   flux_x1 = numpy.empty_like(Q, dtype=type_vec)
+   flux_x2 = numpy.empty_like(Q, dtype=type_vec)
+
    flux_x1[idx_h] = metric.sqrtG * Q[idx_hu1]
    flux_x2[idx_h] = metric.sqrtG * Q[idx_hu2]
 
@@ -57,15 +59,11 @@ def rhs_sw (Q: numpy.ndarray, geom, mtrx, metric, topo, ptopo, nbsolpts: int, nb
    flux_x1[idx_hu2] = metric.sqrtG * ( Q[idx_hu2] * u1 + 0.5 * gravity * metric.H_contra_21 * hsquared )
    flux_x2[idx_hu2] = metric.sqrtG * ( Q[idx_hu2] * u2 + 0.5 * gravity * metric.H_contra_22 * hsquared )
 
-   # Interior contribution to the derivatives, corrections for the boundaries will be added later
-   for elem in range(nb_elements_hori):
-      epais = elem * nbsolpts + numpy.arange(nbsolpts)
-
-      # --- Direction x1
-      df1_dx1[:,:,epais] = flux_x1[:,:,epais] @ mtrx.diff_solpt_tr
-
-      # --- Direction x2
-      df2_dx2[:,epais,:] = mtrx.diff_solpt @ flux_x2[:,epais,:]
+   # Interior contribution to the derivatives, corrections for the boundaries will be added later.
+   # Each derivative is a single matrix multiplication over a view of the fluxes where every element is a separate
+   # (batched) matrix
+   df1_dx1 = (flux_x1.reshape((-1, nbsolpts)) @ mtrx.diff_solpt_tr).reshape(Q.shape)
+   df2_dx2 = (mtrx.diff_solpt @ flux_x2.reshape((-1, nb_elements_hori, nbsolpts, nbsolpts*nb_elements_hori))).reshape(Q.shape)
 
    # Finish transfers
    all_request.wait()
@@ -75,81 +73,22 @@ def rhs_sw (Q: numpy.ndarray, geom, mtrx, metric, topo, ptopo, nbsolpts: int, nb
       var_itf_i[idx_h] -= topo.hsurf_itf_i
       var_itf_j[idx_h] -= topo.hsurf_itf_j
 
-   # Common AUSM fluxes
-   for itf in range(nb_interfaces_hori):
-
-      elem_L = itf
-      elem_R = itf + 1
-
-      ################
-      # Direction x1 #
-      ################
-
-      # Left state
-      p11_L = metric.sqrtG_itf_i[itf, :] * 0.5 * gravity * metric.H_contra_11_itf_i[itf, :] * var_itf_i[idx_h, elem_L, 1, :]**2
-      p21_L = metric.sqrtG_itf_i[itf, :] * 0.5 * gravity * metric.H_contra_21_itf_i[itf, :] * var_itf_i[idx_h, elem_L, 1, :]**2
-      aL = numpy.sqrt( gravity * var_itf_i[idx_h, elem_L, 1, :] * metric.H_contra_11_itf_i[itf, :] )
-      mL = var_itf_i[idx_hu1, elem_L, 1, :] / (var_itf_i[idx_h, elem_L, 1, :] * aL)
-
-      # Right state
-      p11_R = metric.sqrtG_itf_i[itf, :] * 0.5 * gravity * metric.H_contra_11_itf_i[itf, :] * var_itf_i[idx_h, elem_R, 0, :]**2
-      p21_R = metric.sqrtG_itf_i[itf, :] * 0.5 * gravity * metric.H_contra_21_itf_i[itf, :] * var_itf_i[idx_h, elem_R, 0, :]**2
-      aR = numpy.sqrt( gravity * var_itf_i[idx_h, elem_R, 0, :] * metric.H_contra_11_itf_i[itf, :] )
-      mR = var_itf_i[idx_hu1, elem_R, 0, :] / (var_itf_i[idx_h, elem_R, 0, :] * aR)
-
-      M = 0.25 * ( (mL + 1.)**2 - (mR - 1.)**2 )
+   # Common AUSM fluxes, for all interfaces at once. Interface [itf] is between element [itf] (left) and
+   # element [itf + 1] (right) of the interface arrays
 
-      # --- Advection part
+   # Direction x1
+   ausm_sw(var_itf_i[:, ..., :-1, 1, :], var_itf_i[:, ..., 1:, 0, :], metric.sqrtG_itf_i, metric.H_contra_11_itf_i,
+           metric.H_contra_11_itf_i, metric.H_contra_21_itf_i, idx_hu1, flux_x1_itf_i[:, ..., :-1, :, 1])
+   flux_x1_itf_i[:, ..., 1:, :, 0] = flux_x1_itf_i[:, ..., :-1, :, 1]
 
-      flux_x1_itf_i[:, elem_L, :, 1] = metric.sqrtG_itf_i[itf, :] * ( numpy.maximum(0., M) * aL * var_itf_i[:, elem_L, 1, :] +  numpy.minimum(0., M) * aR * var_itf_i[:, elem_R, 0, :] )
+   # Direction x2
+   ausm_sw(var_itf_j[:, ..., :-1, 1, :], var_itf_j[:, ..., 1:, 0, :], metric.sqrtG_itf_j, metric.H_contra_22_itf_j,
+           metric.H_contra_12_itf_j, metric.H_contra_22_itf_j, idx_hu2, flux_x2_itf_j[:, ..., :-1, 1, :])
+   flux_x2_itf_j[:, ..., 1:, 0, :] = flux_x2_itf_j[:, ..., :-1, 1, :]
 
-      # --- Pressure part
-
-      flux_x1_itf_i[idx_hu1, elem_L, :, 1] += 0.5 * ( (1. + mL) * p11_L + (1. - mR) * p11_R )
-      flux_x1_itf_i[idx_hu2, elem_L, :, 1] += 0.5 * ( (1. + mL) * p21_L + (1. - mR) * p21_R )
-
-      flux_x1_itf_i[:, elem_R, :, 0] = flux_x1_itf_i[:, elem_L, :, 1]
-
-      ################
-      # Direction x2 #
-      ################
-
-      # Left state
-      p12_L = metric.sqrtG_itf_j[itf, :] * 0.5 * gravity * metric.H_contra_12_itf_j[itf, :] * var_itf_j[idx_h, elem_L, 1, :]**2
-      p22_L = metric.sqrtG_itf_j[itf, :] * 0.5 * gravity * metric.H_contra_22_itf_j[itf, :] * var_itf_j[idx_h, elem_L, 1, :]**2
-      aL = numpy.sqrt( gravity * var_itf_j[idx_h, elem_L, 1, :] * metric.H_contra_22_itf_j[itf, :] )
-      mL = var_itf_j[idx_hu2, elem_L, 1, :] / (var_itf_j[idx_h, elem_L, 1, :] * aL)
-
-      # Right state
-      p12_R = metric.sqrtG_itf_j[itf, :] * 0.5 * gravity * metric.H_contra_12_itf_j[itf, :] * var_itf_j[idx_h, elem_R, 0, :]**2
-      p22_R = metric.sqrtG_itf_j[itf, :] * 0.5 * gravity * metric.H_contra_22_itf_j[itf, :] * var_itf_j[idx_h, elem_R, 0, :]**2
-      aR = numpy.sqrt( gravity * var_itf_j[idx_h, elem_R, 0, :] * metric.H_contra_22_itf_j[itf, :] )
-      mR = var_itf_j[idx_hu2, elem_R, 0, :] / (var_itf_j[idx_h, elem_R, 0, :] * aR)
-
-      M = 0.25 * ( (mL + 1.)**2 - (mR - 1.)**2 )
-
-      # --- Advection part
-
-      flux_x2_itf_j[:, elem_L, 1, :] = metric.sqrtG_itf_j[itf, :] * ( numpy.maximum(0., M) * aL * var_itf_j[:, elem_L, 1, :] + numpy.minimum(0., M) * aR * var_itf_j[:, elem_R, 0, :] )
-
-      # --- Pressure part
-
-      flux_x2_itf_j[idx_hu1, elem_L, 1, :] += 0.5 * ( (1. + mL) * p12_L + (1. - mR) * p12_R )
-      flux_x2_itf_j[idx_hu2, elem_L, 1, :] += 0.5 * ( (1. + mL) * p22_L + (1. - mR) * p22_R )
-
-      flux_x2_itf_j[:, elem_R, 0, :] = flux_x2_itf_j[:, elem_L, 1, :]
-
-   # Compute the derivatives
-   for elem in range(nb_elements_hori):
-      epais = elem * nbsolpts + numpy.arange(nbsolpts)
-
-      # --- Direction x1
-
-      df1_dx1[:,:,epais] += flux_x1_itf_i[:, elem+offset,:,:] @ mtrx.correction_tr
-
-      # --- Direction x2
-
-      df2_dx2[:,epais,:] += mtrx.correction @ flux_x2_itf_j[:, elem+offset,:,:]
+   # Add the boundary corrections to the derivatives, for all elements at once
+   df1_dx1 += (flux_x1_itf_i[:, ..., 1:-1, :, :] @ mtrx.correction_tr).swapaxes(-3, -2).reshape(Q.shape)
+   df2_dx2 += (mtrx.correction @ flux_x2_itf_j[:, ..., 1:-1, :, :]).reshape(Q.shape)
 
    if topo is None:
       topo_dzdx1 = numpy.zeros_like(metric.H_contra_11)
@@ -160,15 +99,18 @@ def rhs_sw (Q: numpy.ndarray, geom, mtrx, metric, topo, ptopo, nbsolpts: int, nb
 
    # Add coriolis, metric and terms due to varying bottom topography
    # Note: christoffel_1_22 and metric.christoffel_2_11 are zero
-   forcing[idx_hu1,:,:] = 2.0 * ( metric.christoffel_1_01 * Q[idx_hu1] + metric.christoffel_1_02 * Q[idx_hu2]) \
+   forcing[idx_hu1] = 2.0 * ( metric.christoffel_1_01 * Q[idx_hu1] + metric.christoffel_1_02 * Q[idx_hu2]) \
          + metric.christoffel_1_11 * Q[idx_hu1] * u1 + 2.0 * metric.christoffel_1_12 * Q[idx_hu1] * u2 \
          + gravity * Q[idx_h] * ( metric.H_contra_11 * topo_dzdx1 + metric.H_contra_12 * topo_dzdx2)
 
-   forcing[idx_hu2,:,:] = 2.0 * (metric.christoffel_2_01 * Q[idx_hu1] + metric.christoffel_2_02 * Q[idx_hu2]) \
+   forcing[idx_hu2] = 2.0 * (metric.christoffel_2_01 * Q[idx_hu1] + metric.christoffel_2_02 * Q[idx_hu2]) \
          + 2.0 * metric.christoffel_2_12 * Q[idx_hu1] * u2 + metric.christoffel_2_22 * Q[idx_hu2] * u2 \
          + gravity * Q[idx_h] * ( metric.H_contra_21 * topo_dzdx1 + metric.H_contra_22 * topo_dzdx2)
 
    # Assemble the right-hand sides
    rhs = metric.inv_sqrtG * - ( df1_dx1 + df2_dx2 ) - forcing
 
+   if batched:
+      rhs = numpy.ascontiguousarray(numpy.moveaxis(rhs, 1, 0))
+
    return rhs
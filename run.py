@@ -6,21 +6,28 @@ for CUDA and there are devices available on the system. We want to still be able
 there is no cupy module or no CUDA device.
 """
 
+from copy   import copy
 import math
+import os
 from typing import Optional
 import sys
 
 from mpi4py import MPI
 import numpy
 
-from common.definitions         import idx_rho, idx_rho_u1, idx_rho_u2, idx_rho_w
-from common.parallel            import DistributedWorld
+from common.definitions         import idx_h, idx_rho, idx_rho_u1, idx_rho_u2, idx_rho_w, idx_rho_theta, \
+                                       idx_2d_rho_theta
+from common.parallel            import DistributedWorld, space_comm, split_world
+from common.profiler            import profiler
 from common.program_options     import Configuration
-from geometry                   import Cartesian2D, CubedSphere, DFROperators, Geometry
+from common.shared_memory       import build_shared
+from geometry                   import Cartesian2D, CubedSphere, DFROperators, Geometry, StateLayout
 from init.dcmip                 import dcmip_T11_update_winds, dcmip_T12_update_winds
 from init.init_state_vars       import init_state_vars
-from integrators                import Integrator, Epi, EpiStiff, Euler1, Imex2, PartRosExp2, Ros2, RosExp2, \
-                                       StrangSplitting, Srerk, Tvdrk3, BackwardEuler, CrankNicolson, Bdf2
+from integrators                import Integrator, Epi, EpiStiff, Euler1, Imex2, ImexArk, PartRosExp2, Ros2, RosExp2, \
+                                       LieSplitting, OS22Splitting, StrangSplitting, Srerk, Tvdrk3, BackwardEuler, \
+                                       CrankNicolson, Bdf2, Parareal, StepController
+from output.checkpoint          import read_checkpoint
 from output.output_manager      import OutputManager
 from output.state               import load_state
 from precondition.factorization import Factorization
@@ -33,56 +40,99 @@ def run(param: 'Configuration'):
    # set up system (i.e. CUDA device)
    setup_system(param)
 
+   if param.profiling_report or param.profiling_trace:
+      profiler.enable(trace=param.profiling_trace)
+
+   # Split the world among the time slices of a parallel-in-time run, or among the members of an ensemble (None for a
+   # single sequential run)
+   time_comm     = setup_time_parallelism(param)
+   ensemble_comm = setup_ensemble(param)
+
    # Set up distributed world
    ptopo = setup_distributed_world(param)
 
    adjust_nb_elements(param)
 
-   # Create the mesh
-   geom = create_geometry(param, ptopo)
+   def create_model():
+      # Create the mesh
+      geom = create_geometry(param, ptopo)
 
-   # Build differentiation matrice and boundary correction
-   mtrx = create_operators(geom, param)
+      # Build differentiation matrice and boundary correction
+      mtrx = create_operators(geom, param)
 
-   # Initialize state variables
-   Q, topo, metric = init_state_vars(geom, mtrx, param)
+      # Initialize state variables
+      Q, topo, metric = init_state_vars(geom, mtrx, param)
 
-   # Preconditioning
-   preconditioner = create_preconditioner(param, ptopo, Q)
+      return geom, mtrx, Q, topo, metric
 
-   output = OutputManager(param, geom, metric, mtrx, topo)
+   if ensemble_comm is None:
+      geom, mtrx, Q, topo, metric = create_model()
+   else:
+      geom, mtrx, Q, topo, metric = create_shared_model(param, create_model, ensemble_comm, ptopo)
+      Q = perturb_member(param, Q, ensemble_comm.rank)
 
-   # Determine starting step (if not 0)
-   Q, starting_step = determine_starting_state(param, output, Q)
+   # Layout of the state vector inside the time integrator
+   layout = StateLayout(param.state_layout, Q.shape, param.nbsolpts)
+
+   # Preconditioning
+   preconditioner = create_preconditioner(param, ptopo, Q, layout)
 
    # Get handle to the appropriate RHS functions
-   rhs = RhsBundle(geom, mtrx, metric, topo, ptopo, param, Q.shape)
+   rhs = RhsBundle(geom, mtrx, metric, topo, ptopo, param, Q.shape, layout)
+
+   # Parallel-in-time runs have their own time loop
+   if time_comm is not None:
+      run_parareal(param, Q, geom, mtrx, metric, topo, ptopo, rhs, preconditioner, layout, time_comm)
+      profiler.finalize(param.output_dir)
+      return
+
+   output = OutputManager(param, geom, metric, mtrx, topo)
 
    # Time stepping
    stepper = create_time_integrator(param, rhs, preconditioner)
    stepper.output_manager = output
+   stepper.state_layout   = layout
+   if param.adaptive_dt:
+      if stepper.error_order is None and MPI.COMM_WORLD.rank == 0:
+         print(f'WARNING: Time integrator {param.time_integrator} does not provide a local error estimate, '
+               f'the step size will not be adapted')
+      stepper.step_controller = StepController(param)
+   output.integrator = stepper
+
+   # Determine starting step (if not 0)
+   Q, starting_step = determine_starting_state(param, output, Q, stepper, ptopo)
 
    output.step(Q, starting_step)
    sys.stdout.flush()
 
-   t = param.dt * starting_step
+   # With an adaptive step size, the time of a checkpoint is not a multiple of dt
+   t = stepper.sim_time if stepper.sim_time >= 0.0 else param.dt * starting_step
    stepper.sim_time = t
    nb_steps = math.ceil(param.t_end / param.dt) - starting_step
 
    step = starting_step
    while t < param.t_end:
-      if t + param.dt > param.t_end:
+      last_step = t + param.dt > param.t_end
+      if last_step:
          param.dt = param.t_end - t
-         t = param.t_end
-      else:
-         t += param.dt
 
       step += 1
 
-      if MPI.COMM_WORLD.rank == 0: print(f'\nStep {step} of {nb_steps + starting_step}')
+      if MPI.COMM_WORLD.rank == 0:
+         # With an adaptive step size, the number of steps is not known in advance
+         if param.adaptive_dt: print(f'\nStep {step}, t = {t:.6g} s of {param.t_end:.6g} s')
+         else:                 print(f'\nStep {step} of {nb_steps + starting_step}')
 
       Q = stepper.step(Q, param.dt)
-      Q = mtrx.apply_filters(Q, geom, metric, param.dt)
+      Q = mtrx.apply_filters(Q, geom, metric, stepper.latest_dt)
+
+      # The step may have been shortened by the step controller, which also suggests the size of the next one
+      if last_step and stepper.latest_dt == param.dt:
+         t = param.t_end
+      else:
+         t += stepper.latest_dt
+      if stepper.step_controller is not None:
+         param.dt = stepper.step_controller.dt_next
 
       if MPI.COMM_WORLD.rank == 0: print(f'Elapsed time for step: {stepper.latest_time:.3f} secs')
 
@@ -108,6 +158,55 @@ def run(param: 'Configuration'):
 
    output.finalize()
 
+   profiler.finalize(param.output_dir)
+
+def run_parareal(param: Configuration, Q: numpy.ndarray, geom: Geometry, mtrx: DFROperators, metric, topo,
+                 ptopo: Optional[DistributedWorld], rhs: RhsBundle, preconditioner: Optional[Multigrid],
+                 layout: StateLayout, time_comm: MPI.Comm):
+   """ Time loop of a parallel-in-time run. The simulation is advanced one window at a time by the Parareal driver,
+   whose fine propagator is the chosen time integrator. Only the first time slice writes output, for the steps that
+   end a slice. """
+   if param.adaptive_dt:
+      raise ValueError(f'Parallel-in-time runs need a fixed step size (adaptive_dt is not supported)')
+   if param.starting_step > 0 and MPI.COMM_WORLD.rank == 0:
+      print(f'WARNING: Parallel-in-time runs cannot be restarted, will start from step 0')
+
+   fine = create_time_integrator(param, rhs, preconditioner)
+
+   # The coarse integrator has its own preconditioner, since it does not solve systems of the same step size
+   coarse_param = copy(param)
+   coarse_param.time_integrator = param.parareal_coarse_integrator
+   coarse_param.dt = param.dt * param.parareal_fine_steps / param.parareal_coarse_steps
+   coarse = create_time_integrator(coarse_param, rhs, create_preconditioner(coarse_param, ptopo, Q, layout))
+
+   fine.state_layout   = layout
+   coarse.state_layout = layout
+   parareal = Parareal(param, fine, coarse, time_comm,
+                       post_step=lambda Q_step, dt: mtrx.apply_filters(Q_step, geom, metric, dt))
+
+   output = OutputManager(param, geom, metric, mtrx, topo) if time_comm.rank == 0 else None
+   if output is not None: output.step(Q, 0)
+   sys.stdout.flush()
+
+   nb_steps = math.ceil(param.t_end / param.dt)
+   step = 0
+   while step < nb_steps:
+      window_steps = min(parareal.window_steps, nb_steps - step)
+      if MPI.COMM_WORLD.rank == 0: print(f'\nSteps {step + 1} to {step + window_steps} of {nb_steps}')
+
+      Q, slice_ends = parareal.advance(Q, step * param.dt, param.dt, nb_steps - step, param.t_end)
+      check_for_nan(Q)
+
+      if output is not None:
+         for i, Q_slice in enumerate(slice_ends):
+            slice_steps = parareal.slice_steps(i, nb_steps - step)
+            if slice_steps > 0: output.step(Q_slice, step + i * param.parareal_fine_steps + slice_steps)
+      sys.stdout.flush()
+
+      step += window_steps
+
+   if output is not None: output.finalize()
+
 def setup_system(param: Configuration):
    if param.device == "cuda":
       import cupy
@@ -118,12 +217,85 @@ def setup_system(param: Configuration):
 
       cupy.cuda.set_allocator(cupy.cuda.MemoryPool(cupy.cuda.malloc_managed).malloc)
 
+def setup_time_parallelism(param: Configuration) -> Optional[MPI.Comm]:
+   """ Split the world into one group of PEs per time slice, if running in parallel in time. Returns the time
+   communicator (None when running sequentially). """
+   if param.parareal_slices <= 1:
+      return None
+   _, time_comm = split_world(param.parareal_slices)
+   if MPI.COMM_WORLD.rank == 0:
+      print(f'Running in parallel in time with {param.parareal_slices} slices of {space_comm().size} PE(s) each')
+   return time_comm
+
+def setup_ensemble(param: Configuration) -> Optional[MPI.Comm]:
+   """ Split the world into one group of PEs per member, if running an ensemble. Every member writes its output in its
+   own subdirectory of output_dir. Returns the communicator of the PEs that own the same part of the domain in every
+   member, ordered by member (None when running a single member). """
+   if param.ensemble_members <= 1:
+      return None
+   if param.parareal_slices > 1:
+      raise ValueError(f'Cannot run an ensemble in parallel in time')
+
+   _, ensemble_comm = split_world(param.ensemble_members)
+   param.output_dir  = os.path.join(param.output_dir, f'member_{ensemble_comm.rank:03d}')
+   param.output_file = f'{param.output_dir}/{param.base_output_file}.nc'
+   if MPI.COMM_WORLD.rank == 0:
+      print(f'Running an ensemble of {param.ensemble_members} members with {space_comm().size} PE(s) each')
+   return ensemble_comm
+
+def create_shared_model(param: Configuration, create_model, ensemble_comm: MPI.Comm,
+                        ptopo: Optional[DistributedWorld]):
+   """ Create the geometry, operators, metric and initial state of the model once per node for all members of an
+   ensemble, and share them (through shared memory) with the PEs of the other members on the node that own the same
+   part of the domain.
+
+   The model is built by the PEs of the first member present on each node, which must then be complete on that node
+   for the collective operations of the construction. Otherwise, every member builds its own model. """
+   node_comm = ensemble_comm.Split_type(MPI.COMM_TYPE_SHARED, key=ensemble_comm.rank)
+
+   builder = node_comm.rank == 0
+   member_builders = space_comm().allreduce(int(builder), op=MPI.SUM)
+   can_share = param.device == 'cpu' and member_builders in (0, space_comm().size)
+   can_share = MPI.COMM_WORLD.allreduce(can_share, op=MPI.LAND)
+
+   if not can_share:
+      if MPI.COMM_WORLD.rank == 0:
+         print(f'WARNING: Members are not laid out in whole groups on the nodes (or not on CPU), each member builds its '
+               f'own geometry')
+      return create_model()
+
+   if MPI.COMM_WORLD.rank == 0:
+      print(f'Sharing the geometry among {node_comm.size} members per node')
+   geom, mtrx, Q, topo, metric = build_shared(create_model, node_comm, {'ptopo': ptopo, 'param': param})
+
+   # The state is not shared, every member advances its own
+   return geom, mtrx, Q.copy(), topo, metric
+
+def perturb_member(param: Configuration, Q: numpy.ndarray, member: int) -> numpy.ndarray:
+   """ Perturb the initial state of the given ensemble member: its thermodynamic variable (h or ρθ) is multiplied by
+   1 + ensemble_perturbation * (uniform random noise in [-1, 1]). The first member is the unperturbed control. """
+   if member == 0 or param.ensemble_perturbation == 0.0:
+      return Q
+
+   if param.equations == 'shallow_water':
+      var = idx_h
+   elif param.grid_type == 'cartesian2d':
+      var = idx_2d_rho_theta
+   else:
+      var = idx_rho_theta
+
+   rng = numpy.random.default_rng((param.ensemble_seed, member, space_comm().rank))
+   noise = numpy.asarray(rng.uniform(-1.0, 1.0, size=Q[var].shape), like=Q)
+   Q = Q.copy()
+   Q[var] *= 1.0 + param.ensemble_perturbation * noise
+   return Q
+
 def setup_distributed_world(param: Configuration) -> DistributedWorld | None:
    if param.grid_type == "cubed_sphere" and param.device == "cuda":
       from common.cuda_parallel import CudaDistributedWorld
       return CudaDistributedWorld()
    elif param.grid_type == "cubed_sphere":
-      return DistributedWorld()
+      return DistributedWorld(shared_halo=(param.halo_exchange == 'shared'))
    else:
       return None
 
@@ -133,10 +305,11 @@ def adjust_nb_elements(param: Configuration):
       allowed_pe_counts = [i**2 * 6
                            for i in range(1, max(param.nb_elements_horizontal // 2 + 1, 2))
                            if (param.nb_elements_horizontal % i) == 0]
-      if MPI.COMM_WORLD.size not in allowed_pe_counts:
+      num_pe = space_comm().size
+      if num_pe not in allowed_pe_counts:
          raise ValueError(f'Invalid number of processors for this particular problem size. '
                           f'Allowed counts are {allowed_pe_counts}')
-      num_pe_per_tile = MPI.COMM_WORLD.size // 6
+      num_pe_per_tile = num_pe // 6
       num_pe_per_line = int(numpy.sqrt(num_pe_per_tile))
       param.nb_elements_horizontal = param.nb_elements_horizontal_total // num_pe_per_line
       if MPI.COMM_WORLD.rank == 0:
@@ -162,24 +335,30 @@ def create_operators(geom: Geometry, param: Configuration) -> DFROperators:
    return DFROperators(geom, param)
 
 def create_preconditioner(param: Configuration, ptopo: Optional[DistributedWorld],
-                          Q: numpy.ndarray) -> Optional[Multigrid]:
-   """ Create the preconditioner required by the given params """
+                          Q: numpy.ndarray, layout: Optional[StateLayout] = None) -> Optional[Multigrid]:
+   """ Create the preconditioner required by the given params. It will be applied to vectors in the given layout. """
    if param.preconditioner == 'p-mg':
-      return Multigrid(param, ptopo, discretization='dg')
+      return Multigrid(param, ptopo, discretization='dg', state_layout=layout)
    if param.preconditioner == 'fv-mg':
-      return Multigrid(param, ptopo, discretization='fv')
+      return Multigrid(param, ptopo, discretization='fv', state_layout=layout)
    if param.preconditioner == 'fv':
-      return Multigrid(param, ptopo, discretization='fv', fv_only=True)
+      return Multigrid(param, ptopo, discretization='fv', fv_only=True, state_layout=layout)
    if param.preconditioner in ['lu', 'ilu']:
-      return Factorization(Q.dtype, Q.shape, param)
+      # Assembled from the integrator's own operator, so it works directly in its layout
+      shape = layout.internal_shape if layout is not None else Q.shape
+      return Factorization(Q.dtype, shape, param)
    return None
 
-def determine_starting_state(param: Configuration, output: OutputManager, Q: numpy.ndarray):
+def determine_starting_state(param: Configuration, output: OutputManager, Q: numpy.ndarray, stepper: Integrator,
+                             ptopo: Optional[DistributedWorld]):
    """ Try to load the state for the given starting step and, if successful, swap it with the initial state """
    starting_step = param.starting_step
    if starting_step > 0:
       try:
-         starting_state, _ = load_state(output.state_file_name(starting_step))
+         if param.state_format == 'checkpoint':
+            starting_state = load_checkpoint(param, output, starting_step, Q, stepper, ptopo)
+         else:
+            starting_state, _ = load_state(output.state_file_name(starting_step))
          if starting_state.shape != Q.shape:
             print(f'ERROR reading state vector from file for step {starting_step}. '
                   f'The shape is wrong! ({starting_state.shape}, should be {Q.shape})')
@@ -192,13 +371,43 @@ def determine_starting_state(param: Configuration, output: OutputManager, Q: num
                print(f'WARNING: Won\'t run any steps, since we will stop at step '
                      f'{int(math.ceil(param.t_end / param.dt))}')
 
-      except (FileNotFoundError, ValueError):
-         print(f'WARNING: Tried to start from timestep {starting_step}, but unable to read initial state for that step.'
-                ' Will start from 0 instead.')
+      except (FileNotFoundError, ValueError) as e:
+         print(f'WARNING: Tried to start from timestep {starting_step}, but unable to read initial state for that step'
+               f' ({e}). Will start from 0 instead.')
          starting_step = 0
 
    return Q, starting_step
 
+def load_checkpoint(param: Configuration, output: OutputManager, step_id: int, Q: numpy.ndarray, stepper: Integrator,
+                    ptopo: Optional[DistributedWorld]) -> numpy.ndarray:
+   """ Read the state vector for the given step from a checkpoint file and restore the integrator history, if the
+   checkpoint was produced by the same type of integrator """
+   checkpoint = read_checkpoint(output.checkpoint_file_name(step_id))
+   checkpoint.check_config(output.checkpoint_config)
+
+   state = checkpoint.local_field('state', Q.shape, ptopo)
+
+   if checkpoint.metadata['integrator'] == type(stepper).__name__:
+      prefix = 'integrator/'
+      arrays = {name[len(prefix):]: numpy.asarray(checkpoint.local_field(name, Q.shape, ptopo), like=Q)
+                for name in checkpoint.field_names() if name.startswith(prefix)}
+      if stepper.state_layout is not None:
+         arrays = {name: stepper.state_layout.to_internal(array) for name, array in arrays.items()}
+      stepper.restore_checkpoint_data(arrays, checkpoint.metadata['integrator_data'])
+   elif MPI.COMM_WORLD.rank == 0:
+      print(f'WARNING: Checkpoint for step {step_id} was produced by a different time integrator '
+            f'({checkpoint.metadata["integrator"]}). Its history will not be restored.')
+
+   # With an adaptive step size, the simulation time is not a multiple of dt, and the step size must be the one that
+   # was chosen for the next step
+   if param.adaptive_dt:
+      stepper.sim_time = checkpoint.metadata['sim_time']
+      if 'step_controller' in checkpoint.metadata and stepper.step_controller is not None:
+         stepper.step_controller.restore_checkpoint_data(checkpoint.metadata['step_controller'])
+         param.dt = stepper.step_controller.dt_next
+
+   return state
+
 def create_time_integrator(param: Configuration,
                            rhs: RhsBundle,
                            preconditioner: Optional[Multigrid]) \
@@ -241,6 +450,8 @@ def create_time_integrator(param: Configuration,
    # --- Implicit - Explicit
    if param.time_integrator == 'imex2':
       return Imex2(param, rhs.explicit, rhs.implicit)
+   if param.time_integrator[:5] == 'imex_':
+      return ImexArk(param, param.time_integrator[5:], rhs.explicit, rhs.implicit, preconditioner=preconditioner)
 
    # --- Fully implicit
    if param.time_integrator == 'backward_euler':
@@ -250,15 +461,23 @@ def create_time_integrator(param: Configuration,
    if param.time_integrator == 'crank_nicolson':
       return CrankNicolson(param, rhs.full, preconditioner=preconditioner)
 
-   # --- Operator splitting
-   if param.time_integrator == 'strang_epi2_ros2':
-      stepper1 = Epi(param, 2, rhs.explicit)
-      stepper2 = Ros2(param, rhs.implicit, preconditioner=preconditioner)
-      return StrangSplitting(param, stepper1, stepper2)
-   if param.time_integrator == 'strang_ros2_epi2':
-      stepper1 = Ros2(param, rhs.implicit, preconditioner=preconditioner)
-      stepper2 = Epi(param, 2, rhs.explicit)
-      return StrangSplitting(param, stepper1, stepper2)
+   # --- Operator splitting: <method>_<scheme 1>_<scheme 2>, where each scheme advances one part of the RHS (epi2 the
+   #     explicit part, ros2 the implicit part)
+   split_name = param.time_integrator.split('_')
+   split_schemes = {'epi2': lambda: Epi(param, 2, rhs.explicit),
+                    'ros2': lambda: Ros2(param, rhs.implicit, preconditioner=preconditioner)}
+   if len(split_name) == 3 and split_name[1] in split_schemes and split_name[2] in split_schemes:
+      if split_name[1] == split_name[2]:
+         raise ValueError(f'Time integration method {param.time_integrator}: the two schemes of a splitting must be '
+                          f'different, since each one advances its own part of the RHS')
+      stepper1 = split_schemes[split_name[1]]()
+      stepper2 = split_schemes[split_name[2]]()
+      if split_name[0] == 'lie':
+         return LieSplitting(param, stepper1, stepper2)
+      if split_name[0] == 'strang':
+         return StrangSplitting(param, stepper1, stepper2)
+      if split_name[0] == 'os22':
+         return OS22Splitting(param, stepper1, stepper2, param.os22_param)
 
    raise ValueError(f'Time integration method {param.time_integrator} not supported')
 
@@ -269,7 +488,7 @@ def check_for_nan(Q):
       print(f'NaN detected on process {MPI.COMM_WORLD.rank}')
       error_detected[0] = 1
    error_detected_out = numpy.zeros_like(error_detected)
-   MPI.COMM_WORLD.Allreduce(error_detected, error_detected_out, MPI.MAX)
+   space_comm().Allreduce(error_detected, error_detected_out, MPI.MAX)
    if error_detected_out[0] > 0:
       raise ValueError(f'NaN')
 
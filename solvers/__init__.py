@@ -1,13 +1,15 @@
 """ Solvers module """
-from .fgmres            import fgmres
+from .exponential_solver import ExponentialSolver, ExpSolverAutotuner, ExpSolverState
+from .fgmres            import fgmres, FgmresSolver, projected_initial_guess
 from .gcrot             import gcrot
 from .kiops             import kiops
 from .global_operations import global_dotprod, global_inf_norm, global_norm
-from .matvec            import MatvecOp, MatvecOpBasic, MatvecOpRat, matvec_fun, matvec_rat
-from .nonlin            import KrylovJacobian, newton_krylov
+from .matvec            import MatvecOp, MatvecOpBasic, MatvecOpRat, matvec_block, matvec_fun, matvec_rat
+from .nonlin            import KrylovJacobian, newton_krylov, NewtonKrylov
 from .pmex              import pmex
 from .solver_info       import SolverInfo
 
-__all__ = ['fgmres', 'kiops', 'global_dotprod', 'global_inf_norm', 'global_norm', 'KrylovJacobian',
-           'MatvecOp', 'MatvecOpBasic', 'MatvecOpRat',
-           'matvec_fun', 'matvec_rat', 'newton_krylov', 'pmex', 'SolverInfo']
+__all__ = ['ExponentialSolver', 'ExpSolverAutotuner', 'ExpSolverState',
+           'fgmres', 'FgmresSolver', 'kiops', 'global_dotprod', 'global_inf_norm', 'global_norm', 'KrylovJacobian',
+           'MatvecOp', 'MatvecOpBasic', 'MatvecOpRat', 'matvec_block',
+           'matvec_fun', 'matvec_rat', 'newton_krylov', 'NewtonKrylov', 'pmex', 'projected_initial_guess', 'SolverInfo']
@@ -0,0 +1,130 @@
+import math
+from time   import time
+from typing import Any, Dict, Optional, Tuple
+
+from mpi4py import MPI
+import numpy
+
+from common.parallel        import space_comm
+from common.program_options import Configuration
+from .kiops                 import kiops
+from .pmex                  import pmex
+
+class ExpSolverState:
+   """
+   Information that an exponential solver (kiops or pmex) carries from one call to the next. Every integrator owns its
+   own state, so that the values suggested by one problem are not used for another one.
+
+   Attributes:
+      krylov_size    -- Size of the Krylov space to start the next call with. With smooth_krylov_size (kiops), it is
+                        smoothed over the sizes used by the previous calls. Otherwise (pmex), only the first call
+                        starts with the given size, the next ones start with mmax.
+      suggested_step -- Size of the first accepted substep of the latest call, as a fraction of the interval
+      reuse_step     -- Whether the next call starts with the suggested substep (rather than the whole interval)
+      mmin, mmax     -- Bounds for the size of the Krylov space
+      iop            -- Length of the incomplete orthogonalization (kiops only)
+   """
+   def __init__(self, krylov_size: int, mmin: int, mmax: int, iop: int = 2, reuse_step: bool = False,
+                smooth_krylov_size: bool = True) -> None:
+      self.krylov_size    = krylov_size
+      self.smooth_krylov_size = smooth_krylov_size
+      self.suggested_step: Optional[float] = None
+      self.reuse_step     = reuse_step
+      self.mmin           = mmin
+      self.mmax           = mmax
+      self.iop            = iop
+
+   def update(self, last_krylov_size: int) -> None:
+      """Update the Krylov size with the one used for the last substep of a call."""
+      if self.smooth_krylov_size:
+         self.krylov_size = math.floor(0.7 * last_krylov_size + 0.3 * self.krylov_size)
+      else:
+         self.krylov_size = self.mmax
+
+   def checkpoint_data(self) -> Dict[str, Any]:
+      return {'krylov_size': self.krylov_size, 'suggested_step': self.suggested_step, 'reuse_step': self.reuse_step,
+              'mmax': self.mmax}
+
+   def restore_checkpoint_data(self, scalars: Dict[str, Any]) -> None:
+      self.krylov_size    = scalars['krylov_size']
+      self.suggested_step = scalars['suggested_step']
+      self.reuse_step     = scalars['reuse_step']
+      self.mmax           = scalars['mmax']
+
+class ExpSolverAutotuner:
+   """
+   Choose the parameters of an exponential solver that minimize the measured wall time per time step: the maximum size
+   of the Krylov space, and whether to start each call with the substep size suggested by the previous one.
+
+   Every candidate is used for a few time steps, then the fastest one (on average, slowest PE) is kept for the rest of
+   the run.
+   """
+   candidates = [(mmax, reuse_step) for mmax in (32, 64, 128) for reuse_step in (False, True)]
+   num_trials = 2
+
+   def __init__(self, state: ExpSolverState) -> None:
+      self.state   = state
+      self.times   = {candidate: [] for candidate in self.candidates}
+      self.current: Optional[Tuple[int, bool]] = None
+      self.best:    Optional[Tuple[int, bool]] = None
+      self.step_time = 0.0
+
+   def start_step(self) -> None:
+      """Record the time of the previous step (if the solver was used) and set the parameters for the next one."""
+      if self.best is not None: return
+
+      if self.current is not None and self.step_time > 0.0:
+         self.times[self.current].append(space_comm().allreduce(self.step_time, op=MPI.MAX))
+      self.step_time = 0.0
+
+      untried = [c for c in self.candidates if len(self.times[c]) < self.num_trials]
+      if len(untried) > 0:
+         self.current = untried[0]
+      else:
+         self.best = min(self.candidates, key=lambda c: sum(self.times[c]) / len(self.times[c]))
+         self.current = self.best
+         if MPI.COMM_WORLD.rank == 0:
+            print(f'Exponential solver autotuning: using mmax = {self.best[0]}, '
+                  f'{"reusing" if self.best[1] else "not reusing"} the suggested substep')
+
+      self.state.mmax, self.state.reuse_step = self.current
+      self.state.krylov_size = min(self.state.krylov_size, self.state.mmax)
+
+class ExponentialSolver:
+   """
+   Evaluate linear combinations of φ functions with the exponential solver chosen in the configuration, keeping its
+   state (and, optionally, an autotuner) from one call to the next.
+   """
+   def __init__(self, param: Configuration, mmin: int = 16, mmax: int = 64) -> None:
+      self.method = param.exponential_solver
+      self.device = param.device
+      self.name   = self.method.upper()
+
+      if self.method == 'pmex':
+         self.state = ExpSolverState(10, mmin, mmax, smooth_krylov_size=False)
+      else:
+         self.state = ExpSolverState(max(param.krylov_size, mmin), mmin, mmax)
+      self.autotuner = ExpSolverAutotuner(self.state) if param.exp_autotune else None
+
+   def start_step(self) -> None:
+      """Must be called at the start of every time step of the integrator (for the autotuner)."""
+      if self.autotuner is not None: self.autotuner.start_step()
+
+   def __call__(self, τ_out, A, u: numpy.ndarray, tol: float, task1: bool = False) -> Tuple[numpy.ndarray, Tuple]:
+      t0 = time()
+      state = self.state
+
+      if self.method == 'pmex':
+         w, stats = pmex(τ_out, A, u, tol=tol, m_init=state.krylov_size, mmax=state.mmax, task1=task1, state=state)
+      elif self.device == 'cuda':
+         from gef_cuda import kiops_cuda
+         w, stats = kiops_cuda(τ_out, A, u, tol=tol, m_init=state.krylov_size, mmin=state.mmin, mmax=state.mmax,
+                               iop=state.iop, task1=task1)
+      else:
+         w, stats = kiops(τ_out, A, u, tol=tol, m_init=state.krylov_size, mmin=state.mmin, mmax=state.mmax,
+                          iop=state.iop, task1=task1, state=state)
+
+      state.update(stats[5])
+      if self.autotuner is not None: self.autotuner.step_time += time() - t0
+
+      return w, stats
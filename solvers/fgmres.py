@@ -8,9 +8,11 @@ import numpy
 import scipy
 import scipy.sparse.linalg
 
+from common.parallel      import space_comm
+from common.profiler      import profiler
 from .global_operations import global_dotprod, global_norm
 
-__all__ = ['fgmres']
+__all__ = ['fgmres', 'FgmresSolver', 'projected_initial_guess']
 
 MatvecOperator = Callable[[numpy.ndarray], numpy.ndarray]
 
@@ -65,6 +67,220 @@ def _ortho_1_sync_igs(Q, R, T, K, j, comm):
 
    return norm
 
+class FgmresWorkspace:
+   """
+   Arrays used by FGMRES, for a given restart length and problem size. They are allocated once and reused by every
+   restart of every solve.
+
+   Attributes:
+      V, Z       -- Krylov basis vectors and their preconditioned counterparts (row-major, one vector per row)
+      H          -- Hessenberg matrix (transposed)
+      R, T, K    -- Data for the 1-sync orthogonalization process
+      g          -- Right-hand side of the least-squares problem in the Krylov space
+      givens_c, givens_s -- Givens rotations applied to H and g
+      tmp, update -- Full-length temporary vectors
+   """
+   def __init__(self, restart: int, num_dofs: int, dtype) -> None:
+      self.restart  = restart
+      self.num_dofs = num_dofs
+      self.dtype    = dtype
+
+      self.H = numpy.zeros((restart+2, restart+2), dtype=dtype)
+      self.R = numpy.zeros((restart+2, restart+2), dtype=dtype)
+      self.T = numpy.zeros((restart+2, restart+2), dtype=dtype)
+      self.K = numpy.zeros((restart+2, restart+2), dtype=dtype)
+      self.V = numpy.zeros((restart+2, num_dofs), dtype=dtype)
+      self.Z = numpy.zeros((restart+1, num_dofs), dtype=dtype)
+      self.g = numpy.zeros(restart+2, dtype=dtype)
+      self.givens_c = numpy.zeros(restart+1, dtype=dtype)
+      self.givens_s = numpy.zeros(restart+1, dtype=dtype)
+      self.tmp    = numpy.zeros(num_dofs, dtype=dtype)
+      self.update = numpy.zeros(num_dofs, dtype=dtype)
+
+   def fits(self, restart: int, num_dofs: int, dtype) -> bool:
+      return self.restart == restart and self.num_dofs == num_dofs and self.dtype == dtype
+
+   def reset(self) -> None:
+      """Clear the small dense matrices, at the start of a restart. The basis vectors are always written before being
+      read, so they don't need to be cleared."""
+      self.H.fill(0.0)
+      self.R.fill(0.0)
+      self.T.fill(0.0)
+      self.K.fill(0.0)
+      self.g.fill(0.0)
+      self.givens_c.fill(1.0)
+      self.givens_s.fill(0.0)
+
+class FgmresSolver:
+   """
+   FGMRES solver that keeps its workspace (Krylov basis and small dense matrices) from one call to the next, so that
+   solving a sequence of systems of the same size (e.g. one per time step) does not allocate a new basis every time.
+   The workspace is reallocated only when the restart length, the problem size or the data type changes.
+   """
+   def __init__(self) -> None:
+      self.workspace: Optional[FgmresWorkspace] = None
+
+   def get_workspace(self, restart: int, num_dofs: int, dtype) -> FgmresWorkspace:
+      if self.workspace is None or not self.workspace.fits(restart, num_dofs, dtype):
+         self.workspace = FgmresWorkspace(restart, num_dofs, dtype)
+      return self.workspace
+
+   @profiler.profile('fgmres')
+   def __call__(self,
+                A: MatvecOperator,
+                b: numpy.ndarray,
+                x0: Optional[numpy.ndarray] = None,
+                tol: float = 1e-5,
+                restart: int = 20,
+                maxiter: Optional[int] = None,
+                preconditioner: Optional[MatvecOperator] = None,
+                hegedus: bool = False,
+                verbose: int = 0,
+                prefix: str = '',
+                comm: Optional[MPI.Comm] = None) \
+                  -> Tuple[numpy.ndarray, float, float, int, int, List[Tuple[float, float, float]]]:
+      """
+      Solve the given linear system (Ax = b) for x, using the FGMRES algorithm. See [fgmres] for the arguments and
+      return values.
+      """
+
+      t_start = time()
+      niter = 0
+
+      if comm is None: comm = space_comm()
+
+      if preconditioner is None:
+         preconditioner = lambda x: x     # Set up a preconditioner that does nothing
+
+      num_dofs = len(b)
+
+      if maxiter is None:
+         maxiter = num_dofs * 10 # Wild guess
+
+      if x0 is None:
+         x = numpy.zeros_like(b)
+      else:
+         x = x0.copy()
+
+      # Check for early stop
+      norm_b = global_norm(b, comm=comm)
+      if norm_b == 0.0:
+         return numpy.zeros_like(b), 0., 0., 0, 0, [(0.0, time() - t_start, 0.0)]
+
+      tol_relative = tol * norm_b
+
+      Ax0 = A(x)
+      residuals = []
+
+      # Rescale the initial approximation using the Hegedüs trick
+      if hegedus:
+         norm_Ax0_2 = global_dotprod(Ax0, Ax0, comm=comm)
+         if norm_Ax0_2 != 0.:
+            ksi_min = global_dotprod(b, Ax0, comm=comm) / norm_Ax0_2
+            x = ksi_min * x0
+            Ax0 = A(x)
+
+      r      = b - Ax0
+      norm_r = global_norm(r, comm=comm)
+
+      residuals.append((norm_r / norm_b, time() - t_start, 0.0))
+
+      # Get fast access to underlying BLAS routines
+      [lartg] = scipy.linalg.get_lapack_funcs(['lartg'], [x])
+
+      ws = self.get_workspace(restart, num_dofs, numpy.result_type(b.dtype, x.dtype))
+      # NOTE: We are dealing with row-major matrices, but we store the transpose of H and V.
+      H, R, T, K, V, Z, g = ws.H, ws.R, ws.T, ws.K, ws.V, ws.Z, ws.g
+      givens_c, givens_s = ws.givens_c, ws.givens_s
+
+      for outer in range(maxiter):
+         ws.reset()
+
+         numpy.divide(r, norm_r, out=V[0, :])
+         Z[0, :] = preconditioner(V[0, :])
+         V[1, :] = A(Z[0, :])
+         v_norm = _ortho_1_sync_igs(V, R, T, K, 2, comm)
+
+         # This is the RHS vector for the problem in the Krylov Space
+         g[0] = norm_r
+         for inner in range(restart):
+
+            niter += 1
+
+            # Modified Gram-Schmidt process (1-sync version, with lagged normalization)
+            Z[inner + 1, :] = preconditioner(V[inner + 1])
+            numpy.divide(Z[inner + 1, :], v_norm, out=ws.tmp)
+            V[inner + 2, :] = A(ws.tmp)
+            V[inner + 2, :] *= v_norm
+            v_norm = _ortho_1_sync_igs(V, R, T, K, inner + 3, comm)
+            H[inner, :inner + 2] = R[:inner + 2, inner + 1]
+            Z[inner + 1, :] /= v_norm
+
+            # Apply previous Givens rotations to H
+            if inner > 0:
+               _apply_givens(givens_c, givens_s, H[inner, :], inner)
+
+            # Calculate and apply next complex-valued Givens Rotation
+            # ==> Note that if restart = num_dofs, then this is unnecessary
+            # for the last inner
+            #    iteration, when inner = num_dofs-1.
+            if inner != num_dofs - 1:
+               if H[inner, inner + 1] != 0:
+                  [c, s, _] = lartg(H[inner, inner], H[inner, inner + 1])
+                  givens_c[inner] = c
+                  givens_s[inner] = s
+
+                  # Apply Givens Rotation to g,
+                  #   the RHS for the linear system in the Krylov Subspace.
+                  _rotate(c, s, g, inner)
+
+                  # Apply effect of Givens Rotation to H
+                  H[inner, inner] = c * H[inner, inner] + s * H[inner, inner + 1]
+                  H[inner, inner + 1] = 0.0
+
+            # Don't update norm_r if last inner iteration, because
+            # norm_r is calculated directly after this loop ends.
+            if inner < restart - 1:
+               norm_r = numpy.abs(g[inner+1])
+               residuals.append((norm_r / norm_b, time() - t_start, 0.0))
+               if verbose > 1:
+                  if comm.rank == 0: print(f'{prefix}norm_r / b = {residuals[-1][0]:.3e}')
+                  sys.stdout.flush()
+               if norm_r < tol_relative:
+                  break
+
+         # end inner loop, back to outer loop
+
+         # Find best update to x in Krylov Space V.
+         y = scipy.linalg.solve_triangular(H[0:inner + 1, 0:inner + 1].T, g[0:inner + 1])
+         update = numpy.dot(y, Z[:inner+1, :], out=ws.update)
+         x += update
+         r = b - A(x)
+
+         norm_r = global_norm(r, comm=comm)
+         residuals.append((norm_r / norm_b, time() - t_start, 0.0))
+         if verbose > 0:
+            if comm.rank == 0: print(f'{prefix}res: {norm_r/norm_b:.2e} (iter {niter})')
+            sys.stdout.flush()
+
+         # Has GMRES stagnated?
+         indices = (x != 0)
+         if indices.any():
+            change = numpy.max(numpy.abs(update[indices] / x[indices]))
+            if change < 1e-12:
+               # No change, halt
+               return x, norm_r, norm_b, niter, -1, residuals
+
+         # test for convergence
+         if norm_r < tol_relative:
+            return x, norm_r, norm_b, niter, 0, residuals
+
+      # end outer loop
+
+      flag = 0
+      if norm_r >= tol_relative: flag = -1
+      return x, norm_r, norm_b, niter, flag, residuals
+
 def fgmres(A: MatvecOperator,
            b: numpy.ndarray,
            x0: Optional[numpy.ndarray] = None,
@@ -75,10 +291,11 @@ def fgmres(A: MatvecOperator,
            hegedus: bool = False,
            verbose: int = 0,
            prefix: str = '',
-           comm: MPI.Comm = MPI.COMM_WORLD) \
+           comm: Optional[MPI.Comm] = None) \
             -> Tuple[numpy.ndarray, float, float, int, int, List[Tuple[float, float, float]]]:
    """
-   Solve the given linear system (Ax = b) for x, using the FGMRES algorithm.
+   Solve the given linear system (Ax = b) for x, using the FGMRES algorithm. This allocates a new workspace for
+   every call; use a [FgmresSolver] to keep it from one system to the next.
 
    Mandatory arguments:
    A              -- System matrix. This may be an operator that when applied to a vector [v] results in A*v
@@ -99,152 +316,43 @@ def fgmres(A: MatvecOperator,
    4. A flag that indicates the convergence status (0 if converged, -1 if not)
    5. The list of residuals at every iteration
    """
+   return FgmresSolver()(A, b, x0=x0, tol=tol, restart=restart, maxiter=maxiter, preconditioner=preconditioner,
+                         hegedus=hegedus, verbose=verbose, prefix=prefix, comm=comm)
 
-   t_start = time()
-   niter = 0
-
-   if preconditioner is None:
-      preconditioner = lambda x: x     # Set up a preconditioner that does nothing
-
-   num_dofs = len(b)
-   total_work = 0.0
-
-   if maxiter is None:
-      maxiter = num_dofs * 10 # Wild guess
-
-   if x0 is None:
-      x = numpy.zeros_like(b)
-   else:
-      x = x0.copy()
-
-   # Check for early stop
-   norm_b = global_norm(b, comm=comm)
-   if norm_b == 0.0:
-      return numpy.zeros_like(b), 0., 0., 0, 0, [(0.0, time() - t_start, 0.0)]
-
-   tol_relative = tol * norm_b
-
-   Ax0 = A(x)
-   residuals = []
-
-   # Rescale the initial approximation using the Hegedüs trick
-   if hegedus:
-      norm_Ax0_2 = global_dotprod(Ax0, Ax0, comm=comm)
-      if norm_Ax0_2 != 0.:
-         ksi_min = global_dotprod(b, Ax0, comm=comm) / norm_Ax0_2
-         x = ksi_min * x0
-         Ax0 = A(x)
-
-   r      = b - Ax0
-   norm_r = global_norm(r, comm=comm)
-
-   residuals.append((norm_r / norm_b, time() - t_start, 0.0))
-
-   # Get fast access to underlying BLAS routines
-   [lartg] = scipy.linalg.get_lapack_funcs(['lartg'], [x])
-   [dotu, scal] = scipy.linalg.get_blas_funcs(['dotu', 'scal'], [x])
-
-   for outer in range(maxiter):
-      # NOTE: We are dealing with row-major matrices, but we store the transpose of H and V.
-      H = numpy.zeros((restart+2, restart+2))
-      R = numpy.zeros((restart+2, restart+2)) # rhs of the MGS factorization (should be H.transposed?)
-      T = numpy.zeros((restart+2, restart+2))
-      K = numpy.zeros((restart+2, restart+2))
-      V = numpy.zeros((restart+2, num_dofs))  # row-major ordering
-      Z = numpy.zeros((restart+1, num_dofs))  # row-major ordering
-      Q = []  # Givens Rotations
-
-      V[0, :] = r / norm_r
-      Z[0, :] = preconditioner(V[0, :])
-      V[1, :] = A(Z[0, :])
-      v_norm = _ortho_1_sync_igs(V, R, T, K, 2, comm)
-
-      # This is the RHS vector for the problem in the Krylov Space
-      g = numpy.zeros(num_dofs)
-      g[0] = norm_r
-      for inner in range(restart):
-
-         niter += 1
-
-         # Modified Gram-Schmidt process (1-sync version, with lagged normalization)
-         Z[inner + 1, :] = preconditioner(V[inner + 1])
-         V[inner + 2, :] = A(Z[inner + 1, :] / v_norm) * v_norm
-         v_norm = _ortho_1_sync_igs(V, R, T, K, inner + 3, comm)
-         H[inner, :inner + 2] = R[:inner + 2, inner + 1]
-         Z[inner + 1, :] /= v_norm
-
-         # Apply previous Givens rotations to H
-         if inner > 0:
-            _apply_givens(Q, H[inner, :], inner)
-
-         # Calculate and apply next complex-valued Givens Rotation
-         # ==> Note that if restart = num_dofs, then this is unnecessary
-         # for the last inner
-         #    iteration, when inner = num_dofs-1.
-         if inner != num_dofs - 1:
-            if H[inner, inner + 1] != 0:
-               [c, s, r] = lartg(H[inner, inner], H[inner, inner + 1])
-               Qblock = numpy.array([[c, s], [-numpy.conjugate(s), c]])
-               Q.append(Qblock)
-
-               # Apply Givens Rotation to g,
-               #   the RHS for the linear system in the Krylov Subspace.
-               g[inner:inner + 2] = Qblock @ g[inner:inner + 2]
-
-               # Apply effect of Givens Rotation to H
-               H[inner, inner] = dotu(Qblock[0, :], H[inner, inner:inner + 2])
-               H[inner, inner + 1] = 0.0
-
-         # Don't update norm_r if last inner iteration, because
-         # norm_r is calculated directly after this loop ends.
-         if inner < restart - 1:
-            norm_r = numpy.abs(g[inner+1])
-            residuals.append((norm_r / norm_b, time() - t_start, 0.0))
-            if verbose > 1:
-               if comm.rank == 0: print(f'{prefix}norm_r / b = {residuals[-1][0]:.3e}')
-               sys.stdout.flush()
-            if norm_r < tol_relative:
-               break
-
-      # end inner loop, back to outer loop
-
-      # Find best update to x in Krylov Space V.
-      y = scipy.linalg.solve_triangular(H[0:inner + 1, 0:inner + 1].T, g[0:inner + 1])
-      update = numpy.ravel(Z[:inner+1, :].T @ y.reshape(-1, 1))
-      x = x + update
-      r = b - A(x)
-
-      norm_r = global_norm(r, comm=comm)
-      residuals.append((norm_r / norm_b, time() - t_start, 0.0))
-      if verbose > 0:
-         if comm.rank == 0: print(f'{prefix}res: {norm_r/norm_b:.2e} (iter {niter})')
-         sys.stdout.flush()
+def projected_initial_guess(A: MatvecOperator,
+                            b: numpy.ndarray,
+                            basis: List[numpy.ndarray],
+                            comm: Optional[MPI.Comm] = None) -> numpy.ndarray:
+   """
+   Initial guess for the system Ax = b that minimizes the residual |b - Ax| over the space spanned by the given
+   vectors (typically, the solutions of the previous systems and an extrapolation of them). This costs one product
+   with A per vector, and a single global reduction.
+   """
+   if comm is None: comm = space_comm()
 
-      # Has GMRES stagnated?
-      indices = (x != 0)
-      if indices.any():
-         change = numpy.max(numpy.abs(update[indices] / x[indices]))
-         if change < 1e-12:
-            # No change, halt
-            return x, norm_r, norm_b, niter, -1, residuals
+   W  = numpy.array([numpy.ravel(v) for v in basis])
+   AW = numpy.array([numpy.ravel(A(v)) for v in W])
 
-      # test for convergence
-      if norm_r < tol_relative:
-         return x, norm_r, norm_b, niter, 0, residuals
+   local_products = numpy.hstack([AW @ AW.T, (AW @ b)[:, None]])
+   global_products = comm.allreduce(local_products)
+   G, AWb = global_products[:, :-1], global_products[:, -1]
 
-   # end outer loop
+   coeffs = numpy.linalg.lstsq(G, AWb, rcond=None)[0]
+   return coeffs @ W
 
-   flag = 0
-   if norm_r >= tol_relative: flag = -1
-   return x, norm_r, norm_b, niter, flag, residuals
+def _rotate(c, s, v, j):
+   """Apply the Givens rotation (c, s) to entries j and j+1 of v (in place)."""
+   v_j, v_jp1 = v[j], v[j+1]
+   v[j]   = c * v_j + s * v_jp1
+   v[j+1] = -numpy.conjugate(s) * v_j + c * v_jp1
 
-def _apply_givens(Q, v, k):
-   """Apply the first k Givens rotations in Q to v.
+def _apply_givens(givens_c, givens_s, v, k):
+   """Apply the first k Givens rotations to v.
 
    Parameters
    ----------
-   Q : list
-      list of consecutive 2x2 Givens rotations
+   givens_c, givens_s : array
+      coefficients of consecutive 2x2 Givens rotations
    v : array
       vector to apply the rotations to
    k : int
@@ -262,4 +370,4 @@ def _apply_givens(Q, v, k):
 
    """
    for j in range(k):
-      v[j:j+2] = Q[j] @ v[j:j+2]
+      _rotate(givens_c[j], givens_s[j], v, j)
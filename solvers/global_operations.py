@@ -1,21 +1,26 @@
-"""Global operations performed on distributed vectors."""
+"""Global operations performed on distributed vectors (over the space communicator, unless another one is given)."""
 
 from mpi4py import MPI
 import numpy
 
+from common.parallel import space_comm
+
 __all__ = ['global_norm', 'global_dotprod', 'global_inf_norm']
 
-def global_norm(vec, comm=MPI.COMM_WORLD):
+def global_norm(vec, comm=None):
    """Compute vector norm across all PEs"""
+   if comm is None: comm = space_comm()
    local_sum = vec @ vec
    return numpy.sqrt( comm.allreduce(local_sum) )
 
-def global_dotprod(vec1, vec2, comm=MPI.COMM_WORLD):
+def global_dotprod(vec1, vec2, comm=None):
    """Compute dot product across all PEs"""
+   if comm is None: comm = space_comm()
    local_sum = vec1 @ vec2
    return comm.allreduce(local_sum)
 
-def global_inf_norm(vec, comm=MPI.COMM_WORLD):
+def global_inf_norm(vec, comm=None):
    """Compute infinity norm across all PEs"""
+   if comm is None: comm = space_comm()
    local_max = numpy.amax(numpy.abs(vec))
    return comm.allreduce(local_max, op=MPI.MAX)
@@ -4,7 +4,11 @@ from mpi4py import MPI
 import numpy
 import scipy.linalg
 
-def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2, task1 = False):
+from common.parallel import space_comm
+from common.profiler import profiler
+
+@profiler.profile()
+def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2, task1 = False, state = None):
    """
       kiops(tstops, A, u; kwargs...) -> (w, stats)
 
@@ -29,6 +33,9 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
    - `m`        - an estimate of the appropriate Krylov size (default: mmin)
    - `iop`      - length of incomplete orthogonalization procedure (default: 2)
    - `task1`     - if true, divide the result by 1/T**p
+   - `state`    - an ExpSolverState that persists across calls. If its `reuse_step` is set, the first substep is the
+                  suggested one rather than the whole interval. The size of the first accepted substep (as a fraction
+                  of the interval) is saved as the suggestion for the next call.
 
    Returns:
    - `w`      - the linear combination of the ``φ`` functions evaluated at ``tA`` acting on the vectors from ``u``
@@ -82,10 +89,13 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
    w = numpy.zeros((numSteps, n))
    w[0, :] = u[0, :].copy()
 
+   # Global operations are over the PEs that share the spatial domain
+   comm = space_comm()
+
    # compute the 1-norm of u
    local_nrmU = numpy.sum(abs(u[1:, :]), axis=1)
    global_normU = numpy.empty_like(local_nrmU)
-   MPI.COMM_WORLD.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
+   comm.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
    normU = numpy.amax(global_normU)
 
    # Normalization factors
@@ -102,6 +112,8 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
 
    # Compute and initial starting approximation for the step size
    τ = τ_end
+   if state is not None and state.reuse_step and state.suggested_step is not None:
+      τ = min(τ_end, state.suggested_step * τ_end)
 
    # Setting the safety factors and tolerance requirements
    if τ_end > 1:
@@ -137,7 +149,7 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
          # Normalize initial vector (this norm is nonzero)
          local_sum = V[0, 0:n] @ V[0, 0:n]
          global_sum_nrm = numpy.empty_like(local_sum)
-         MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+         comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
          β = math.sqrt( global_sum_nrm + V[j, n:n+p] @ V[j, n:n+p] )
 
          # The first Krylov basis vector
@@ -158,13 +170,13 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
 
          local_sum = V[ilow:j, 0:n] @ V[j, 0:n]
          global_sum = numpy.empty_like(local_sum)
-         MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum, MPI.DOUBLE])
+         comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum, MPI.DOUBLE])
          H[ilow:j, j-1] = global_sum + V[ilow:j, n:n+p] @ V[j, n:n+p]
 
          V[j, :] = V[j, :] - V[ilow:j,:].T @ H[ilow:j, j-1]
 
          local_sum = V[j, 0:n] @ V[j, 0:n]
-         MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+         comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
          nrm = numpy.sqrt( global_sum_nrm + V[j, n:n+p] @ V[j, n:n+p] )
 
          # Happy breakdown
@@ -261,6 +273,9 @@ def kiops(τ_out, A, u, tol = 1e-7, m_init = 10, mmin = 10, mmax = 128, iop = 2,
          reject += ireject
          step   += 1
 
+         if step == 1 and state is not None:
+            state.suggested_step = τ / τ_end
+
          # Udate for τ_out in the interval (τ_now, τ_now + τ)
          blownTs = 0
          nextT = τ_now + τ
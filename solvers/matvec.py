@@ -37,6 +37,27 @@ def matvec_fun(vec: numpy.ndarray, dt: float, Q: numpy.ndarray, rhs: numpy.ndarr
 
    return jac.flatten()
 
+def matvec_block(V: numpy.ndarray, dt: float, Q: numpy.ndarray, rhs: numpy.ndarray, rhs_handle, method='complex') \
+   -> numpy.ndarray:
+   """Same as matvec_fun, for a block of vectors V with a leading vector axis, (k, Q.size) or (k,) + Q.shape. The k
+   perturbed states are stacked along that axis and evaluated in a single call to the RHS, which must accept a batch
+   of states (see RhsBundle): the RHS work and its halo exchanges are then shared by the whole block.
+   Returns an array of shape (k, Q.size)."""
+   num_vectors = V.shape[0]
+   V = numpy.reshape(V, (num_vectors,) + Q.shape)
+   if method == 'complex':
+      # Complex-step approximation, one perturbation per member of the batch
+      epsilon = math.sqrt(numpy.finfo(float).eps)
+      Qvec = Q + 1j * epsilon * V
+      jac = dt * (rhs_handle(Qvec) / epsilon).imag
+   else:
+      # Finite difference approximation
+      epsilon = math.sqrt(numpy.finfo(numpy.float32).eps)
+      Qvec = Q + epsilon * V
+      jac = dt * ( rhs_handle(Qvec) - rhs) / epsilon
+
+   return jac.reshape((num_vectors, -1))
+
 class MatvecOpRat(MatvecOp):
    def __init__(self, dt: float, Q: numpy.ndarray, rhs_vec: numpy.ndarray, rhs_handle: Callable) -> None:
       super().__init__(
@@ -4,104 +4,208 @@ import math
 import scipy.sparse.linalg
 import scipy.optimize
 from time import time
+from typing import Optional
 
-from .fgmres import fgmres
+from common.program_options import Configuration
+from .fgmres import FgmresSolver
 from .global_operations import global_norm, global_inf_norm
 
 def newton_krylov(F, x0, fgmres_restart=30, fgmres_maxiter=1, fgmres_precond=None, verbose=False, maxiter=None, f_tol=None, f_rtol=None, x_tol=None, x_rtol=None, line_search='armijo'):
+   """Solve F(x) = 0 with a Jacobian-free Newton-Krylov method, starting from x0. This uses a new [NewtonKrylov]
+   solver (with its default options) for every call."""
+   solver = NewtonKrylov(fgmres_restart=fgmres_restart, fgmres_maxiter=fgmres_maxiter)
+   return solver.solve(F, x0, fgmres_precond=fgmres_precond, verbose=verbose, maxiter=maxiter, f_tol=f_tol,
+                       f_rtol=f_rtol, x_tol=x_tol, x_rtol=x_rtol, line_search=line_search)
+
+class NewtonKrylov:
+   """
+   Jacobian-free Newton-Krylov solver that keeps its state from one call to the next (typically, from one time step
+   to the next): the linearization used for the Jacobian-vector products, the FGMRES workspace and the increment of
+   the latest solve.
+
+   Options (from the configuration, if given):
+   newton_jacobian_reuse   -- Number of Newton iterations done with the same linearization. 1 is the standard Newton
+                              method, more gives the Shamanskii method (the chord method, if it is larger than the
+                              number of iterations). The linearization is always updated after an iteration that did
+                              not reduce the residual.
+   newton_jacobian_max_age -- Number of additional calls over which a linearization can be kept, as long as they
+                              give the same jacobian_key. For the implicit time integrators, F only changes by a
+                              constant from one step to the next (with the same dt), so its Jacobian at the previous
+                              solution is still a good approximation. The integrators then keep their
+                              preconditioner as well, for at most that many steps in a row.
+   newton_forcing          -- How the relative tolerance of the linear solves (the forcing term) is chosen:
+                              'eisenstat_walker' (choice 2 of Eisenstat and Walker) or 'constant'
+   newton_warm_start       -- Start the iterations from x0 plus the increment of the previous call (with the same
+                              jacobian_key), if that gives a smaller residual than x0 itself
+   """
+   gamma        = 0.9
+   eta_max      = 0.9999
+   eta_treshold = 0.1
+   eta_initial  = 1e-3
 
-   t_start = time()
-   iteration = 0
+   def __init__(self, param: Optional[Configuration] = None, fgmres_restart: int = 30, fgmres_maxiter: int = 1) \
+         -> None:
+      self.fgmres_restart = fgmres_restart
+      self.fgmres_maxiter = fgmres_maxiter
 
-   gamma = 0.9
-   eta_max = 0.9999
-   eta_treshold = 0.1
-   eta = 1e-3
+      self.jacobian_reuse = 1
+      self.max_age        = 0
+      self.forcing        = 'eisenstat_walker'
+      self.warm_start     = False
+      if param is not None:
+         self.jacobian_reuse = param.newton_jacobian_reuse
+         self.max_age        = param.newton_jacobian_max_age
+         self.forcing        = param.newton_forcing
+         self.warm_start     = param.newton_warm_start
 
-   if f_tol is None:
-      f_tol = numpy.finfo(numpy.float_).eps ** (1./3)
-   if f_rtol is None:
-      f_rtol = numpy.inf
-   if x_tol is None:
-      x_tol = numpy.inf
-   if x_rtol is None:
-      x_rtol = numpy.inf
+      self.jacobian: Optional[KrylovJacobian] = None
+      self.jacobian_key = None
+      self.age          = 0
+      self.previous_increment: Optional[numpy.ndarray] = None
 
-   f0_norm = None
+      self.num_linearizations = 0
 
-   func = lambda z: F(numpy.reshape(z, x0.shape)).flatten()
-   x = x0.flatten()
+   def reuses_linearization(self, jacobian_key) -> bool:
+      """Whether the next call with the given key will start with the linearization of the previous one."""
+      return self.jacobian is not None and jacobian_key is not None and jacobian_key == self.jacobian_key \
+         and self.age < self.max_age
 
-   dx = numpy.full_like(x, numpy.inf)
-   Fx = func(x)
-   Fx_norm = global_norm(Fx)
+   def solve(self, F, x0, fgmres_precond=None, verbose=False, maxiter=None, f_tol=None, f_rtol=None, x_tol=None,
+             x_rtol=None, line_search='armijo', jacobian_key=None):
+      """
+      Solve F(x) = 0, starting from x0.
 
-   jacobian = KrylovJacobian(x.copy(), Fx, func, fgmres_restart=fgmres_restart, fgmres_maxiter=fgmres_maxiter, fgmres_precond=fgmres_precond)
+      jacobian_key identifies the Jacobian of F, up to a constant shift of F (for example, the time step size).
+      Linearizations and increments are only reused between calls with the same (non-None) key.
 
-   if maxiter is None:
-      maxiter = 100*(x.size+1)
+      Returns the solution, the number of Newton iterations and the list of residuals.
+      """
 
-   if line_search not in (None, 'armijo', 'wolfe'):
-      raise ValueError("Invalid line search")
+      t_start = time()
+      iteration = 0
 
-   residuals = []
+      if f_tol is None:
+         f_tol = numpy.finfo(numpy.float_).eps ** (1./3)
+      if f_rtol is None:
+         f_rtol = numpy.inf
+      if x_tol is None:
+         x_tol = numpy.inf
+      if x_rtol is None:
+         x_rtol = numpy.inf
 
-   for n in range(maxiter):
+      if line_search not in (None, 'armijo', 'wolfe'):
+         raise ValueError("Invalid line search")
 
-      iteration += 1
-      f_norm = global_inf_norm(Fx)
-      x_norm = global_inf_norm(x)
+      f0_norm = None
 
+      func = lambda z: F(numpy.reshape(z, x0.shape)).flatten()
+      x = x0.flatten()
+      x_start = x.copy()
 
-      dx_norm = global_inf_norm(dx)
+      same_key = jacobian_key is not None and jacobian_key == self.jacobian_key
 
-      residuals.append((f_norm, time() - t_start, 0.0))
+      dx = numpy.full_like(x, numpy.inf)
+      Fx = func(x)
+      Fx_norm = global_norm(Fx)
+
+      # Warm start
+      if self.warm_start and same_key and self.previous_increment is not None \
+            and self.previous_increment.shape == x.shape:
+         x_guess = x + self.previous_increment
+         Fx_guess = func(x_guess)
+         Fx_guess_norm = global_norm(Fx_guess)
+         if Fx_guess_norm < Fx_norm:
+            x, Fx, Fx_norm = x_guess, Fx_guess, Fx_guess_norm
+
+      # Linearization
+      if self.jacobian is None:
+         self.jacobian = KrylovJacobian(x.copy(), Fx, func, fgmres_restart=self.fgmres_restart,
+                                        fgmres_maxiter=self.fgmres_maxiter, fgmres_precond=fgmres_precond)
+         self.num_linearizations += 1
+         self.age = 0
+      elif self.reuses_linearization(jacobian_key):
+         self.age += 1
+      else:
+         self.jacobian.update(x.copy(), Fx, func)
+         self.num_linearizations += 1
+         self.age = 0
+      jacobian = self.jacobian
+      jacobian.fgmres_precond = fgmres_precond
+      self.jacobian_key = jacobian_key
+      num_uses = 0   # Number of Newton iterations done with the current linearization
 
-      if f0_norm is None:
-         f0_norm = f_norm
+      if maxiter is None:
+         maxiter = 100*(x.size+1)
 
-      if f_norm == 0:
-         terminated = True
+      eta = self.eta_initial
 
-      terminated = (f_norm <= f_tol and f_norm / f_rtol <= f0_norm) and (dx_norm <= x_tol and dx_norm / x_rtol <= x_norm)
+      residuals = []
 
-      if terminated:
-         break
+      for n in range(maxiter):
 
-      tol = min(eta, eta*Fx_norm)
-      dx = -jacobian.solve(Fx, tol=tol)
+         iteration += 1
+         f_norm = global_inf_norm(Fx)
+         x_norm = global_inf_norm(x)
 
-      # Line search, or Newton step
-      if line_search:
-         s, x, Fx, Fx_norm_new = _nonlin_line_search(func, x, Fx, dx, line_search)
-      else:
-         s = 1.0
-         x = x + dx
-         Fx = func(x)
-         Fx_norm_new = global_norm(Fx)
 
-      jacobian.update(x.copy(), Fx)
+         dx_norm = global_inf_norm(dx)
 
-      # Adjust forcing parameters for inexact methods
-      eta_A = gamma * Fx_norm_new**2 / Fx_norm**2
-      if gamma * eta**2 < eta_treshold:
-         eta = min(eta_max, eta_A)
-      else:
-         eta = min(eta_max, max(eta_A, gamma*eta**2))
+         residuals.append((f_norm, time() - t_start, 0.0))
 
-      Fx_norm = Fx_norm_new
+         if f0_norm is None:
+            f0_norm = f_norm
 
-      # Print status
-      if verbose:
-         sys.stdout.write(f'{n:3d}:  |F(x)| = {global_inf_norm(Fx):.3e}; step {s}\n')
-         sys.stdout.flush()
-   else:
-      print('The maximum number of iterations allowed by the JFNK method has been reached.')
+         if f_norm == 0:
+            terminated = True
+
+         terminated = (f_norm <= f_tol and f_norm / f_rtol <= f0_norm) and (dx_norm <= x_tol and dx_norm / x_rtol <= x_norm)
+
+         if terminated:
+            break
+
+         tol = min(eta, eta*Fx_norm)
+         dx = -jacobian.solve(Fx, tol=tol)
+         num_uses += 1
+
+         # Line search, or Newton step
+         if line_search:
+            s, x, Fx, Fx_norm_new = _nonlin_line_search(func, x, Fx, dx, line_search)
+         else:
+            s = 1.0
+            x = x + dx
+            Fx = func(x)
+            Fx_norm_new = global_norm(Fx)
+
+         # Update the linearization after jacobian_reuse iterations, or right away if it did not reduce the residual
+         if num_uses >= self.jacobian_reuse or Fx_norm_new >= Fx_norm:
+            jacobian.update(x.copy(), Fx, func)
+            self.num_linearizations += 1
+            self.age = 0
+            num_uses = 0
+
+         # Adjust forcing parameters for inexact methods
+         if self.forcing == 'eisenstat_walker':
+            eta_A = self.gamma * Fx_norm_new**2 / Fx_norm**2
+            if self.gamma * eta**2 < self.eta_treshold:
+               eta = min(self.eta_max, eta_A)
+            else:
+               eta = min(self.eta_max, max(eta_A, self.gamma*eta**2))
+
+         Fx_norm = Fx_norm_new
+
+         # Print status
+         if verbose:
+            sys.stdout.write(f'{n:3d}:  |F(x)| = {global_inf_norm(Fx):.3e}; step {s}\n')
+            sys.stdout.flush()
+      else:
+         print('The maximum number of iterations allowed by the JFNK method has been reached.')
+
+      if terminated == 1:
+         print(f'A solution was found after {iteration-1} steps of the JFNK method.')
 
-   if terminated == 1:
-      print(f'A solution was found after {iteration-1} steps of the JFNK method.')
+      self.previous_increment = x - x_start
 
-   return numpy.reshape(x, x0.shape), iteration - 1, residuals
+      return numpy.reshape(x, x0.shape), iteration - 1, residuals
 
 
 def _nonlin_line_search(func, x, Fx, dx, search_type='armijo', rdiff=1e-8,
@@ -155,6 +259,7 @@ class KrylovJacobian:
       self.fgmres_restart = fgmres_restart
       self.fgmres_maxiter = fgmres_maxiter
       self.fgmres_precond = fgmres_precond
+      self.fgmres = FgmresSolver()
 
       self.x0 = x
       self.f0 = f
@@ -176,11 +281,13 @@ class KrylovJacobian:
       return (self.func(self.x0 + sc*v) - self.f0) / sc
 
    def solve(self, rhs, tol=0):
-      sol, res, norm_b, nb_iter, info, residuals = fgmres(self.op, rhs, tol=tol, restart=self.fgmres_restart, maxiter=self.fgmres_maxiter, preconditioner=self.fgmres_precond)
+      sol, res, norm_b, nb_iter, info, residuals = self.fgmres(self.op, rhs, tol=tol, restart=self.fgmres_restart, maxiter=self.fgmres_maxiter, preconditioner=self.fgmres_precond)
       # print(f'reached residual {res:.3e} after {nb_iter:3d} iterations')
       return sol
 
-   def update(self, x, f):
+   def update(self, x, f, func=None):
+      """Linearize around a new point (and, optionally, for a new function)"""
+      if func is not None: self.func = func
       self.x0 = x
       self.f0 = f
       self._update_diff_step()
@@ -4,7 +4,13 @@ from mpi4py import MPI
 import numpy
 import scipy.linalg
 
-def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_info = True, task1 = False):
+from common.parallel import space_comm
+from common.profiler import profiler
+
+@profiler.profile()
+def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, task1 = False, state = None):
+   """Evaluate a linear combination of the φ functions acting on vectors, like kiops (see there for the arguments,
+   including `state`)."""
 
    ppo, n = u.shape
    p = ppo - 1
@@ -28,16 +34,7 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
    reg_comm_nrm = 0
    numSteps = len(τ_out)
 
-   first_accepted = True
-
-   if not hasattr(pmex, "static_mem") or reuse_info is False:
-      pmex.static_mem = True
-      pmex.suggested_step = τ_end
-      pmex.suggested_m = mmax
-      m_opt  = 1
-   else:
-      m_init = pmex.suggested_m
-      m_opt  = 1
+   m_opt = 1
 
    # We only allow m to vary between mmin and mmax
    mmin = 1
@@ -54,10 +51,13 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
    w = numpy.zeros((numSteps, n))
    w[0, :] = u[0, :].copy()
 
+   # Global operations are over the PEs that share the spatial domain
+   comm = space_comm()
+
    # compute the 1-norm of u
    local_nrmU = numpy.sum(abs(u[1:, :]), axis=1)
    global_normU = numpy.empty_like(local_nrmU)
-   MPI.COMM_WORLD.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
+   comm.Allreduce([local_nrmU, MPI.DOUBLE], [global_normU, MPI.DOUBLE])
    normU = numpy.amax(global_normU)
 
    # Normalization factors
@@ -73,7 +73,9 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
    u_flip = nu * numpy.flipud(u[1:, :])
 
    # Compute and initial starting approximation for the step size
-   τ = min(pmex.suggested_step, τ_end)
+   τ = τ_end
+   if state is not None and state.reuse_step and state.suggested_step is not None:
+      τ = min(τ_end, state.suggested_step * τ_end)
 
    # Setting the safety factors and tolerance requirements
    if τ_end > 1:
@@ -108,7 +110,7 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
          # Normalize initial vector (this norm is nonzero)
          local_sum = V[0, 0:n] @ V[0, 0:n]
          global_sum_nrm = numpy.empty_like(local_sum)
-         MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+         comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
          β = math.sqrt( global_sum_nrm + V[j, n:n+p] @ V[j, n:n+p] )
 
          # The first Krylov basis vector
@@ -127,7 +129,7 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
          #2. compute terms needed for R and T
          local_vec  = V[0:j+1, 0:n] @ V[j-1:j+1, 0:n].T
          global_vec = numpy.empty_like(local_vec)
-         MPI.COMM_WORLD.Allreduce([local_vec, MPI.DOUBLE], [global_vec, MPI.DOUBLE])
+         comm.Allreduce([local_vec, MPI.DOUBLE], [global_vec, MPI.DOUBLE])
          global_vec += V[0:j+1, n:n+p] @ V[j-1:j+1, n:n+p].T
 
          #3. Projection with 2-step Gauss-Seidel to the orthogonal complement
@@ -157,7 +159,7 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
             #use communication to compute norm estimate
             local_sum = V[j, 0:n] @ V[j, 0:n]
             global_sum_nrm = numpy.empty_like(local_sum)
-            MPI.COMM_WORLD.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
+            comm.Allreduce([local_sum, MPI.DOUBLE], [global_sum_nrm, MPI.DOUBLE])
             curr_nrm = math.sqrt( global_sum_nrm + V[j,n:n+p] @ V[j, n:n+p] )
             reg_comm_nrm += 1
          else:
@@ -259,12 +261,8 @@ def pmex(τ_out, A, u, tol = 1e-7, delta = 1.2, m_init = 10, mmax = 128, reuse_i
          reject += ireject
          step   += 1
 
-         """
-         if first_accepted:
-            pmex.suggested_step = min(pmex.suggested_step, τ)
-            pmex.suggested_m    = min(pmex.suggested_m, m_opt)
-            first_accepted = False
-         """
+         if step == 1 and state is not None:
+            state.suggested_step = τ / τ_end
 
          # Udate for τ_out in the interval (τ_now, τ_now + τ)
          blownTs = 0